@@ -23,8 +23,113 @@ class Config:
     # Pasta base para arquivos temporários
     UPLOAD_FOLDER = tempfile.gettempdir()
     
-    # Extensões de arquivo permitidas para upload
-    ALLOWED_EXTENSIONS = {"pdf"}
+    # PDFs enviados de até este tamanho são processados da memória; os maiores
+    # são gravados numa pasta temporária da requisição (apagada ao final)
+    UPLOAD_LIMITE_MEMORIA_BYTES = int(os.getenv("UPLOAD_LIMITE_MEMORIA_BYTES", str(8 * 1024 * 1024)))
+    
+    # Área temporária gerenciada (pastas por requisição): cota em MB e em número
+    # de arquivos, idade a partir da qual as sobras são apagadas e intervalo da
+    # coleta em segundo plano (0 = só coleta quando a cota é atingida)
+    AREA_TEMPORARIA_DIRETORIO = os.getenv(
+        "AREA_TEMPORARIA_DIRETORIO", os.path.join(UPLOAD_FOLDER, "darf_area_temporaria")
+    )
+    AREA_TEMPORARIA_COTA_MB = int(os.getenv("AREA_TEMPORARIA_COTA_MB", "2048"))
+    AREA_TEMPORARIA_COTA_ARQUIVOS = int(os.getenv("AREA_TEMPORARIA_COTA_ARQUIVOS", "10000"))
+    AREA_TEMPORARIA_IDADE_MAXIMA_S = float(os.getenv("AREA_TEMPORARIA_IDADE_MAXIMA_S", "3600"))
+    AREA_TEMPORARIA_INTERVALO_GC_S = float(os.getenv("AREA_TEMPORARIA_INTERVALO_GC_S", "300"))
+    
+    # Upload retomável em partes (/api/envios): tamanho máximo de cada parte
+    # (deve caber em MAX_CONTENT_LENGTH)
+    ENVIO_TAMANHO_MAXIMO_PARTE_MB = int(os.getenv("ENVIO_TAMANHO_MAXIMO_PARTE_MB", "16"))
+    
+    # Armazém de resultados (XLSX/JSON por lote, reaproveitados em envios idênticos
+    # e baixados de novo em /results/<chave>): pasta, tempo sem acesso após o qual
+    # o resultado é apagado, cota em MB e número máximo de resultados
+    ARTEFATOS_DIRETORIO = os.getenv("ARTEFATOS_DIRETORIO", os.path.join(UPLOAD_FOLDER, "darf_artefatos"))
+    ARTEFATOS_IDADE_MAXIMA_S = float(os.getenv("ARTEFATOS_IDADE_MAXIMA_S", "86400"))
+    ARTEFATOS_COTA_MB = int(os.getenv("ARTEFATOS_COTA_MB", "1024"))
+    ARTEFATOS_MAXIMO = int(os.getenv("ARTEFATOS_MAXIMO", "1000"))
+    
+    # Executável: retenção dos resultado_darfs_*.xlsx salvos em Downloads/%APPDATA%
+    # (os mais antigos que a idade ou além da cota/quantidade são apagados)
+    RESULTADOS_IDADE_MAXIMA_DIAS = float(os.getenv("RESULTADOS_IDADE_MAXIMA_DIAS", "30"))
+    RESULTADOS_COTA_MB = int(os.getenv("RESULTADOS_COTA_MB", "500"))
+    RESULTADOS_MAXIMO = int(os.getenv("RESULTADOS_MAXIMO", "100"))
+    
+    # Extensões de arquivo permitidas para upload (.zip: os PDFs dentro dele)
+    ALLOWED_EXTENSIONS = {"pdf", "zip"}
+    
+    # Limites dos arquivos .zip (contra "zip bombs"): PDFs por ZIP, tamanho
+    # descompactado de cada PDF e do total e razão descompactado/compactado
+    ZIP_MAXIMO_MEMBROS = int(os.getenv("ZIP_MAXIMO_MEMBROS", "1000"))
+    ZIP_TAMANHO_MAXIMO_MEMBRO_MB = int(os.getenv("ZIP_TAMANHO_MAXIMO_MEMBRO_MB", "100"))
+    ZIP_TAMANHO_MAXIMO_TOTAL_MB = int(os.getenv("ZIP_TAMANHO_MAXIMO_TOTAL_MB", "2048"))
+    ZIP_TAXA_MAXIMA_COMPRESSAO = int(os.getenv("ZIP_TAXA_MAXIMA_COMPRESSAO", "100"))
+    
+    # Motor de lote: processos para páginas com texto nativo e para páginas com OCR
+    # (0 = processa na própria thread, sem processos auxiliares)
+    LOTE_WORKERS_NATIVOS = int(os.getenv("LOTE_WORKERS_NATIVOS", "2"))
+    LOTE_WORKERS_OCR = int(os.getenv("LOTE_WORKERS_OCR", "1"))
+    
+    # Páginas escaneadas de um mesmo PDF enviadas juntas a um worker de OCR
+    # (dentro do bloco, a renderização da próxima página se sobrepõe ao OCR da atual)
+    LOTE_PAGINAS_POR_TAREFA_OCR = int(os.getenv("LOTE_PAGINAS_POR_TAREFA_OCR", "8"))
+    
+    # Páginas com texto nativo de um mesmo PDF enviadas juntas a um worker (o PDF é
+    # aberto uma vez por bloco, e não por página; importa em PDFs com milhares de páginas)
+    LOTE_PAGINAS_POR_TAREFA_NATIVA = int(os.getenv("LOTE_PAGINAS_POR_TAREFA_NATIVA", "8"))
+    
+    # Página que falhar é tentada mais uma vez, sozinha e com configurações
+    # alternativas (texto nativo → OCR; OCR → sem leitura antecipada e DPI menor)
+    LOTE_REPETIR_PAGINA_COM_ERRO = os.getenv("LOTE_REPETIR_PAGINA_COM_ERRO", "1") == "1"
+    
+    # Orçamentos de tempo do motor de lote (0 = sem limite): por página (o worker
+    # que passar dele é encerrado e substituído) e por lote. Na fração final do
+    # prazo do lote (LOTE_MARGEM_DEGRADACAO), não há novas tentativas e o OCR usa resolução menor
+    LOTE_TEMPO_MAXIMO_PAGINA_S = float(os.getenv("LOTE_TEMPO_MAXIMO_PAGINA_S", "300"))
+    LOTE_TEMPO_MAXIMO_LOTE_S = float(os.getenv("LOTE_TEMPO_MAXIMO_LOTE_S", "0"))
+    LOTE_MARGEM_DEGRADACAO = float(os.getenv("LOTE_MARGEM_DEGRADACAO", "0.2"))
+    
+    # Reciclagem dos processos do motor de lote (0 = sem limite): o pool de uma fila é
+    # substituído quando um de seus processos já processou LOTE_RECICLAR_APOS_PAGINAS
+    # páginas ou passou de LOTE_RECICLAR_RSS_MB de RSS (as tarefas já enviadas terminam)
+    LOTE_RECICLAR_APOS_PAGINAS = int(os.getenv("LOTE_RECICLAR_APOS_PAGINAS", "500"))
+    LOTE_RECICLAR_RSS_MB = int(os.getenv("LOTE_RECICLAR_RSS_MB", "1024"))
+    
+    # Worker do gunicorn com RSS acima deste limite após uma requisição (ou tarefa em
+    # segundo plano) é encerrado de forma graciosa e substituído (0 = sem limite)
+    WORKER_RSS_MAXIMO_MB = int(os.getenv("WORKER_RSS_MAXIMO_MB", "1536"))
+    
+    # Controle de admissão (/upload, /api/extrair e /api/envios): custo de um lote em
+    # páginas de OCR (cada página nativa vale ADMISSAO_PESO_PAGINA_NATIVA). Lotes a
+    # partir de ADMISSAO_CUSTO_PESADO só fazem OCR com uma das ADMISSAO_LOTES_PESADOS
+    # vagas do servidor (0 = sem controle); os demais esperam numa fila de até
+    # ADMISSAO_FILA_MAXIMA lotes, por até ADMISSAO_ESPERA_MAXIMA_S, senão recebem 503.
+    # ADMISSAO_SEGUNDOS_POR_PAGINA_OCR estima o Retry-After
+    ADMISSAO_DIRETORIO = os.getenv("ADMISSAO_DIRETORIO", os.path.join(UPLOAD_FOLDER, "darf_admissao"))
+    ADMISSAO_LOTES_PESADOS = int(os.getenv("ADMISSAO_LOTES_PESADOS", "2"))
+    ADMISSAO_FILA_MAXIMA = int(os.getenv("ADMISSAO_FILA_MAXIMA", "8"))
+    ADMISSAO_ESPERA_MAXIMA_S = float(os.getenv("ADMISSAO_ESPERA_MAXIMA_S", "120"))
+    ADMISSAO_CUSTO_PESADO = float(os.getenv("ADMISSAO_CUSTO_PESADO", "5"))
+    ADMISSAO_PESO_PAGINA_NATIVA = float(os.getenv("ADMISSAO_PESO_PAGINA_NATIVA", "0.05"))
+    ADMISSAO_SEGUNDOS_POR_PAGINA_OCR = float(os.getenv("ADMISSAO_SEGUNDOS_POR_PAGINA_OCR", "2"))
+    
+    # Modo contínuo do processamento de pasta (--vigiar): segundos sem mudança de
+    # tamanho/data para um PDF ser considerado completo, intervalo da varredura
+    # (sem inotify) e intervalo de releitura das regras do banco
+    VIGIA_ESTABILIZACAO_S = float(os.getenv("VIGIA_ESTABILIZACAO_S", "2"))
+    VIGIA_INTERVALO_S = float(os.getenv("VIGIA_INTERVALO_S", "5"))
+    VIGIA_REGRAS_RECARGA_S = float(os.getenv("VIGIA_REGRAS_RECARGA_S", "300"))
+    
+    # Chave da sessão com o usuário autenticado (a mesma de msal_auth.py)
+    SESSION_USER_KEY = "user"
+    
+    # Perfilador por amostragem: PERFILAR=1 perfila todas as requisições; sem ele,
+    # só as de usuários autenticados com o cabeçalho PERFIL_CABECALHO: 1
+    PERFILAR = os.getenv("PERFILAR", "0") == "1"
+    PERFIL_CABECALHO = "X-Perfilar"
+    PERFIL_DIRETORIO = os.getenv("PERFIL_DIRETORIO", os.path.join(tempfile.gettempdir(), "darf_perfis"))
+    PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", "5"))
 
 
 def get_config():
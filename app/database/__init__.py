@@ -16,6 +16,8 @@ from typing import Optional, Dict, List, Tuple
 
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.utils.metricas import registrar_consulta_regra
+
 # Importa db e modelos - deve ser feito dentro de funções que usam contexto Flask
 # para evitar problemas de import circular
 def _get_db():
@@ -175,6 +177,7 @@ def get_aba_por_codigo(codigo: str) -> Optional[str]:
     
     # Flask-SQLAlchemy gerencia a sessão automaticamente
     registro = db.session.query(CodigoAba).filter(CodigoAba.codigo == codigo_str).first()
+    registrar_consulta_regra("codigo", registro is not None)
     return registro.aba if registro else None
 
 
@@ -291,6 +294,7 @@ def get_uo_por_cnpj(cnpj: str) -> Optional[str]:
     _, CnpjUo = _get_models()
     
     registro = db.session.query(CnpjUo).filter(CnpjUo.cnpj == cnpj_formatado).first()
+    registrar_consulta_regra("cnpj", registro is not None)
     return registro.uo_contribuinte if registro else None
 
 
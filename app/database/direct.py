@@ -11,6 +11,7 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from app.database.db_session import get_session
 from app.models_direct import CodigoAba, CnpjUo
+from app.utils.metricas import registrar_consulta_regra
 
 # Valores padrão para códigos → abas
 CODIGOS_PADRAO = [
@@ -133,6 +134,37 @@ def init_db_data():
         session.close()
 
 
+# ======================================================================
+# SNAPSHOT DAS REGRAS (processos de longa duração)
+# ======================================================================
+
+# Regras em memória usadas por get_aba_por_codigo e get_uo_por_cnpj
+# (None = cada consulta vai ao banco)
+_snapshot_regras: Optional[Dict[str, Dict[str, str]]] = None
+
+
+def carregar_snapshot_regras() -> Dict[str, Dict[str, str]]:
+    """
+    Lê todas as regras do banco de uma vez.
+    
+    Returns:
+        {"codigos": {codigo: aba}, "cnpjs": {cnpj formatado: uo_contribuinte}}
+    """
+    return {
+        "codigos": {r["codigo"]: r["aba"] for r in get_todos_codigos()},
+        "cnpjs": {r["cnpj"]: r["uo_contribuinte"] for r in get_todos_cnpjs()},
+    }
+
+
+def definir_snapshot_regras(snapshot: Optional[Dict[str, Dict[str, str]]]):
+    """
+    Passa a responder as consultas de regras a partir do snapshot (ver
+    carregar_snapshot_regras), sem acessar o banco. None volta a consultar o banco.
+    """
+    global _snapshot_regras
+    _snapshot_regras = snapshot
+
+
 # ======================================================================
 # FUNÇÕES PARA CÓDIGOS → ABAS
 # ======================================================================
@@ -151,9 +183,15 @@ def get_aba_por_codigo(codigo: str) -> Optional[str]:
         return None
     
     codigo_str = str(codigo).strip()
+    if _snapshot_regras is not None:
+        aba = _snapshot_regras["codigos"].get(codigo_str)
+        registrar_consulta_regra("codigo", aba is not None)
+        return aba
+    
     session = get_session()
     try:
         registro = session.query(CodigoAba).filter(CodigoAba.codigo == codigo_str).first()
+        registrar_consulta_regra("codigo", registro is not None)
         return registro.aba if registro else None
     finally:
         session.close()
@@ -269,9 +307,15 @@ def get_uo_por_cnpj(cnpj: str) -> Optional[str]:
     if not cnpj_formatado:
         return None
     
+    if _snapshot_regras is not None:
+        uo = _snapshot_regras["cnpjs"].get(cnpj_formatado)
+        registrar_consulta_regra("cnpj", uo is not None)
+        return uo
+    
     session = get_session()
     try:
         registro = session.query(CnpjUo).filter(CnpjUo.cnpj == cnpj_formatado).first()
+        registrar_consulta_regra("cnpj", registro is not None)
         return registro.uo_contribuinte if registro else None
     finally:
         session.close()
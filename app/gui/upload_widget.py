@@ -137,10 +137,10 @@ class UploadWidget(QWidget):
     def dragEnterEvent(self, event: QDragEnterEvent):
         """Evento quando arquivo é arrastado sobre o widget."""
         if event.mimeData().hasUrls():
-            # Verifica se há pelo menos um arquivo PDF
+            # Verifica se há pelo menos um arquivo PDF (ou ZIP com PDFs)
             urls = event.mimeData().urls()
             for url in urls:
-                if url.toLocalFile().lower().endswith('.pdf'):
+                if url.toLocalFile().lower().endswith(('.pdf', '.zip')):
                     event.acceptProposedAction()
                     self.drop_area.setStyleSheet(
                         """
@@ -196,7 +196,7 @@ class UploadWidget(QWidget):
             files = []
             for url in event.mimeData().urls():
                 file_path = Path(url.toLocalFile())
-                if file_path.is_file() and file_path.suffix.lower() == '.pdf':
+                if file_path.is_file() and file_path.suffix.lower() in ('.pdf', '.zip'):
                     files.append(file_path)
             
             if files:
@@ -206,7 +206,7 @@ class UploadWidget(QWidget):
                 QMessageBox.warning(
                     self,
                     "Arquivos inválidos",
-                    "Por favor, arraste apenas arquivos PDF."
+                    "Por favor, arraste apenas arquivos PDF ou ZIP."
                 )
     
     def _select_files(self):
@@ -215,11 +215,11 @@ class UploadWidget(QWidget):
             self,
             "Selecionar arquivos PDF",
             "",
-            "Arquivos PDF (*.pdf)"
+            "Arquivos PDF ou ZIP (*.pdf *.zip)"
         )
         
         if files:
-            pdf_files = [Path(f) for f in files if Path(f).suffix.lower() == '.pdf']
+            pdf_files = [Path(f) for f in files if Path(f).suffix.lower() in ('.pdf', '.zip')]
             if pdf_files:
                 self._add_files(pdf_files)
     
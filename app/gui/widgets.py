@@ -6,14 +6,12 @@ from PyQt6.QtCore import QThread, pyqtSignal
 from pathlib import Path
 from typing import List
 
-from app.services.pdf_parser import processar_pdf
-from app.services.excel_generator import (
-    formatar_linha_servidor,
-    formatar_linha_patronal_gilrat,
-    gerar_excel,
-)
-from app.utils.errors import coletar_erros_registro
-from app.database.direct import get_aba_por_codigo
+from app.services.batch_engine import processar_lote
+from app.services.diario import DiarioLote, caminho_diario
+from app.services.zip_pdfs import expandir_zips
+from app.services.pdf_parser import PAGINA_VAZIA
+from app.services.excel_generator import gerar_excel, separar_registros
+from app.utils.tempos import registros_com_tempos
 
 
 class ProcessPdfWorker(QThread):
@@ -41,44 +39,41 @@ class ProcessPdfWorker(QThread):
     def run(self):
         """Executa o processamento dos PDFs."""
         try:
-            registros = []
+            self.progress.emit(f"Processando {len(self.pdf_files)} arquivo(s)...")
             
-            # Processa cada PDF
-            for idx, pdf_path in enumerate(self.pdf_files):
-                if self._cancelled:
-                    self.error.emit("Processamento cancelado pelo usuário.")
-                    return
-                
-                self.progress.emit(f"Processando {pdf_path.name} ({idx + 1}/{len(self.pdf_files)})...")
-                
-                try:
-                    # processar_pdf retorna uma lista de resultados (um por página)
-                    resultados_paginas = processar_pdf(pdf_path)
-                    registros.extend(resultados_paginas)
-                except Exception as e:
-                    # Caso o PDF dê erro, registramos uma linha com os campos em None
-                    filename = pdf_path.name
-                    registros.append({
-                        "arquivo": f"{filename} - Página 1",
-                        "cnpj": None,
-                        "cnpj_erro": f"Erro ao processar PDF: {str(e)}",
-                        "razao_social": None,
-                        "razao_social_erro": f"Erro ao processar PDF: {str(e)}",
-                        "periodo_apuracao": None,
-                        "periodo_apuracao_erro": f"Erro ao processar PDF: {str(e)}",
-                        "data_vencimento": None,
-                        "data_vencimento_erro": f"Erro ao processar PDF: {str(e)}",
-                        "numero_documento": None,
-                        "numero_documento_erro": f"Erro ao processar PDF: {str(e)}",
-                        "valor_total_documento": None,
-                        "valor_total_documento_erro": f"Erro ao processar PDF: {str(e)}",
-                        "codigo": None,
-                        "codigo_erro": f"Erro ao processar PDF: {str(e)}",
-                        "denominacao": None,
-                        "denominacao_erro": f"Erro ao processar PDF: {str(e)}",
-                        "linha_digitavel": None,
-                        "linha_digitavel_erro": f"Erro ao processar PDF: {str(e)}",
-                    })
+            # Progresso por página: páginas com texto nativo chegam antes das com OCR
+            paginas = {"total": 0, "concluidas": 0}
+            
+            def ao_classificar(pdf_path, classificacao):
+                paginas["total"] += sum(1 for info in classificacao if info["tipo"] != PAGINA_VAZIA)
+            
+            def ao_concluir(registro):
+                paginas["concluidas"] += 1
+                self.progress.emit(
+                    f"Páginas processadas: {paginas['concluidas']}/{paginas['total']} "
+                    f"({registro.get('arquivo', '')})"
+                )
+            
+            # Diário das páginas concluídas ao lado do Excel: se o programa for
+            # fechado no meio do lote, processar os mesmos PDFs de novo retoma dele
+            diario = DiarioLote(caminho_diario(self.output_path))
+            retomadas = diario.abrir()
+            if retomadas:
+                self.progress.emit(f"Retomando processamento anterior: {retomadas} página(s) já concluída(s)")
+            
+            # processar_lote retorna os registros de todos os PDFs (um por página),
+            # na ordem dos arquivos e das páginas; os .zip são trocados pelos PDFs
+            # que contêm, lidos direto do ZIP conforme o lote avança
+            try:
+                registros = processar_lote(
+                    expandir_zips(self.pdf_files),
+                    ao_concluir=ao_concluir,
+                    ao_classificar=ao_classificar,
+                    deve_cancelar=lambda: self._cancelled,
+                    diario=diario,
+                )
+            finally:
+                diario.fechar()
             
             if self._cancelled:
                 self.error.emit("Processamento cancelado pelo usuário.")
@@ -90,25 +85,7 @@ class ProcessPdfWorker(QThread):
             
             # Separa registros por aba baseado no código e coleta erros
             self.progress.emit("Organizando resultados...")
-            registros_servidor = []
-            registros_patronal = []
-            todos_erros = []
-            
-            for registro in registros:
-                # Coleta erros do registro
-                erros_registro = coletar_erros_registro(registro)
-                todos_erros.extend(erros_registro)
-                
-                # Separa por aba
-                codigo = registro.get("codigo", "")
-                aba = get_aba_por_codigo(codigo)
-                
-                if aba == "servidor":
-                    linha_formatada = formatar_linha_servidor(registro)
-                    registros_servidor.append(linha_formatada)
-                elif aba == "patronal-gilrat":
-                    linha_formatada = formatar_linha_patronal_gilrat(registro)
-                    registros_patronal.append(linha_formatada)
+            registros_servidor, registros_patronal, todos_erros = separar_registros(registros)
             
             if self._cancelled:
                 self.error.emit("Processamento cancelado pelo usuário.")
@@ -116,7 +93,11 @@ class ProcessPdfWorker(QThread):
             
             # Gera o Excel
             self.progress.emit("Gerando arquivo Excel...")
-            gerar_excel(registros_servidor, registros_patronal, todos_erros, self.output_path)
+            gerar_excel(
+                registros_servidor, registros_patronal, todos_erros, self.output_path,
+                registros_com_tempos(registros),
+            )
+            diario.remover()
             
             self.finished.emit(
                 str(self.output_path),
@@ -1,10 +1,31 @@
 """
-Rotas API para gerenciamento de regras.
+Rotas API para gerenciamento de regras e extração.
 
-Contém as rotas REST para gerenciar códigos → abas e CNPJs → UO Contribuinte.
+Contém as rotas REST para gerenciar códigos → abas e CNPJs → UO Contribuinte,
+a rota de extração em JSON com seleção de campos e o upload retomável em
+partes (/api/envios) para lotes grandes.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, send_file, url_for
+
+from app.services.admissao import LoteRecusado, obter_controle_admissao
+from app.services.artefatos import (
+    FORMATOS,
+    RESULTADO_CABECALHO,
+    chave_artefato,
+    hash_entrada,
+    obter_armazem_artefatos,
+)
+from app.services.batch_engine import processar_lote
+from app.services.envio_partes import CONCLUIDO, ErroEnvio, SessaoEnvio
+from app.services.pdf_parser import normalizar_campos
+from app.services.zip_pdfs import ZipInvalido, expandir_zips
+from app.utils.validators import allowed_file
+from app.utils.uploads import ler_upload
+from app.utils.perfilador import perfilavel
+from app.utils.rastreamento import rastreado
+from app.utils.area_temporaria import CotaExcedida, obter_area_temporaria
+from app.config import Config
 
 from app.database import (
     get_todos_codigos,
@@ -138,3 +159,181 @@ def remover_cnpj_route(cnpj):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+
+@bp.route("/extrair", methods=["POST"])
+@rastreado("requisicao")
+@perfilavel
+def extrair_route():
+    """
+    Extrai campos de um ou mais PDFs e retorna os registros em JSON.
+    
+    Apenas os extratores necessários para os campos solicitados são executados.
+    Os mesmos arquivos e campos já extraídos recebem a resposta guardada no
+    armazém de resultados, sem reprocessar (cabeçalho X-Resultado: endereço
+    para baixá-la de novo).
+    
+    Form data:
+        files: Um ou mais arquivos PDF (ou .zip com PDFs)
+        campos: Campos a extrair (repetido ou separado por vírgulas; padrão: todos)
+    
+    Returns:
+        JSON com "campos" (na ordem das colunas) e "registros" (um por página);
+        503 com Retry-After se o servidor estiver saturado de lotes com OCR
+    """
+    try:
+        campos_solicitados = []
+        for valor in request.form.getlist("campos"):
+            campos_solicitados.extend(valor.split(","))
+        try:
+            campos = normalizar_campos(campos_solicitados)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        files = [
+            f for f in request.files.getlist("files")
+            if f and f.filename and allowed_file(f.filename)
+        ]
+        if not files:
+            return jsonify({"error": "Nenhum arquivo PDF ou ZIP válido enviado"}), 400
+        
+        with obter_area_temporaria().diretorio("extrair") as temp_dir:
+            pdfs = [ler_upload(file, idx, temp_dir) for idx, file in enumerate(files)]
+            chave = chave_artefato("json", [(pdf.name, hash_entrada(pdf)) for pdf in pdfs], campos)
+            
+            def gerar(destino):
+                # Os .zip são trocados pelos PDFs que contêm, lidos conforme o lote avança
+                arquivos_com_erro = []
+                with obter_controle_admissao().lote() as admissao:
+                    registros = processar_lote(
+                        expandir_zips(pdfs, temp_dir), campos, admissao=admissao,
+                        ao_finalizar_arquivo=lambda pdf, regs, erro: erro and arquivos_com_erro.append(pdf),
+                    )
+                destino.write_text(
+                    current_app.json.dumps({"campos": list(campos), "registros": [dict(r) for r in registros]}),
+                    encoding="utf-8",
+                )
+                # Lote com falhas: guardado com chave avulsa, não reaproveitado
+                return not arquivos_com_erro
+            
+            caminho, _ = obter_armazem_artefatos().obter(chave, "json", gerar)
+        
+        resposta = send_file(str(caminho), mimetype=FORMATOS["json"][0])
+        resposta.headers[RESULTADO_CABECALHO] = url_for("main.resultado", chave=caminho.stem)
+        return resposta
+    except ZipInvalido as e:
+        return jsonify({"error": str(e)}), 400
+    except LoteRecusado as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.tentar_apos_s)}
+    except CotaExcedida as e:
+        return jsonify({"error": str(e)}), 507
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/envios", methods=["POST"])
+def criar_envio_route():
+    """
+    Cria uma sessão de upload em partes (lotes maiores que o limite de uma requisição).
+    
+    Body JSON:
+        {
+            "arquivos": [{"nome": "a.pdf", "tamanho": 123456}, ...]
+        }
+    
+    Returns:
+        JSON com o "id" da sessão, o tamanho máximo de cada parte e os arquivos
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        sessao = SessaoEnvio.criar(data.get("arquivos") or [])
+        return jsonify({
+            "tamanho_maximo_parte": Config.ENVIO_TAMANHO_MAXIMO_PARTE_MB * 1024 * 1024,
+            **sessao.resumo(),
+        }), 201
+    except (ErroEnvio, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except CotaExcedida as e:
+        return jsonify({"error": str(e)}), 507
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/envios/<id_sessao>", methods=["GET"])
+def estado_envio_route(id_sessao):
+    """
+    Faixas recebidas de cada arquivo e estado do processamento da sessão.
+    
+    Para retomar um upload interrompido, envie apenas as faixas que faltam.
+    """
+    sessao = SessaoEnvio.carregar(id_sessao)
+    if sessao is None:
+        return jsonify({"error": "Sessão não encontrada"}), 404
+    return jsonify(sessao.resumo())
+
+
+@bp.route("/envios/<id_sessao>/arquivos/<int:indice>", methods=["PUT"])
+def enviar_parte_route(id_sessao, indice):
+    """
+    Recebe uma parte de um arquivo da sessão.
+    
+    Query string:
+        offset: Posição da parte no arquivo, em bytes
+    
+    Body:
+        Bytes da parte (Content-Length obrigatório)
+    
+    Returns:
+        JSON com as faixas já recebidas do arquivo
+    """
+    sessao = SessaoEnvio.carregar(id_sessao)
+    if sessao is None:
+        return jsonify({"error": "Sessão não encontrada"}), 404
+    offset = request.args.get("offset", type=int)
+    if offset is None or request.content_length is None:
+        return jsonify({"error": "offset e Content-Length são obrigatórios"}), 400
+    try:
+        return jsonify(sessao.receber_parte(indice, offset, request.stream, request.content_length))
+    except ErroEnvio as e:
+        return jsonify({"error": str(e)}), 400
+    except CotaExcedida as e:
+        return jsonify({"error": str(e)}), 507
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/envios/<id_sessao>/finalizar", methods=["POST"])
+def finalizar_envio_route(id_sessao):
+    """
+    Monta os arquivos da sessão e inicia o processamento em segundo plano.
+    
+    Acompanhe pelo GET da sessão; com "status" "concluido", baixe o resultado.
+    """
+    sessao = SessaoEnvio.carregar(id_sessao)
+    if sessao is None:
+        return jsonify({"error": "Sessão não encontrada"}), 404
+    try:
+        sessao.finalizar()
+        return jsonify(sessao.resumo()), 202
+    except ErroEnvio as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/envios/<id_sessao>/resultado", methods=["GET"])
+def resultado_envio_route(id_sessao):
+    """Baixa o XLSX da sessão (404 enquanto o processamento não termina ou se expirou)."""
+    sessao = SessaoEnvio.carregar(id_sessao)
+    if sessao is None:
+        return jsonify({"error": "Sessão não encontrada"}), 404
+    estado = sessao.estado()
+    if estado["status"] != CONCLUIDO:
+        return jsonify({"error": "Resultado ainda não disponível", **estado}), 404
+    caminho = obter_armazem_artefatos().buscar(estado["chave"])
+    if caminho is None:
+        return jsonify({"error": "Resultado expirado; envie os arquivos novamente"}), 404
+    mimetype, download_name = FORMATOS["xlsx"]
+    resposta = send_file(str(caminho), mimetype=mimetype, as_attachment=True, download_name=download_name)
+    resposta.headers[RESULTADO_CABECALHO] = url_for("main.resultado", chave=estado["chave"])
+    return resposta
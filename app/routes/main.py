@@ -4,26 +4,52 @@ Rotas principais da aplicação.
 Contém as rotas para a página inicial e upload de arquivos.
 """
 
-import tempfile
 import sys
 import os
+import shutil
 from pathlib import Path
 from datetime import datetime
-from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for
-from werkzeug.utils import secure_filename
-
-from app.services.pdf_parser import processar_pdf
-from app.utils.validators import allowed_file
-from app.utils.errors import coletar_erros_registro
-from app.services.excel_generator import (
-    formatar_linha_servidor,
-    formatar_linha_patronal_gilrat,
-    gerar_excel,
+from flask import Blueprint, Response, render_template, request, send_file, flash, redirect, session, url_for
+
+from app.services.admissao import LoteRecusado, obter_controle_admissao
+from app.services.artefatos import (
+    FORMATOS,
+    RESULTADO_CABECALHO,
+    chave_artefato,
+    obter_armazem_artefatos,
+    versao_regras,
 )
-from app.database import get_aba_por_codigo
+from app.services.batch_engine import processar_lote
+from app.services.zip_pdfs import ZipInvalido
+from app.utils.tempos import registros_com_tempos
+from app.utils.metricas import gerar_metricas, medir_geracao_excel, registrar_artefato
+from app.utils.perfilador import perfilavel
+from app.utils.rastreamento import rastreado, span
+from app.utils.area_temporaria import coletar_resultados, obter_area_temporaria
+from app.utils.uploads import UploadsEmFluxo
+from app.services.excel_generator import gerar_excel, separar_registros
 
 bp = Blueprint("main", __name__)
 
+# Chave da sessão com o último resultado gerado para o usuário (link na página inicial)
+SESSAO_ULTIMO_RESULTADO = "ultimo_resultado"
+
+
+class _LoteJaProcessado(Exception):
+    """O lote recebido já tem resultado guardado (ou um envio idêntico o está processando)."""
+
+
+def _enviar_artefato(caminho: Path, chave: str):
+    mimetype, download_name = FORMATOS[caminho.suffix[1:]]
+    resposta = send_file(
+        str(caminho),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+    )
+    resposta.headers[RESULTADO_CABECALHO] = url_for("main.resultado", chave=chave)
+    return resposta
+
 
 @bp.route("/")
 def index():
@@ -31,97 +57,139 @@ def index():
     Página inicial com o formulário de upload de PDFs.
 
     - Exibe o template `index.html`
+    - Mostra o link do último resultado do usuário, se ainda estiver guardado
+    """
+    chave = session.get(SESSAO_ULTIMO_RESULTADO)
+    ultimo_resultado = None
+    if chave and obter_armazem_artefatos().buscar(chave, renovar=False) is not None:
+        ultimo_resultado = url_for("main.resultado", chave=chave)
+    return render_template("index.html", ultimo_resultado=ultimo_resultado)
+
+
+@bp.route("/results/<chave>")
+def resultado(chave):
+    """
+    Baixa de novo um resultado guardado no armazém (sem reprocessar).
+
+    - Responde 404 se a chave não existir ou o resultado tiver expirado
+    """
+    caminho = obter_armazem_artefatos().buscar(chave)
+    if caminho is None:
+        return Response("Resultado não encontrado (inexistente ou expirado).\n", status=404, mimetype="text/plain")
+    registrar_artefato("reaproveitado")
+    return _enviar_artefato(caminho, chave)
+
+
+@bp.route("/metrics")
+def metrics():
+    """
+    Métricas no formato de texto do Prometheus, somadas entre os processos.
+
+    - Responde 503 se o prometheus_client não estiver instalado
     """
-    return render_template("index.html")
+    metricas = gerar_metricas()
+    if metricas is None:
+        return Response("prometheus_client não instalado.\n", status=503, mimetype="text/plain")
+    conteudo, content_type = metricas
+    return Response(conteudo, content_type=content_type)
 
 
 @bp.route("/upload", methods=["POST"])
+@rastreado("requisicao")
+@perfilavel
 def upload_files():
     """
     Trata o upload de múltiplos arquivos PDF e gera um XLSX consolidado.
 
     Fluxo:
-    1. Lê os arquivos enviados via formulário (campo "files").
+    1. Lê o corpo multipart aos poucos (campo "files"), sem esperar o upload inteiro.
     2. Filtra apenas arquivos com extensão .pdf.
-    3. Salva cada PDF em uma pasta temporária.
-    4. Para cada PDF, chama `processar_pdf` (de parse_darf.py).
-       - Processa todas as páginas do PDF.
+    3. Mantém cada PDF em memória (os maiores que UPLOAD_LIMITE_MEMORIA_BYTES
+       vão para uma pasta da área temporária, apagada ao fim da requisição).
+    4. Processa os PDFs com `processar_lote` (motor de lote), cada um assim
+       que termina de chegar (a transferência dos seguintes continua em paralelo).
+       - Processa todas as páginas do PDF (páginas em branco são ignoradas).
+       - Páginas com texto nativo não esperam pelas páginas com OCR.
        - Cada página gera uma linha separada no Excel.
        - O nome do arquivo na coluna "arquivo" inclui o número da página
          (ex: "arquivo.pdf - Página 1", "arquivo.pdf - Página 2").
        - Se houver erro específico no PDF, registra um dicionário com erros.
     5. Gera um pandas.DataFrame com todos os resultados (todas as páginas).
-    6. Salva um arquivo `resultado_darfs.xlsx` em disco (pasta temporária).
+    6. Gera o `resultado_darfs.xlsx` no armazém de resultados (no executável,
+       também salva uma cópia em Downloads e apaga as antigas conforme RESULTADOS_*).
     7. Retorna o arquivo para download via `send_file`.
+
+    Lotes com muitas páginas escaneadas passam pelo controle de admissão (ver
+    app.services.admissao): com o servidor saturado, responde 503 com Retry-After.
+
+    O mesmo lote já processado, com as mesmas regras, não é reprocessado: ao
+    fim do upload, o processamento é interrompido e o resultado guardado é
+    enviado (ou, se um envio idêntico estiver em andamento, o dele, ao terminar).
     """
 
-    # Verifica se o formulário realmente trouxe o campo "files"
-    if "files" not in request.files:
+    # O formulário precisa ser multipart (os arquivos são lidos do corpo em fluxo)
+    if request.mimetype != "multipart/form-data":
         flash("Nenhum arquivo selecionado.", "error")
         return redirect(url_for("main.index"))
 
-    files = request.files.getlist("files")
+    armazem = obter_armazem_artefatos()
+    # Chave do lote (definida quando o upload termina) e se este envio a processa
+    lote = {"chave": None, "travado": False}
+    # PDFs com falha no processamento (o resultado não é reaproveitado, ver artefatos)
+    arquivos_com_erro = []
 
-    # Filtra apenas arquivos que tenham nome e extensão permitida
-    pdf_files = []
-    for file in files:
-        if file and file.filename and allowed_file(file.filename):
-            pdf_files.append(file)
+    try:
+        # Lidas na thread da requisição (o lote consome os uploads em outra thread)
+        regras = versao_regras()
 
-    if not pdf_files:
-        flash(
-            "Nenhum arquivo PDF válido encontrado. "
-            "Por favor, selecione arquivos com extensão .pdf.",
-            "error",
-        )
-        return redirect(url_for("main.index"))
+        def pdfs_recebidos():
+            yield from uploads
+            if not uploads.entradas:
+                return
+            # Upload completo: lote já processado (ou em processamento por um
+            # envio idêntico) interrompe o processamento deste
+            lote["chave"] = chave_artefato("xlsx", uploads.entradas, regras=regras)
+            if armazem.buscar(lote["chave"]) is not None or not armazem.travar(lote["chave"]):
+                raise _LoteJaProcessado()
+            lote["travado"] = True
 
-    # Cria uma pasta temporária exclusiva para esta requisição
-    temp_dir = Path(tempfile.mkdtemp())
-    registros = []
+        # Pasta exclusiva desta requisição na área temporária, só para PDFs grandes
+        with obter_area_temporaria().diretorio("upload") as temp_dir:
+            uploads = UploadsEmFluxo(request, temp_dir)
 
-    try:
-        # Percorre cada arquivo enviado
-        for file in pdf_files:
-            # Trata o nome do arquivo para evitar problemas de segurança
-            filename = secure_filename(file.filename)
-            file_path = temp_dir / filename
+            # Processa todos os PDFs no motor de lote: páginas com texto nativo e
+            # páginas escaneadas (OCR) seguem em filas separadas. Cada página gera
+            # um registro; PDFs com erro geram um registro com mensagens de erro.
+            try:
+                with obter_controle_admissao().lote() as admissao:
+                    registros = processar_lote(
+                        pdfs_recebidos(), admissao=admissao,
+                        ao_finalizar_arquivo=lambda pdf, regs, erro: erro and arquivos_com_erro.append(pdf),
+                    )
+            except _LoteJaProcessado:
+                registros = None
 
-            # Salva o conteúdo do upload em disco
-            file.save(str(file_path))
+        # Verifica se o formulário realmente trouxe arquivos PDF no campo "files"
+        if not uploads.arquivos:
+            flash("Nenhum arquivo selecionado.", "error")
+            return redirect(url_for("main.index"))
+        if not uploads.pdfs:
+            flash(
+                "Nenhum arquivo PDF válido encontrado. "
+                "Por favor, selecione arquivos com extensão .pdf.",
+                "error",
+            )
+            return redirect(url_for("main.index"))
 
-            # Tenta processar o PDF com a lógica de parse_darf.py
-            try:
-                # processar_pdf agora retorna uma lista de resultados (um por página)
-                resultados_paginas = processar_pdf(file_path)
-                registros.extend(resultados_paginas)
-            except Exception as e:
-                # Caso o PDF dê erro, registramos uma linha com os campos em None
-                # e mensagens de erro para cada campo (pelo menos uma página)
-                msg = f"Erro ao processar PDF: {str(e)}"
-                registros.append(
-                    {
-                        "arquivo": f"{filename} - Página 1",
-                        "cnpj": None,
-                        "cnpj_erro": msg,
-                        "razao_social": None,
-                        "razao_social_erro": msg,
-                        "periodo_apuracao": None,
-                        "periodo_apuracao_erro": msg,
-                        "data_vencimento": None,
-                        "data_vencimento_erro": msg,
-                        "numero_documento": None,
-                        "numero_documento_erro": msg,
-                        "valor_total_documento": None,
-                        "valor_total_documento_erro": msg,
-                        "codigo": None,
-                        "codigo_erro": msg,
-                        "denominacao": None,
-                        "denominacao_erro": msg,
-                        "linha_digitavel": None,
-                        "linha_digitavel_erro": msg,
-                    }
-                )
+        chave = lote["chave"]
+        if registros is None:
+            # Resultado guardado (ou do envio idêntico, ao terminar)
+            caminho = armazem.aguardar(chave)
+            if caminho is None:
+                flash("O processamento de um envio idêntico teve falhas. Envie os arquivos novamente.", "error")
+                return redirect(url_for("main.index"))
+            registrar_artefato("reaproveitado")
+            return _entregar_resultado(caminho, chave)
 
         # Se por alguma razão não houver nenhum registro, avisamos o usuário
         if not registros:
@@ -129,86 +197,89 @@ def upload_files():
             return redirect(url_for("main.index"))
 
         # Separa registros por aba baseado no código e coleta erros
-        registros_servidor = []
-        registros_patronal = []
-        todos_erros = []
-        
-        for registro in registros:
-            # Coleta erros do registro
-            erros_registro = coletar_erros_registro(registro)
-            todos_erros.extend(erros_registro)
-            
-            # Separa por aba
-            codigo = registro.get("codigo", "")
-            aba = get_aba_por_codigo(codigo)
-            
-            if aba == "servidor":
-                linha_formatada = formatar_linha_servidor(registro)
-                registros_servidor.append(linha_formatada)
-            elif aba == "patronal-gilrat":
-                linha_formatada = formatar_linha_patronal_gilrat(registro)
-                registros_patronal.append(linha_formatada)
-            # Se aba for None, o registro não será incluído em nenhuma aba
-
-        # Detecta se está rodando como executável
-        is_frozen = getattr(sys, 'frozen', False)
-        
-        if is_frozen:
-            # Executável: salva em pasta acessível do usuário
-            # Tenta salvar na pasta Downloads primeiro
-            downloads_dir = Path(os.path.expanduser("~")) / "Downloads"
-            if not downloads_dir.exists():
-                # Fallback para APPDATA se Downloads não existir
-                appdata_dir = Path(os.getenv('APPDATA', '')) / 'ExtratorDARF'
-                appdata_dir.mkdir(exist_ok=True)
-                output_dir = appdata_dir
-            else:
-                output_dir = downloads_dir
-            
-            # Adiciona timestamp ao nome do arquivo para evitar sobrescrever
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"resultado_darfs_{timestamp}.xlsx"
-            output_path = output_dir / filename
-            
-            # Gera o Excel no local acessível
-            gerar_excel(registros_servidor, registros_patronal, todos_erros, output_path)
-            
-            # Informa o usuário onde o arquivo foi salvo
-            flash(
-                f"Arquivo salvo em: {output_path}",
-                "success"
-            )
-            
-            # Ainda envia para download (caso o PyWebView suporte)
-            return send_file(
-                str(output_path),
-                mimetype=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-                as_attachment=True,
-                download_name=filename,
-            )
-        else:
-            # Desenvolvimento: usa pasta temporária como antes
-            output_path = temp_dir / "resultado_darfs.xlsx"
-            
-            # Gera o Excel
-            gerar_excel(registros_servidor, registros_patronal, todos_erros, output_path)
-            
-            # Envia o arquivo para download
-            return send_file(
-                str(output_path),
-                mimetype=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-                as_attachment=True,
-                download_name="resultado_darfs.xlsx",
-            )
+        with span("roteamento_regras", registros=len(registros)):
+            registros_servidor, registros_patronal, todos_erros = separar_registros(registros)
+
+        def gerar(destino):
+            with medir_geracao_excel():
+                gerar_excel(
+                    registros_servidor, registros_patronal, todos_erros, destino,
+                    registros_com_tempos(registros),
+                )
+            return not arquivos_com_erro
+
+        # Gera o Excel no armazém de resultados (com chave avulsa se algum PDF falhou)
+        caminho = armazem.publicar(chave, "xlsx", gerar)
+        return _entregar_resultado(caminho, caminho.stem)
+
+    except ZipInvalido as e:
+        flash(f"Arquivo ZIP recusado: {e}", "error")
+        return redirect(url_for("main.index"))
+
+    except LoteRecusado as e:
+        # Servidor saturado: a página recarregada mostra a mensagem
+        flash(f"{e} (cerca de {e.tentar_apos_s} s).", "error")
+        return Response(
+            f"{e}\n", status=503, mimetype="text/plain",
+            headers={"Retry-After": str(e.tentar_apos_s)},
+        )
 
     except Exception as e:
         # Captura qualquer erro inesperado no fluxo geral
         flash(f"Ocorreu um erro inesperado: {str(e)}", "error")
         return redirect(url_for("main.index"))
 
+    finally:
+        if lote["travado"]:
+            armazem.liberar(lote["chave"])
+
+
+def _entregar_resultado(caminho: Path, chave: str):
+    """
+    Envia o XLSX do armazém e guarda a chave na sessão (link na página inicial).
+
+    No executável, salva também uma cópia em Downloads (ou %APPDATA%).
+    """
+    session[SESSAO_ULTIMO_RESULTADO] = chave
+
+    # Detecta se está rodando como executável
+    is_frozen = getattr(sys, 'frozen', False)
+    if not is_frozen:
+        return _enviar_artefato(caminho, chave)
+
+    # Executável: salva em pasta acessível do usuário
+    # Tenta salvar na pasta Downloads primeiro
+    downloads_dir = Path(os.path.expanduser("~")) / "Downloads"
+    if not downloads_dir.exists():
+        # Fallback para APPDATA se Downloads não existir
+        appdata_dir = Path(os.getenv('APPDATA', '')) / 'ExtratorDARF'
+        appdata_dir.mkdir(exist_ok=True)
+        output_dir = appdata_dir
+    else:
+        output_dir = downloads_dir
+
+    # Adiciona timestamp ao nome do arquivo para evitar sobrescrever
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"resultado_darfs_{timestamp}.xlsx"
+    output_path = output_dir / filename
+    shutil.copyfile(caminho, output_path)
+
+    # Apaga os resultados antigos (RESULTADOS_*) para a pasta não crescer sem limite
+    coletar_resultados(output_dir, output_path)
+
+    # Informa o usuário onde o arquivo foi salvo
+    flash(
+        f"Arquivo salvo em: {output_path}",
+        "success"
+    )
+
+    # Ainda envia para download (caso o PyWebView suporte)
+    return send_file(
+        str(output_path),
+        mimetype=(
+            "application/vnd.openxmlformats-officedocument."
+            "spreadsheetml.sheet"
+        ),
+        as_attachment=True,
+        download_name=filename,
+    )
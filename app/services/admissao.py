@@ -0,0 +1,240 @@
+"""
+Controle de admissão dos lotes pesados (OCR) no servidor.
+
+O custo de um lote é estimado em páginas de OCR: cada página escaneada vale 1
+e cada página com texto nativo vale ADMISSAO_PESO_PAGINA_NATIVA. O motor de
+lote soma o custo conforme classifica os PDFs. Enquanto o custo fica abaixo de
+ADMISSAO_CUSTO_PESADO, o lote segue sem espera (via rápida, ex: lotes de texto
+nativo). A partir dele, o OCR do lote só começa quando houver uma das
+ADMISSAO_LOTES_PESADOS vagas do servidor; as páginas nativas continuam
+enquanto isso.
+
+As vagas valem para todos os workers do gunicorn do servidor: cada lote
+pesado é um arquivo em ADMISSAO_DIRETORIO (`fila/` enquanto espera, `vagas/`
+quando admitido), com o pid do processo (sobras de processos encerrados são
+descartadas). A fila é atendida por ordem de chegada e tem até
+ADMISSAO_FILA_MAXIMA lotes; com a fila cheia, ou após ADMISSAO_ESPERA_MAXIMA_S
+na fila, o lote é recusado com `LoteRecusado` (as rotas respondem 503 com
+Retry-After).
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from app.config import Config
+from app.utils.area_temporaria import processo_vivo
+from app.utils.metricas import registrar_admissao
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (executável): um único processo, a trava entre threads basta
+    fcntl = None
+
+
+class LoteRecusado(RuntimeError):
+    """Servidor saturado: fila de lotes pesados cheia ou espera esgotada."""
+
+    def __init__(self, mensagem: str, tentar_apos_s: int):
+        super().__init__(mensagem)
+        # Segundos sugeridos para o cliente tentar de novo (Retry-After)
+        self.tentar_apos_s = tentar_apos_s
+
+
+def custo_estimado(paginas_nativas: int, paginas_ocr: int) -> float:
+    """Custo de páginas em páginas de OCR (ver ADMISSAO_PESO_PAGINA_NATIVA)."""
+    return paginas_ocr + paginas_nativas * Config.ADMISSAO_PESO_PAGINA_NATIVA
+
+
+def _pid_do_bilhete(bilhete: Path) -> int:
+    partes = bilhete.name.split("-")
+    return int(partes[1]) if len(partes) == 3 and partes[1].isdigit() else 0
+
+
+class ControleAdmissao:
+    """
+    Vagas e fila de lotes pesados do servidor.
+
+    Uso:
+        with obter_controle_admissao().lote() as admissao:
+            registros = processar_lote(pdfs, admissao=admissao)
+    """
+
+    def __init__(self, raiz: Path, vagas: int, fila_maxima: int, espera_maxima_s: float):
+        self.raiz = Path(raiz)
+        self.vagas = vagas
+        self.fila_maxima = fila_maxima
+        self.espera_maxima_s = espera_maxima_s
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lote(self, esperar: bool = False):
+        """
+        Admissão de um lote (AdmissaoLote), liberada na saída do bloco.
+
+        Args:
+            esperar: Espera na fila sem limite de tempo nem de tamanho (lotes
+                em segundo plano, ex: /api/envios)
+        """
+        admissao = AdmissaoLote(self, esperar)
+        try:
+            yield admissao
+        finally:
+            admissao.encerrar()
+
+    @contextmanager
+    def _travado(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.raiz.mkdir(parents=True, exist_ok=True)
+            with open(self.raiz / "admissao.trava", "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _bilhetes(self, pasta: str) -> list:
+        """Bilhetes de processos vivos, por ordem de chegada (os demais são apagados)."""
+        diretorio = self.raiz / pasta
+        diretorio.mkdir(parents=True, exist_ok=True)
+        vivos = []
+        for bilhete in sorted(diretorio.iterdir()):
+            if processo_vivo(_pid_do_bilhete(bilhete)):
+                vivos.append(bilhete)
+            else:
+                bilhete.unlink(missing_ok=True)
+        return vivos
+
+    def _espera_estimada(self) -> int:
+        """Segundos até uma vaga, pelo custo dos lotes admitidos e na fila."""
+        custo = 0.0
+        for bilhete in self._bilhetes("vagas") + self._bilhetes("fila"):
+            try:
+                custo += json.loads(bilhete.read_text())["custo"]
+            except (OSError, ValueError, KeyError):
+                pass
+        segundos = custo * Config.ADMISSAO_SEGUNDOS_POR_PAGINA_OCR / max(1, self.vagas)
+        return int(min(max(segundos, 1), 3600))
+
+    def entrar_na_fila(self, custo: float, limitada: bool = True) -> Path:
+        """
+        Cria o bilhete do lote na fila.
+
+        Raises:
+            LoteRecusado: Se a fila estiver cheia (com `limitada`)
+        """
+        with self._travado():
+            if limitada and len(self._bilhetes("fila")) >= self.fila_maxima:
+                raise LoteRecusado(
+                    "Servidor ocupado com outros lotes com OCR; tente novamente em instantes",
+                    self._espera_estimada(),
+                )
+            bilhete = self.raiz / "fila" / f"{time.time_ns():020d}-{os.getpid()}-{secrets.token_hex(4)}"
+            bilhete.write_text(json.dumps({"custo": custo}))
+            return bilhete
+
+    def tentar_admitir(self, bilhete: Path) -> Optional[Path]:
+        """Move o bilhete para as vagas se houver vaga para ele (por ordem de chegada). Retorna o novo caminho."""
+        with self._travado():
+            livres = self.vagas - len(self._bilhetes("vagas"))
+            fila = self._bilhetes("fila")
+            if bilhete not in fila[:max(0, livres)]:
+                return None
+            admitido = self.raiz / "vagas" / bilhete.name
+            os.replace(bilhete, admitido)
+            return admitido
+
+    def recusar(self, bilhete: Path) -> LoteRecusado:
+        """Tira o bilhete da fila e retorna o erro para a espera esgotada."""
+        with self._travado():
+            bilhete.unlink(missing_ok=True)
+            tentar_apos_s = self._espera_estimada()
+        return LoteRecusado(
+            f"Lote aguardou {self.espera_maxima_s:.0f} s por uma vaga para OCR; tente novamente em instantes",
+            tentar_apos_s,
+        )
+
+
+class AdmissaoLote:
+    """
+    Admissão de um lote, consultada pelo motor de lote (ver ControleAdmissao.lote).
+
+    O motor soma as páginas de cada PDF classificado (`adicionar`) e só envia
+    as páginas de OCR quando `liberada()` retorna True.
+    """
+
+    def __init__(self, controle: ControleAdmissao, esperar: bool = False):
+        self.controle = controle
+        self.esperar = esperar
+        self.custo = 0.0
+        self.admitido = False
+        self.recusado = False
+        self._bilhete: Optional[Path] = None
+        self._inicio_espera = None
+
+    def adicionar(self, paginas_nativas: int, paginas_ocr: int):
+        """Soma ao custo estimado as páginas de um PDF classificado."""
+        self.custo += custo_estimado(paginas_nativas, paginas_ocr)
+
+    def liberada(self) -> bool:
+        """
+        Indica se o lote pode enviar páginas ao OCR: lote leve (até agora),
+        controle desligado ou vaga obtida. Não bloqueia.
+
+        Raises:
+            LoteRecusado: Fila cheia ou espera esgotada
+        """
+        if self.admitido or self.controle.vagas <= 0 or self.custo < Config.ADMISSAO_CUSTO_PESADO:
+            return True
+        if self._bilhete is None:
+            try:
+                self._bilhete = self.controle.entrar_na_fila(self.custo, limitada=not self.esperar)
+            except LoteRecusado:
+                self.recusado = True
+                registrar_admissao("recusado")
+                raise
+            self._inicio_espera = time.monotonic()
+        admitido = self.controle.tentar_admitir(self._bilhete)
+        if admitido is not None:
+            self._bilhete, self.admitido = admitido, True
+            registrar_admissao("admitido", time.monotonic() - self._inicio_espera)
+            return True
+        if not self.esperar and time.monotonic() - self._inicio_espera > self.controle.espera_maxima_s:
+            bilhete, self._bilhete = self._bilhete, None
+            self.recusado = True
+            registrar_admissao("recusado")
+            raise self.controle.recusar(bilhete)
+        return False
+
+    def encerrar(self):
+        """Libera a vaga (ou o lugar na fila) do lote."""
+        if self._bilhete is not None:
+            self._bilhete.unlink(missing_ok=True)
+            self._bilhete = None
+        elif not self.admitido and not self.recusado:
+            registrar_admissao("leve")
+
+
+_controle: Optional[ControleAdmissao] = None
+
+
+def obter_controle_admissao() -> ControleAdmissao:
+    """Controle de admissão do servidor (ADMISSAO_*)."""
+    global _controle
+    if _controle is None:
+        _controle = ControleAdmissao(
+            Path(Config.ADMISSAO_DIRETORIO),
+            Config.ADMISSAO_LOTES_PESADOS,
+            Config.ADMISSAO_FILA_MAXIMA,
+            Config.ADMISSAO_ESPERA_MAXIMA_S,
+        )
+    return _controle
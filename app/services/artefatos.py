@@ -0,0 +1,261 @@
+"""
+Armazém de resultados: reaproveita o XLSX/JSON de um lote já processado.
+
+Cada resultado é guardado em ARTEFATOS_DIRETORIO como `<chave>.<formato>`. A
+chave é o SHA-256 do formato, da versão do extrator, dos campos, da versão das
+regras (só no XLSX: códigos → abas, CNPJs → UO e mês de competência do
+histórico) e da sequência de arquivos enviados (nome e SHA-256 do conteúdo).
+O mesmo lote enviado de novo, com as mesmas regras, recebe o resultado
+guardado sem reprocessar; `/results/<chave>` baixa o resultado outra vez (ex:
+download que falhou ou aba fechada).
+
+Envios idênticos simultâneos compartilham um único processamento: o primeiro
+cria a trava `<chave>.trava` (com o pid, valendo entre os processos do
+gunicorn) e os demais aguardam o resultado. Se o dono da trava falhar, quem
+aguardava processa o lote.
+
+Lotes com falhas (erro em uma página ou arquivo, tempo limite, worker
+encerrado, modo degradado) não são reaproveitados: o resultado é guardado com
+uma chave avulsa, que só quem o gerou conhece (/results/<chave avulsa>), e um
+envio idêntico processa o lote de novo.
+
+Retenção: resultados sem acesso há ARTEFATOS_IDADE_MAXIMA_S são apagados pela
+coleta periódica e, acima de ARTEFATOS_COTA_MB ou ARTEFATOS_MAXIMO, os
+acessados há mais tempo primeiro (cada acesso renova a data do arquivo).
+"""
+
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+
+from app.config import Config
+from app.services.manifesto import hash_arquivo
+from app.services.pdf_parser import VERSAO_PARSER, PdfEmMemoria, normalizar_campos
+from app.utils.area_temporaria import AreaTemporaria, processo_vivo
+from app.utils.formatters import calcular_mes_anterior
+from app.utils.metricas import registrar_artefato
+
+try:
+    # Tenta usar a versão direta (sem Flask) primeiro: envios em partes rodam fora da requisição
+    from app.database.direct import get_todos_cnpjs, get_todos_codigos
+except ImportError:
+    from app.database import get_todos_cnpjs, get_todos_codigos
+
+# Formato → (mimetype, nome do download)
+FORMATOS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "resultado_darfs.xlsx"),
+    "json": ("application/json", "resultado_darfs.json"),
+}
+
+# Cabeçalho das respostas com o endereço do resultado guardado (/results/<chave>)
+RESULTADO_CABECALHO = "X-Resultado"
+
+# Intervalo entre verificações ao aguardar um envio idêntico em andamento
+INTERVALO_ESPERA = 0.2
+
+_CHAVE_VALIDA = re.compile(r"^[0-9a-f]{64}$")
+
+
+def hash_entrada(pdf) -> str:
+    """SHA-256 do conteúdo de um arquivo enviado (caminho ou PdfEmMemoria)."""
+    if isinstance(pdf, PdfEmMemoria):
+        return hashlib.sha256(pdf.dados).hexdigest()
+    return hash_arquivo(Path(pdf))
+
+
+def versao_regras() -> str:
+    """
+    Versão das regras aplicadas ao XLSX: SHA-256 dos códigos → abas, dos
+    CNPJs → UO e do mês de competência usado no histórico.
+    """
+    regras = {
+        "codigos": get_todos_codigos(),
+        "cnpjs": get_todos_cnpjs(),
+        "competencia": calcular_mes_anterior(),
+    }
+    return hashlib.sha256(json.dumps(regras, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def chave_artefato(formato: str, entradas: Iterable, campos=None, regras: Optional[str] = None) -> str:
+    """
+    Chave do resultado de um lote.
+
+    Args:
+        formato: "xlsx" ou "json"
+        entradas: Pares (nome, sha256) dos arquivos enviados, na ordem do envio
+        campos: Campos extraídos (None = todos)
+        regras: versao_regras(), para formatos que dependem das regras (XLSX)
+
+    Returns:
+        SHA-256 em hexadecimal
+    """
+    dados = {
+        "formato": formato,
+        "versao_parser": VERSAO_PARSER,
+        "campos": list(normalizar_campos(campos)),
+        "regras": regras,
+        "entradas": [[nome, sha256] for nome, sha256 in entradas],
+    }
+    return hashlib.sha256(json.dumps(dados, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _dono_vivo(trava: Path) -> bool:
+    try:
+        pid = int(trava.read_text() or 0)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        pid = 0
+    return processo_vivo(pid)
+
+
+class ArmazemArtefatos:
+    """
+    Resultados guardados por chave.
+
+    Uso:
+        armazem = obter_armazem_artefatos()
+        chave = chave_artefato("xlsx", entradas, regras=versao_regras())
+        caminho, gerado = armazem.obter(chave, "xlsx", lambda destino: gerar_excel(..., destino))
+        chave = caminho.stem  # a chave avulsa, se o lote teve falhas
+    """
+
+    def __init__(self, raiz: Path, cota_bytes: int, cota_arquivos: int, idade_maxima_s: float):
+        self.raiz = Path(raiz)
+        self.area = AreaTemporaria(
+            self.raiz / "dados", cota_bytes, cota_arquivos, idade_maxima_s, nome="artefatos"
+        )
+        self.travas = self.raiz / "travas"
+
+    def buscar(self, chave: str, renovar: bool = True) -> Optional[Path]:
+        """
+        Resultado guardado da chave, ou None se não existir (ou expirou).
+
+        Args:
+            chave: Chave do resultado
+            renovar: Renova a data do arquivo (conta como acesso para a retenção)
+        """
+        if not _CHAVE_VALIDA.match(chave or ""):
+            return None
+        for formato in FORMATOS:
+            caminho = self.area.raiz / f"{chave}.{formato}"
+            try:
+                if renovar:
+                    os.utime(caminho)
+                elif not caminho.is_file():
+                    continue
+            except FileNotFoundError:
+                continue
+            return caminho
+        return None
+
+    def travar(self, chave: str) -> bool:
+        """
+        Assume o processamento da chave.
+
+        Returns:
+            False se um envio idêntico (de um processo vivo) já o faz
+        """
+        self.travas.mkdir(parents=True, exist_ok=True)
+        trava = self.travas / f"{chave}.trava"
+        # A trava é criada já com o pid (link de um arquivo completo), para quem
+        # a encontrar nunca ler um pid vazio
+        temporario = self.travas / f"{chave}.{secrets.token_hex(4)}.tmp"
+        temporario.write_text(str(os.getpid()))
+        try:
+            while True:
+                try:
+                    os.link(temporario, trava)
+                    return True
+                except FileExistsError:
+                    if _dono_vivo(trava):
+                        return False
+                    # Trava de um processo encerrado: assume o processamento
+                    trava.unlink(missing_ok=True)
+        finally:
+            temporario.unlink(missing_ok=True)
+
+    def liberar(self, chave: str):
+        (self.travas / f"{chave}.trava").unlink(missing_ok=True)
+
+    def aguardar(self, chave: str) -> Optional[Path]:
+        """
+        Aguarda o envio idêntico em andamento terminar.
+
+        Returns:
+            Resultado da chave, ou None se o processamento em andamento falhou
+        """
+        trava = self.travas / f"{chave}.trava"
+        while True:
+            caminho = self.buscar(chave)
+            if caminho is not None:
+                return caminho
+            if not _dono_vivo(trava):
+                # O dono publica antes de liberar a trava
+                return self.buscar(chave)
+            time.sleep(INTERVALO_ESPERA)
+
+    def publicar(self, chave: str, formato: str, gerar: Callable[[Path], Optional[bool]]) -> Path:
+        """
+        Gera o resultado com `gerar(destino)` numa pasta temporária do armazém e o
+        guarda com a chave (substituição atômica). Aplica a retenção em seguida.
+
+        Se `gerar` retornar False (lote com falhas), o resultado é guardado com
+        uma chave avulsa (`caminho.stem`): buscar/obter da chave do lote nunca o
+        retornam, e um envio idêntico processa de novo.
+        """
+        with self.area.diretorio("gerando") as pasta:
+            temporario = pasta / f"{chave}.{formato}"
+            if gerar(temporario) is False:
+                chave = secrets.token_hex(32)
+                registrar_artefato("com_falhas")
+            destino = self.area.raiz / f"{chave}.{formato}"
+            os.replace(temporario, destino)
+        registrar_artefato("gerado")
+        self.area.coletar(manter=[destino])
+        return destino
+
+    def obter(self, chave: str, formato: str, gerar: Callable[[Path], Optional[bool]]) -> Tuple[Path, bool]:
+        """
+        Resultado da chave: guardado, aguardado de um envio idêntico em andamento
+        ou gerado agora com `gerar(destino)` (ver publicar: False = lote com falhas).
+
+        Returns:
+            Tupla (caminho, gerado). A chave do resultado é `caminho.stem` (avulsa
+            se o lote gerado agora teve falhas)
+        """
+        while True:
+            caminho = self.buscar(chave)
+            if caminho is None and self.travar(chave):
+                try:
+                    return self.publicar(chave, formato, gerar), True
+                finally:
+                    self.liberar(chave)
+            if caminho is None:
+                caminho = self.aguardar(chave)
+            if caminho is not None:
+                registrar_artefato("reaproveitado")
+                return caminho, False
+            # O envio idêntico falhou: processa aqui
+
+
+_armazem: Optional[ArmazemArtefatos] = None
+
+
+def obter_armazem_artefatos() -> ArmazemArtefatos:
+    """Armazém de resultados (ARTEFATOS_*), com a coleta periódica iniciada no primeiro uso."""
+    global _armazem
+    if _armazem is None:
+        _armazem = ArmazemArtefatos(
+            Path(Config.ARTEFATOS_DIRETORIO),
+            Config.ARTEFATOS_COTA_MB * 1024 * 1024,
+            Config.ARTEFATOS_MAXIMO,
+            Config.ARTEFATOS_IDADE_MAXIMA_S,
+        )
+        _armazem.area.iniciar_coleta_periodica(Config.AREA_TEMPORARIA_INTERVALO_GC_S)
+    return _armazem
@@ -0,0 +1,846 @@
+"""
+Motor de processamento em lote.
+
+Distribui as páginas de vários PDFs em duas filas com orçamentos de workers
+separados: páginas com texto nativo (rápidas) e páginas escaneadas (OCR, lentas).
+Assim, um PDF escaneado no início do lote não atrasa os PDFs de texto nativo
+que vêm depois. Os resultados de cada página ficam disponíveis assim que
+terminam (callback `ao_concluir`), e a lista final mantém a ordem por arquivo
+e por página.
+
+Orçamentos de tempo: cada página tem até LOTE_TEMPO_MAXIMO_PAGINA_S. Os workers
+informam quando começam cada tarefa e cada página (inclusive na classificação);
+a página que passar do limite tem o processo encerrado (o pool é recriado e as
+demais tarefas do pool voltam para a fila) e vira um registro de erro por tempo
+limite, e as outras páginas do seu bloco voltam para a fila. O lote todo
+pode ter um prazo (LOTE_TEMPO_MAXIMO_LOTE_S): perto dele, o lote entra em modo
+degradado (sem novas tentativas e OCR em resolução menor); esgotado, o que
+faltar vira erro. Sem processos auxiliares (workers = 0), não há limite por tarefa.
+
+As páginas nativas de um PDF vão em blocos (LOTE_PAGINAS_POR_TAREFA_NATIVA),
+lidos com iterar_paginas_pdf: o PDF é aberto uma vez por bloco, com memória
+constante mesmo em PDFs com milhares de páginas.
+
+Os PDFs podem chegar durante o lote (iterador em `processar_lote`, ex: o
+upload em fluxo de /upload): cada um é classificado assim que chega.
+
+Com um controle de admissão (`admissao`, ver app.services.admissao), as
+páginas de OCR de um lote pesado aguardam uma vaga do servidor; as páginas
+nativas seguem enquanto isso.
+
+Reciclagem: os workers também informam o RSS ao fim de cada tarefa. Quando um
+processo de um pool passa de LOTE_RECICLAR_APOS_PAGINAS páginas ou de
+LOTE_RECICLAR_RSS_MB, o pool da fila é substituído por um novo (as tarefas já
+enviadas ao antigo terminam nele, e seus processos saem em seguida).
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    FIRST_COMPLETED,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from app.config import Config
+from app.utils.memoria import rss_atual
+from app.utils.metricas import registrar_reciclagem, registrar_rss
+from app.utils.perfilador import perfil_ativo
+from app.utils.rastreamento import RASTREAR, executar_no_contexto, iniciar_span
+from app.services.pdf_parser import (
+    OCR_RESOLUCAO_DPI,
+    OCR_RESOLUCAO_DPI_REPETICAO,
+    PAGINA_ESCANEADA,
+    PdfEmMemoria,
+    PAGINA_VAZIA,
+    RegistroDarf,
+    classificar_paginas_pdf,
+    criar_registro,
+    iterar_paginas_ocr,
+    iterar_paginas_pdf,
+    normalizar_campos,
+    processar_paginas_ocr,
+    processar_pdf_pagina,
+    registro_pdf_sem_conteudo,
+)
+
+# Intervalo (segundos) entre verificações de cancelamento enquanto aguarda resultados
+INTERVALO_VERIFICACAO = 0.5
+# Intervalo menor enquanto ainda chegam PDFs (entradas em fluxo), para começar logo os novos
+INTERVALO_RECEBIMENTO = 0.05
+# Intervalo entre consultas ao controle de admissão, sem outras tarefas em andamento
+INTERVALO_ADMISSAO = 0.2
+
+
+class _ExecutorSincrono:
+    """Executor que roda cada tarefa imediatamente na thread atual (workers = 0)."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+# Executores compartilhados entre lotes (mantém os processos e o OCR carregados)
+_executores = {}
+_executores_lock = threading.Lock()
+
+# Avisos dos workers: início de cada tarefa e de cada página ("inicio", id da tarefa,
+# pid, (instante, página ou None)), coletado em _inicios_tarefas, e fim ("fim", id da
+# tarefa, pid, RSS em bytes), coletado em _rss_processos pelo processo principal
+_ids_tarefas = itertools.count(1)
+_fila_inicios = None
+_inicios_tarefas = {}
+_inicios_lock = threading.Lock()
+# Uso de cada processo dos pools: RSS do último aviso de fim e páginas processadas
+_rss_processos = {}
+_paginas_processos = {}
+
+# Fila de inícios recebida por cada worker (ver _iniciar_worker) e tarefa em andamento nele
+_fila_inicios_worker = None
+_tarefa_worker = None
+
+
+def _iniciar_worker(fila_inicios):
+    global _fila_inicios_worker
+    _fila_inicios_worker = fila_inicios
+
+
+def _executar_tarefa(id_tarefa: int, fn, *args):
+    """Roda uma tarefa no worker, avisando o processo principal do início e do fim (com o RSS)."""
+    global _tarefa_worker
+    if _fila_inicios_worker is None:
+        return fn(*args)
+    _tarefa_worker = id_tarefa
+    _fila_inicios_worker.put(("inicio", id_tarefa, os.getpid(), (time.monotonic(), None)))
+    try:
+        return fn(*args)
+    finally:
+        _tarefa_worker = None
+        _fila_inicios_worker.put(("fim", id_tarefa, os.getpid(), rss_atual()))
+
+
+def _avisar_pagina(pagina: int):
+    """No worker: avisa o processo principal do início de uma página (o limite de tempo recomeça)."""
+    if _fila_inicios_worker is not None and _tarefa_worker is not None:
+        _fila_inicios_worker.put(("inicio", _tarefa_worker, os.getpid(), (time.monotonic(), pagina)))
+
+
+def _classificar_paginas(pdf_path) -> list:
+    """Classificação de um PDF, avisando o início de cada página."""
+    return classificar_paginas_pdf(pdf_path, ao_iniciar_pagina=_avisar_pagina)
+
+
+class _FalhaNoBloco:
+    """Bloco interrompido por uma página: os registros das páginas anteriores e o erro da que falhou."""
+
+    def __init__(self, registros: list, pagina: int, mensagem: str):
+        self.registros = registros
+        self.pagina = pagina
+        self.mensagem = mensagem
+
+
+def _consumir_bloco(paginas: list, registros: Iterator):
+    """
+    Consome o gerador de registros de um bloco (um por página, na ordem de
+    `paginas`). Se uma página falhar, retorna _FalhaNoBloco com os registros
+    já extraídos, e as páginas seguintes voltam para a fila no processo principal.
+    """
+    concluidos = []
+    try:
+        for pagina in paginas:
+            _avisar_pagina(pagina)
+            concluidos.append(next(registros))
+    except Exception as e:
+        return _FalhaNoBloco(concluidos, pagina, f"{type(e).__name__}: {e}")
+    finally:
+        registros.close()
+    return concluidos
+
+
+def _processar_paginas_nativas(pdf_path, classificacao: list, campos):
+    """Bloco de páginas nativas de um PDF, aberto uma única vez (ver iterar_paginas_pdf)."""
+    return _consumir_bloco(
+        [info["pagina"] for info in classificacao], iterar_paginas_pdf(pdf_path, campos, classificacao)
+    )
+
+
+def _processar_paginas_ocr(pdf_path, paginas: list, campos, leitura_antecipada, resolucao):
+    """Bloco de páginas escaneadas de um PDF, com leitura antecipada (ver iterar_paginas_ocr)."""
+    return _consumir_bloco(paginas, iterar_paginas_ocr(pdf_path, paginas, campos, leitura_antecipada, resolucao))
+
+
+def _coletar_inicios():
+    """Move os avisos enviados pelos workers para _inicios_tarefas e _rss_processos."""
+    if _fila_inicios is None:
+        return
+    with _inicios_lock:
+        while True:
+            try:
+                tipo, id_tarefa, pid, valor = _fila_inicios.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == "inicio":
+                _inicios_tarefas[id_tarefa] = (pid, *valor)
+            elif valor is not None:
+                _rss_processos[pid] = valor
+
+
+def _criar_executor(workers: int):
+    global _fila_inicios
+    if workers <= 0:
+        return _ExecutorSincrono()
+    contexto = multiprocessing.get_context("spawn")
+    if _fila_inicios is None:
+        _fila_inicios = contexto.Queue()
+    # "spawn" evita herdar threads (Qt, servidor WSGI) do processo principal
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=contexto,
+        initializer=_iniciar_worker,
+        initargs=(_fila_inicios,),
+    )
+
+
+def _esquecer_processos(pids):
+    """Descarta as contagens de páginas e o RSS de processos que não voltam a ser usados."""
+    with _inicios_lock:
+        for pid in pids:
+            _paginas_processos.pop(pid, None)
+            _rss_processos.pop(pid, None)
+
+
+def _encerrar_processo(pid: int):
+    try:
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+    except OSError:
+        # Já terminou
+        pass
+    _esquecer_processos([pid])
+
+
+def obter_executor(fila: str):
+    """
+    Retorna o executor compartilhado de uma fila ("nativa" ou "ocr"), criando-o se necessário.
+    """
+    with _executores_lock:
+        executor = _executores.get(fila)
+        if executor is None:
+            workers = Config.LOTE_WORKERS_OCR if fila == "ocr" else Config.LOTE_WORKERS_NATIVOS
+            executor = _criar_executor(workers)
+            _executores[fila] = executor
+        return executor
+
+
+def descartar_executor(fila: str, executor=None):
+    """
+    Descarta o executor de uma fila (ex: após um worker morrer), para que o
+    próximo lote crie um novo.
+    """
+    with _executores_lock:
+        atual = _executores.get(fila)
+        if atual is not None and (executor is None or atual is executor):
+            del _executores[fila]
+            pids = list(getattr(atual, "_processes", None) or {})
+            atual.shutdown(wait=False, cancel_futures=True)
+            _esquecer_processos(pids)
+
+
+def reciclar_executor(fila: str, executor, pid: int, paginas: int) -> bool:
+    """
+    Conta as páginas de uma tarefa concluída pelo processo `pid` e, se ele
+    passou de LOTE_RECICLAR_APOS_PAGINAS páginas ou de LOTE_RECICLAR_RSS_MB,
+    substitui o pool da fila: as tarefas já enviadas terminam no pool antigo,
+    cujos processos saem em seguida, e o próximo obter_executor cria um novo.
+
+    Returns:
+        True se o pool foi substituído
+    """
+    with _inicios_lock:
+        _paginas_processos[pid] = _paginas_processos.get(pid, 0) + paginas
+        total = _paginas_processos[pid]
+        rss = _rss_processos.get(pid)
+    if rss is not None:
+        registrar_rss(fila, rss)
+    limite_paginas = Config.LOTE_RECICLAR_APOS_PAGINAS
+    limite_rss = Config.LOTE_RECICLAR_RSS_MB * 1024 * 1024
+    if limite_paginas and total >= limite_paginas:
+        motivo = "paginas"
+    elif limite_rss and rss is not None and rss >= limite_rss:
+        motivo = "rss"
+    else:
+        return False
+    with _executores_lock:
+        if _executores.get(fila) is not executor:
+            # Já substituído (por outro lote ou por um worker que morreu)
+            return False
+        del _executores[fila]
+    executor.shutdown(wait=False)
+    # Os pids do pool antigo não voltam a ser usados por ele
+    _esquecer_processos(list(getattr(executor, "_processes", None) or {}))
+    registrar_reciclagem(fila, motivo)
+    return True
+
+
+def encerrar_executores():
+    """Encerra todos os executores compartilhados (usar ao finalizar a aplicação)."""
+    with _executores_lock:
+        executores = list(_executores.values())
+        _executores.clear()
+    for executor in executores:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _Tarefa:
+    """Uma tarefa submetida a um executor (classificação ou bloco de páginas)."""
+
+    def __init__(self, idx, paginas, fila, fn, args, tentativa, executor):
+        self.id = next(_ids_tarefas)
+        self.idx = idx
+        # Páginas da tarefa, ou None para a classificação
+        self.paginas = paginas
+        self.fila = fila
+        self.fn = fn
+        self.args = args
+        self.tentativa = tentativa
+        self.executor = executor
+
+    def parte(self, paginas: list) -> "_Tarefa":
+        """Nova tarefa do mesmo bloco, só com as `paginas` informadas (mesma fila e tentativa)."""
+        pdf_path, itens, *resto = self.args
+        itens = [item for item in itens if (item["pagina"] if isinstance(item, dict) else item) in paginas]
+        return _Tarefa(self.idx, list(paginas), self.fila, self.fn, (pdf_path, itens, *resto), self.tentativa, None)
+
+
+class _Recebimento:
+    """
+    Consome em uma thread as entradas de um lote que chegam aos poucos (ex:
+    PDFs de um upload ainda em andamento), para o lote processar os primeiros
+    enquanto os próximos são recebidos.
+
+    O lote chama `encerrar()` ao terminar (inclusive com erro): a thread para
+    antes da próxima entrada e é aguardada, para nenhuma leitura das entradas
+    (ex: do stream da requisição) continuar depois que o lote retorna.
+    """
+
+    _FIM = object()
+
+    def __init__(self, entradas: Iterator):
+        self.fila = queue.Queue()
+        self.terminado = False
+        self.erro: Optional[BaseException] = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(
+            target=self._consumir, args=(entradas,), name="recebimento-lote", daemon=True
+        )
+        self._thread.start()
+
+    def _consumir(self, entradas: Iterator):
+        try:
+            for entrada in entradas:
+                self.fila.put(entrada)
+                if self._parar.is_set():
+                    # Encerra o gerador nesta thread (descarta a entrada em andamento)
+                    fechar = getattr(entradas, "close", None)
+                    if fechar is not None:
+                        fechar()
+                    break
+        except BaseException as e:
+            self.erro = e
+        finally:
+            self.fila.put(self._FIM)
+
+    def encerrar(self):
+        """Para de consumir as entradas e aguarda a thread (termina a entrada em leitura)."""
+        self._parar.set()
+        self._thread.join()
+
+    def receber(self, timeout: float) -> list:
+        """Entradas já recebidas; espera até `timeout` pela primeira se não houver nenhuma."""
+        recebidas = []
+        try:
+            item = self.fila.get(timeout=timeout) if timeout > 0 else self.fila.get_nowait()
+            while True:
+                if item is self._FIM:
+                    self.terminado = True
+                    break
+                recebidas.append(item)
+                item = self.fila.get_nowait()
+        except queue.Empty:
+            pass
+        return recebidas
+
+
+class _EstadoArquivo:
+    """Acompanha o processamento de um PDF dentro do lote."""
+
+    def __init__(self, pdf_path: Path):
+        self.pdf_path = pdf_path
+        self.classificacao: Optional[list] = None
+        self.registros: dict = {}
+        # Erro que impede o processamento do PDF inteiro (ex: falha na classificação)
+        self.erro: Optional[str] = None
+        # Páginas que falharam mesmo após a nova tentativa: {página: mensagem}
+        self.paginas_com_erro: dict = {}
+        # Alguma página passou pelo OCR em resolução menor (modo degradado)
+        self.degradado = False
+        # Span do arquivo (pai dos spans das páginas, gravados nos processos do lote)
+        self.span = iniciar_span("arquivo", arquivo=pdf_path.name)
+        self._span_finalizado = False
+
+    def finalizar_span(self):
+        if not self._span_finalizado:
+            self._span_finalizado = True
+            self.span.finalizar(paginas=len(self.registros), erro=self.erro)
+
+
+def processar_lote(
+    pdf_paths: Iterable,
+    campos=None,
+    ao_concluir: Optional[Callable[[RegistroDarf], None]] = None,
+    ao_classificar: Optional[Callable[[Path, list], None]] = None,
+    deve_cancelar: Optional[Callable[[], bool]] = None,
+    ao_finalizar_arquivo: Optional[Callable[[Path, List[RegistroDarf], Optional[str]], None]] = None,
+    diario=None,
+    tempo_maximo_s: Optional[float] = None,
+    admissao=None,
+) -> List[RegistroDarf]:
+    """
+    Processa um lote de PDFs com filas separadas para páginas nativas e de OCR.
+
+    Cada PDF é classificado na fila nativa; em seguida suas páginas nativas vão
+    para a fila nativa, as escaneadas para a fila de OCR e as em branco são ignoradas.
+
+    Falhas são isoladas por página: uma página que falhe (exceção ou worker
+    encerrado) é tentada mais uma vez, sozinha e com configurações alternativas
+    (LOTE_REPETIR_PAGINA_COM_ERRO); se falhar de novo, vira um registro de erro
+    daquela página, e as demais páginas do PDF são mantidas. Num bloco de
+    páginas, as extraídas antes da que falhou são mantidas e as seguintes
+    voltam para a fila.
+
+    Args:
+        pdf_paths: Caminhos dos PDFs (ou PdfEmMemoria), na ordem desejada de
+            saída. Se for um iterador (ex: gerador), é consumido em outra thread
+            e cada PDF entra no lote assim que é produzido; uma exceção do
+            iterador cancela as tarefas pendentes e é relançada.
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        ao_concluir: Chamado com cada registro assim que sua página termina
+            (fora de ordem; páginas nativas chegam primeiro)
+        ao_classificar: Chamado com (pdf_path, classificacao) quando um PDF é
+            classificado, antes da extração de suas páginas
+        deve_cancelar: Se retornar True, as tarefas pendentes são canceladas e
+            o lote retorna apenas o que já foi concluído
+        ao_finalizar_arquivo: Chamado, na ordem dos arquivos, com (pdf_path,
+            registros do arquivo, mensagem de erro ou None) ao montar a saída.
+            A mensagem também é preenchida quando alguma página falhou (inclusive
+            por tempo limite) ou passou pelo OCR em modo degradado: o resultado
+            do arquivo não deve ser reaproveitado.
+            Não é chamado se o lote for cancelado.
+        diario: DiarioLote aberto (ver app.services.diario). Cada classificação
+            e página concluída é registrada nele; PDFs já classificados no
+            diário não são reclassificados e suas páginas registradas não são
+            reprocessadas (ao_classificar e ao_concluir são chamados com elas).
+        tempo_maximo_s: Prazo do lote em segundos (padrão:
+            LOTE_TEMPO_MAXIMO_LOTE_S; 0 = sem prazo)
+        admissao: AdmissaoLote (ver app.services.admissao). O custo de cada
+            PDF classificado é somado nela, e as páginas de OCR só são
+            enviadas quando ela as libera. Uma recusa (LoteRecusado) cancela
+            as tarefas pendentes e é relançada.
+
+    Returns:
+        Lista de registros ordenada por arquivo e por página. Um PDF que não
+        possa ser classificado gera um único registro de erro; uma página que
+        falhe gera um registro de erro daquela página.
+    """
+    campos = normalizar_campos(campos)
+    estados = []
+    if perfil_ativo():
+        # Sob o perfilador, as páginas são processadas na thread perfilada
+        executores = {"nativa": _ExecutorSincrono(), "ocr": _ExecutorSincrono()}
+    else:
+        executores = {"nativa": obter_executor("nativa"), "ocr": obter_executor("ocr")}
+
+    inicio_lote = time.monotonic()
+    tempo_maximo_s = Config.LOTE_TEMPO_MAXIMO_LOTE_S if tempo_maximo_s is None else tempo_maximo_s
+    prazo = inicio_lote + tempo_maximo_s if tempo_maximo_s > 0 else None
+
+    def modo_degradado() -> bool:
+        # Perto do prazo do lote: sem novas tentativas e OCR em resolução menor
+        return prazo is not None and prazo - time.monotonic() < tempo_maximo_s * Config.LOTE_MARGEM_DEGRADACAO
+
+    # future -> _Tarefa
+    pendentes = {}
+    # Executores cujo worker foi encerrado por tempo: as demais tarefas deles
+    # voltam para a fila sem gastar a nova tentativa
+    interrompidos = set()
+    # Blocos de OCR aguardando a liberação do controle de admissão: (idx, páginas, resolução)
+    ocr_em_espera = []
+
+    def enviar(tarefa):
+        fn, args = tarefa.fn, tarefa.args
+        if RASTREAR:
+            # Repassa o span do arquivo como pai das tarefas do processo auxiliar
+            fn, args = executar_no_contexto, (estados[tarefa.idx].span.contexto, fn, *args)
+        if isinstance(executores[tarefa.fila], ProcessPoolExecutor):
+            fn, args = _executar_tarefa, (tarefa.id, fn, *args)
+        try:
+            tarefa.executor = executores[tarefa.fila]
+            future = tarefa.executor.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # Pool quebrado por um worker que morreu: recria e tenta de novo
+            substituir_executor(tarefa.fila, tarefa.executor)
+            tarefa.executor = executores[tarefa.fila]
+            future = tarefa.executor.submit(fn, *args)
+        pendentes[future] = tarefa
+
+    def submeter(fila, idx, paginas, fn, *args, tentativa=0):
+        enviar(_Tarefa(idx, paginas, fila, fn, args, tentativa, None))
+
+    def substituir_executor(fila, executor):
+        # Só substitui se ainda for o executor atual da fila (vários futures
+        # do mesmo pool quebrado chegam em sequência)
+        if executores[fila] is executor:
+            descartar_executor(fila, executor)
+            executores[fila] = obter_executor(fila)
+
+    def verificar_reciclagem(tarefa, pid, future):
+        # A classificação conta as páginas do PDF (todas lidas pelo pdfplumber)
+        if tarefa.paginas is not None:
+            lidas = len(tarefa.paginas)
+        elif future.exception() is None:
+            lidas = len(future.result())
+        else:
+            lidas = 1
+        if executores[tarefa.fila] is tarefa.executor and reciclar_executor(tarefa.fila, tarefa.executor, pid, lidas):
+            executores[tarefa.fila] = obter_executor(tarefa.fila)
+
+    def cancelar_arquivo(idx):
+        for future, tarefa in list(pendentes.items()):
+            if tarefa.idx == idx and future.cancel():
+                del pendentes[future]
+
+    def distribuir_paginas(idx, classificacao):
+        # Classificação concluída: distribui as páginas entre as filas
+        estado = estados[idx]
+        paginas_ocr = []
+        paginas_nativas = []
+        for info in classificacao:
+            if info["tipo"] == PAGINA_VAZIA or info["pagina"] in estado.registros:
+                continue
+            if info["tipo"] == PAGINA_ESCANEADA:
+                paginas_ocr.append(info["pagina"])
+            else:
+                paginas_nativas.append(info)
+        # Páginas nativas em blocos: o PDF é aberto uma vez por bloco
+        tamanho = max(1, Config.LOTE_PAGINAS_POR_TAREFA_NATIVA)
+        for inicio in range(0, len(paginas_nativas), tamanho):
+            bloco = paginas_nativas[inicio:inicio + tamanho]
+            submeter(
+                "nativa", idx, [info["pagina"] for info in bloco],
+                _processar_paginas_nativas, estado.pdf_path, bloco, campos,
+            )
+        # Páginas escaneadas em blocos: dentro de cada bloco, a renderização
+        # da próxima página se sobrepõe ao OCR da atual
+        tamanho = max(1, Config.LOTE_PAGINAS_POR_TAREFA_OCR)
+        resolucao = OCR_RESOLUCAO_DPI_REPETICAO if modo_degradado() else OCR_RESOLUCAO_DPI
+        if paginas_ocr and resolucao != OCR_RESOLUCAO_DPI:
+            estado.degradado = True
+        for inicio in range(0, len(paginas_ocr), tamanho):
+            ocr_em_espera.append((idx, paginas_ocr[inicio:inicio + tamanho], resolucao))
+        if admissao is not None:
+            admissao.adicionar(len(paginas_nativas), len(paginas_ocr))
+        else:
+            liberar_ocr()
+
+    def liberar_ocr():
+        for idx, bloco, resolucao in ocr_em_espera:
+            if not estados[idx].erro:
+                submeter(
+                    "ocr", idx, bloco, _processar_paginas_ocr, estados[idx].pdf_path, bloco, campos, None, resolucao,
+                )
+        ocr_em_espera.clear()
+
+    def entregar_paginas(idx, paginas, registros_tarefa):
+        # Páginas extraídas por uma tarefa: registradas no diário e concluídas
+        if diario is not None and paginas:
+            diario.registrar_paginas(estados[idx].pdf_path, paginas, registros_tarefa)
+        concluir_paginas(idx, paginas, registros_tarefa)
+
+    def concluir_paginas(idx, paginas, registros_tarefa):
+        estado = estados[idx]
+        for pagina, registro in zip(paginas, registros_tarefa):
+            estado.registros[pagina] = registro
+            if ao_concluir:
+                ao_concluir(registro)
+
+    def registrar_erro_paginas(idx, paginas, mensagem):
+        estado = estados[idx]
+        for pagina in paginas:
+            estado.paginas_com_erro[pagina] = mensagem
+            concluir_paginas(idx, [pagina], [criar_registro(f"{estado.pdf_path.name} - Página {pagina}", campos, mensagem)])
+
+    def falhar_paginas(idx, paginas, tentativa, erro):
+        # Nova tentativa de cada página sozinha, com configurações alternativas;
+        # na segunda falha (ou perto do prazo do lote), a página vira um registro de erro
+        estado = estados[idx]
+        if tentativa > 0 or not Config.LOTE_REPETIR_PAGINA_COM_ERRO or modo_degradado():
+            for pagina in paginas:
+                registrar_erro_paginas(idx, [pagina], f"Erro ao processar a página {pagina}: {erro}")
+            return
+        tipos = {info["pagina"]: info["tipo"] for info in estado.classificacao}
+        for pagina in paginas:
+            if tipos.get(pagina) == PAGINA_ESCANEADA:
+                submeter(
+                    "ocr", idx, [pagina], processar_paginas_ocr, estado.pdf_path, [pagina], campos,
+                    0, OCR_RESOLUCAO_DPI_REPETICAO, tentativa=1,
+                )
+            else:
+                # Falha na camada de texto: tenta pelo OCR da página renderizada
+                submeter(
+                    "ocr", idx, [pagina], processar_pdf_pagina, estado.pdf_path, pagina, campos,
+                    PAGINA_ESCANEADA, tentativa=1,
+                )
+
+    def falhar_tarefa(tarefa, paginas, mensagem):
+        # Páginas de um bloco nativo são tentadas de novo sozinhas, ainda pelo texto
+        # nativo; só a que falhar sozinha vai para falhar_paginas (OCR ou erro)
+        if tarefa.fila == "nativa" and len(tarefa.paginas) > 1 and not modo_degradado():
+            for pagina in paginas:
+                enviar(tarefa.parte([pagina]))
+        else:
+            falhar_paginas(tarefa.idx, paginas, tarefa.tentativa, mensagem)
+
+    def esgotar_tempo(future, tarefa, mensagem, pagina=None):
+        # Tarefa encerrada por tempo: a página em andamento (ou, sem ela, todas as
+        # da tarefa) vira erro e o restante do lote segue
+        del pendentes[future]
+        with _inicios_lock:
+            _inicios_tarefas.pop(tarefa.id, None)
+        estado = estados[tarefa.idx]
+        if estado.erro:
+            return
+        if tarefa.paginas is None:
+            estado.erro = f"Erro ao processar PDF: {mensagem}"
+            cancelar_arquivo(tarefa.idx)
+        elif pagina is None:
+            registrar_erro_paginas(tarefa.idx, tarefa.paginas, mensagem)
+        else:
+            registrar_erro_paginas(tarefa.idx, [pagina], mensagem)
+            # As demais páginas do bloco (as já extraídas se perderam com o processo)
+            restantes = [p for p in tarefa.paginas if p != pagina]
+            if restantes:
+                enviar(tarefa.parte(restantes))
+
+    def verificar_tempos():
+        _coletar_inicios()
+        agora = time.monotonic()
+        limite_pagina = Config.LOTE_TEMPO_MAXIMO_PAGINA_S
+        for future, tarefa in list(pendentes.items()):
+            with _inicios_lock:
+                inicio = _inicios_tarefas.get(tarefa.id)
+            if inicio is None or future.done():
+                continue
+            # Instante do início da página em andamento (ou da tarefa, antes da primeira)
+            pid, instante, pagina = inicio
+            if limite_pagina > 0 and agora - instante > limite_pagina:
+                mensagem = f"Tempo limite excedido ({limite_pagina:.0f} s)"
+                if pagina is None and tarefa.paginas:
+                    pagina = tarefa.paginas[0]
+            elif prazo is not None and agora > prazo:
+                mensagem = f"Prazo do lote esgotado ({tempo_maximo_s:.0f} s)"
+                pagina = None
+            else:
+                continue
+            interrompidos.add(tarefa.executor)
+            _encerrar_processo(pid)
+            esgotar_tempo(future, tarefa, mensagem, pagina)
+
+    def esgotar_prazo_lote():
+        # Prazo do lote esgotado: tarefas ainda na fila viram erro sem rodar
+        for future, tarefa in list(pendentes.items()):
+            if future.cancel():
+                esgotar_tempo(future, tarefa, f"Prazo do lote esgotado ({tempo_maximo_s:.0f} s)")
+        for idx, bloco, _ in ocr_em_espera:
+            if not estados[idx].erro:
+                registrar_erro_paginas(idx, bloco, f"Prazo do lote esgotado ({tempo_maximo_s:.0f} s)")
+        ocr_em_espera.clear()
+
+    def adicionar_arquivo(pdf_path):
+        estado = _EstadoArquivo(pdf_path if isinstance(pdf_path, PdfEmMemoria) else Path(pdf_path))
+        estados.append(estado)
+        idx = len(estados) - 1
+        retomado = diario.retomar(estado.pdf_path) if diario is not None else None
+        if retomado is None:
+            submeter("nativa", idx, None, _classificar_paginas, estado.pdf_path)
+            return
+        # Retomada: classificação e páginas já concluídas vêm do diário
+        estado.classificacao, estado.registros = retomado[0], dict(retomado[1])
+        if ao_classificar:
+            ao_classificar(estado.pdf_path, estado.classificacao)
+        if ao_concluir:
+            for pagina in sorted(estado.registros):
+                ao_concluir(estado.registros[pagina])
+        distribuir_paginas(idx, estado.classificacao)
+
+    recebimento = None
+    if isinstance(pdf_paths, Iterator):
+        recebimento = _Recebimento(pdf_paths)
+    else:
+        for pdf_path in pdf_paths:
+            adicionar_arquivo(pdf_path)
+
+    def recebendo() -> bool:
+        return recebimento is not None and not recebimento.terminado
+
+    cancelado = False
+    try:
+        while pendentes or recebendo() or ocr_em_espera:
+            if deve_cancelar and deve_cancelar():
+                with _inicios_lock:
+                    for future, tarefa in pendentes.items():
+                        future.cancel()
+                        _inicios_tarefas.pop(tarefa.id, None)
+                pendentes.clear()
+                ocr_em_espera.clear()
+                cancelado = True
+                break
+
+            if recebendo():
+                # Sem tarefas em andamento, aguarda o próximo PDF
+                for pdf_path in recebimento.receber(0 if pendentes else INTERVALO_VERIFICACAO):
+                    adicionar_arquivo(pdf_path)
+                if recebimento.erro is not None:
+                    for future in pendentes:
+                        future.cancel()
+                    raise recebimento.erro
+
+            if ocr_em_espera:
+                try:
+                    if admissao.liberada():
+                        liberar_ocr()
+                except Exception:
+                    for future in pendentes:
+                        future.cancel()
+                    raise
+
+            if prazo is not None and time.monotonic() > prazo:
+                esgotar_prazo_lote()
+            verificar_tempos()
+            if not pendentes:
+                if ocr_em_espera and not recebendo():
+                    # Só falta o OCR, aguardando uma vaga
+                    time.sleep(INTERVALO_ADMISSAO)
+                continue
+
+            intervalo = INTERVALO_RECEBIMENTO if recebendo() else INTERVALO_VERIFICACAO
+            concluidos, _ = wait(list(pendentes), timeout=intervalo, return_when=FIRST_COMPLETED)
+            for future in concluidos:
+                if future not in pendentes:
+                    continue
+                tarefa = pendentes.pop(future)
+                _coletar_inicios()
+                with _inicios_lock:
+                    inicio = _inicios_tarefas.pop(tarefa.id, None)
+                if inicio is not None:
+                    verificar_reciclagem(tarefa, inicio[0], future)
+                idx, paginas = tarefa.idx, tarefa.paginas
+                estado = estados[idx]
+                try:
+                    resultado = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        # Worker morreu: o pool inteiro é descartado (todas as suas tarefas falham)
+                        substituir_executor(tarefa.fila, tarefa.executor)
+                        if tarefa.executor in interrompidos:
+                            # Pool derrubado por tempo de outra tarefa: volta para a fila
+                            if not estado.erro:
+                                enviar(tarefa)
+                            continue
+                        mensagem = f"worker encerrado inesperadamente ({e})"
+                    else:
+                        mensagem = f"{type(e).__name__}: {e}"
+                    if estado.erro:
+                        continue
+                    if paginas is not None:
+                        falhar_tarefa(tarefa, paginas, mensagem)
+                    elif isinstance(e, BrokenProcessPool) and tarefa.tentativa == 0:
+                        # Classificação perdida junto com o worker de outra tarefa
+                        submeter("nativa", idx, None, _classificar_paginas, estado.pdf_path, tentativa=1)
+                    else:
+                        estado.erro = f"Erro ao processar PDF: {mensagem}"
+                        cancelar_arquivo(idx)
+                else:
+                    if estado.erro:
+                        continue
+                    if paginas is None:
+                        estado.classificacao = resultado
+                        if diario is not None:
+                            diario.registrar_classificacao(estado.pdf_path, resultado)
+                        if ao_classificar:
+                            ao_classificar(estado.pdf_path, resultado)
+                        distribuir_paginas(idx, resultado)
+                    elif isinstance(resultado, _FalhaNoBloco):
+                        # Mantém as páginas já extraídas; só a que falhou vai para a nova
+                        # tentativa e as seguintes voltam para a fila
+                        concluidas = len(resultado.registros)
+                        entregar_paginas(idx, paginas[:concluidas], resultado.registros)
+                        restantes = paginas[concluidas + 1:]
+                        if restantes:
+                            enviar(tarefa.parte(restantes))
+                        falhar_tarefa(tarefa, [resultado.pagina], resultado.mensagem)
+                    else:
+                        registros_tarefa = resultado if isinstance(resultado, list) else [resultado]
+                        entregar_paginas(idx, paginas, registros_tarefa)
+
+                if RASTREAR and not any(t.idx == idx for t in pendentes.values()):
+                    # Última tarefa do arquivo
+                    estado.finalizar_span()
+    finally:
+        # Tarefas abandonadas por um erro não deixam início registrado
+        with _inicios_lock:
+            for tarefa in pendentes.values():
+                _inicios_tarefas.pop(tarefa.id, None)
+        if recebimento is not None:
+            # Nenhuma leitura das entradas continua depois do lote (ex: após um erro)
+            recebimento.encerrar()
+
+    # Monta a saída na ordem original (arquivo, página)
+    registros = []
+    for estado in estados:
+        estado.finalizar_span()
+        if estado.erro:
+            registros_arquivo = [criar_registro(f"{estado.pdf_path.name} - Página 1", campos, estado.erro)]
+        elif estado.classificacao is None:
+            # Cancelado antes da classificação
+            continue
+        else:
+            sem_conteudo = registro_pdf_sem_conteudo(estado.pdf_path, estado.classificacao, campos)
+            if sem_conteudo:
+                registros_arquivo = [sem_conteudo]
+            else:
+                registros_arquivo = [estado.registros[pagina] for pagina in sorted(estado.registros)]
+        if ao_finalizar_arquivo and not cancelado:
+            erro = estado.erro
+            if erro is None and estado.paginas_com_erro:
+                erro = f"Erro em {len(estado.paginas_com_erro)} página(s): {sorted(estado.paginas_com_erro)}"
+            elif erro is None and estado.degradado:
+                erro = "OCR em resolução menor (modo degradado, perto do prazo do lote)"
+            ao_finalizar_arquivo(estado.pdf_path, registros_arquivo, erro)
+        registros.extend(registros_arquivo)
+
+    return registros
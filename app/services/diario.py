@@ -0,0 +1,146 @@
+"""
+Diário (journal) append-only das páginas concluídas de um lote.
+
+Cada classificação de PDF e cada página extraída viram uma linha JSON no
+diário assim que terminam. Se o processo morrer no meio do lote (queda,
+falta de memória, novo deploy), a próxima execução com o mesmo diário pula
+as páginas já registradas e só processa o restante (ver `processar_lote`).
+
+Um PDF só é retomado se o caminho, o tamanho e a data de modificação forem
+os mesmos (PDFs em memória não são registrados); o diário inteiro é descartado se a versão do extrator ou os
+campos mudarem. As linhas são gravadas com flush (sobrevivem à morte do
+processo, não necessariamente a uma queda do sistema operacional).
+"""
+
+import json
+from pathlib import Path
+from typing import Optional
+
+from app.services.pdf_parser import VERSAO_PARSER, PdfEmMemoria, normalizar_campos, registro_de_dict
+
+
+def caminho_diario(saida: Path) -> Path:
+    """Diário de uma saída (ex: resultado_darfs.csv → resultado_darfs.diario.jsonl)."""
+    return saida.with_name(f"{saida.stem}.diario.jsonl")
+
+
+class DiarioLote:
+    """
+    Diário de um lote.
+
+    Uso:
+        diario = DiarioLote(caminho, campos)
+        diario.abrir()
+        try:
+            registros = processar_lote(pdf_paths, campos, diario=diario)
+        finally:
+            diario.fechar()
+        diario.remover()  # lote concluído
+    """
+
+    def __init__(self, caminho: Path, campos=None):
+        self.caminho = caminho
+        self.campos = list(normalizar_campos(campos))
+        # chave do PDF -> {"classificacao": [...], "registros": {pagina: registro}}
+        self.arquivos: dict = {}
+        self._arquivo = None
+        self._chaves: dict = {}
+
+    def abrir(self) -> int:
+        """
+        Lê o diário existente (se compatível) e o abre para acréscimo.
+
+        Returns:
+            Número de páginas já registradas
+        """
+        cabecalho = {"tipo": "cabecalho", "versao_parser": VERSAO_PARSER, "campos": self.campos}
+        compativel = self._carregar(cabecalho)
+        if compativel:
+            self._arquivo = open(self.caminho, "a", encoding="utf-8")
+            if self._arquivo.tell() > 0 and not self._termina_com_quebra():
+                # Última linha cortada pela queda: começa uma linha nova
+                self._arquivo.write("\n")
+        else:
+            self.arquivos = {}
+            self._arquivo = open(self.caminho, "w", encoding="utf-8")
+            self._gravar(cabecalho)
+        return sum(len(entrada["registros"]) for entrada in self.arquivos.values())
+
+    def retomar(self, pdf_path: Path) -> Optional[tuple]:
+        """
+        Returns:
+            Tupla (classificação, {página: registro}) do PDF registrado no
+            diário, ou None se ele não foi classificado ou mudou desde então.
+        """
+        if isinstance(pdf_path, PdfEmMemoria):
+            return None
+        entrada = self.arquivos.get(self._chave(pdf_path))
+        if entrada is None or entrada["classificacao"] is None:
+            return None
+        return entrada["classificacao"], entrada["registros"]
+
+    def registrar_classificacao(self, pdf_path: Path, classificacao: list):
+        if isinstance(pdf_path, PdfEmMemoria):
+            return
+        self._gravar({"tipo": "classificacao", "chave": self._chave(pdf_path), "classificacao": classificacao})
+
+    def registrar_paginas(self, pdf_path: Path, paginas: list, registros: list):
+        if isinstance(pdf_path, PdfEmMemoria):
+            return
+        chave = self._chave(pdf_path)
+        for pagina, registro in zip(paginas, registros):
+            self._gravar({"tipo": "pagina", "chave": chave, "pagina": pagina, "registro": dict(registro)})
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def remover(self):
+        """Apaga o diário (lote concluído e saídas gravadas)."""
+        self.fechar()
+        self.caminho.unlink(missing_ok=True)
+
+    def _chave(self, pdf_path: Path) -> str:
+        pdf_path = Path(pdf_path)
+        if pdf_path not in self._chaves:
+            stat = pdf_path.stat()
+            self._chaves[pdf_path] = f"{pdf_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+        return self._chaves[pdf_path]
+
+    def _gravar(self, linha: dict):
+        self._arquivo.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+        self._arquivo.flush()
+
+    def _termina_com_quebra(self) -> bool:
+        with open(self.caminho, "rb") as f:
+            f.seek(-1, 2)
+            return f.read(1) == b"\n"
+
+    def _carregar(self, cabecalho: dict) -> bool:
+        """Lê as linhas do diário. Retorna False se não existir ou for incompatível."""
+        try:
+            f = open(self.caminho, encoding="utf-8")
+        except FileNotFoundError:
+            return False
+        with f:
+            try:
+                lido = json.loads(f.readline())
+            except json.JSONDecodeError:
+                lido = None
+            if lido != cabecalho:
+                if lido is not None:
+                    print(f"Diário de outra versão do extrator ou de outros campos descartado: {self.caminho}")
+                return False
+            for linha in f:
+                try:
+                    dados = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Linha cortada pela queda do processo
+                    continue
+                entrada = self.arquivos.setdefault(dados["chave"], {"classificacao": None, "registros": {}})
+                if dados["tipo"] == "classificacao":
+                    entrada["classificacao"] = dados["classificacao"]
+                elif dados["tipo"] == "pagina":
+                    entrada["registros"][dados["pagina"]] = registro_de_dict(dados["registro"])
+        return True
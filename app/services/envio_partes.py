@@ -0,0 +1,403 @@
+"""
+Upload retomável em partes, para lotes maiores que MAX_CONTENT_LENGTH.
+
+Protocolo (rotas em app/routes/api.py):
+    POST /api/envios                                cria a sessão: {"arquivos": [{"nome", "tamanho"}, ...]}
+    PUT  /api/envios/<id>/arquivos/<n>?offset=<b>   envia uma parte do arquivo n (corpo = bytes)
+    GET  /api/envios/<id>                           faixas recebidas e estado do processamento
+    POST /api/envios/<id>/finalizar                 monta os PDFs e inicia o processamento
+    GET  /api/envios/<id>/resultado                 XLSX, quando o processamento termina
+                                                    (também em /results/<chave>)
+
+Cada sessão é uma pasta na área temporária (`envio-<id>`). Cada parte é gravada
+em um arquivo próprio (`<offset>.parte`; reenviar a mesma parte a substitui) e
+as partes só são concatenadas na finalização, sem passar pela memória. Após
+uma queda, o cliente consulta as faixas recebidas e envia apenas o que falta.
+
+Na finalização, o lote roda em segundo plano no motor de lote, com diário na
+pasta da sessão: se o processo morrer, um novo POST de finalização retoma das
+páginas concluídas. O XLSX fica no armazém de resultados (ver `artefatos`):
+um lote idêntico já processado não é reprocessado. Sessões sem atividade por
+AREA_TEMPORARIA_IDADE_MAXIMA_S são apagadas pela coleta da área temporária;
+durante a finalização (montagem, hash, espera na admissão e lote), a trava da
+sessão a protege da coleta e a pasta é tocada periodicamente.
+"""
+
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from app.config import Config
+from app.services.admissao import obter_controle_admissao
+from app.services.artefatos import chave_artefato, obter_armazem_artefatos, versao_regras
+from app.services.batch_engine import processar_lote
+from app.services.diario import DiarioLote
+from app.services.manifesto import hash_arquivo
+from app.services.zip_pdfs import expandir_zips
+from app.services.excel_generator import gerar_excel, separar_registros
+from app.utils.area_temporaria import ARQUIVO_TRAVA, obter_area_temporaria, processo_vivo
+from app.utils.memoria import tarefa_em_segundo_plano
+from app.utils.tempos import registros_com_tempos
+from app.utils.validators import allowed_file
+
+# Estados do processamento de uma sessão
+RECEBENDO = "recebendo"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_BLOCO_COPIA = 1024 * 1024
+
+
+class ErroEnvio(ValueError):
+    """Requisição inválida para a sessão (ex: parte fora do arquivo, envio incompleto)."""
+
+
+def _mesclar_faixas(faixas: list) -> list:
+    """Une faixas [início, fim) sobrepostas ou contíguas."""
+    mescladas = []
+    for inicio, fim in sorted(faixas):
+        if mescladas and inicio <= mescladas[-1][1]:
+            mescladas[-1][1] = max(mescladas[-1][1], fim)
+        else:
+            mescladas.append([inicio, fim])
+    return mescladas
+
+
+def _gravar_json(caminho: Path, dados: dict):
+    temporario = caminho.with_name(f"{caminho.name}.tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, default=str)
+    os.replace(temporario, caminho)
+
+
+class SessaoEnvio:
+    """
+    Sessão de upload em partes.
+
+    Uso:
+        sessao = SessaoEnvio.criar([{"nome": "a.pdf", "tamanho": 123}])
+        sessao.receber_parte(0, 0, stream, 123)
+        sessao.finalizar()  # monta os PDFs e processa em segundo plano
+        sessao.estado()["status"]  # "processando" → "concluido"
+    """
+
+    def __init__(self, pasta: Path):
+        self.pasta = pasta
+        self.id = pasta.name.split("-", 1)[1]
+        with open(pasta / "sessao.json", encoding="utf-8") as f:
+            self.arquivos = json.load(f)["arquivos"]
+
+    @classmethod
+    def criar(cls, arquivos: list) -> "SessaoEnvio":
+        """
+        Args:
+            arquivos: [{"nome": "a.pdf", "tamanho": bytes}, ...]
+
+        Raises:
+            ErroEnvio: Lista vazia, nome sem extensão .pdf/.zip ou tamanho inválido
+            CotaExcedida: Se o lote não couber na área temporária
+        """
+        if not arquivos:
+            raise ErroEnvio("Nenhum arquivo informado")
+        normalizados = []
+        for idx, arquivo in enumerate(arquivos):
+            nome = str(arquivo.get("nome", ""))
+            tamanho = arquivo.get("tamanho")
+            if not allowed_file(nome):
+                raise ErroEnvio(f"Arquivo sem extensão .pdf ou .zip: {nome!r}")
+            if not isinstance(tamanho, int) or tamanho <= 0:
+                raise ErroEnvio(f"Tamanho inválido para {nome!r}")
+            # Trata o nome do arquivo para evitar problemas de segurança
+            normalizados.append({"nome": secure_filename(nome) or f"arquivo_{idx + 1}.pdf", "tamanho": tamanho})
+
+        area = obter_area_temporaria()
+        area.reservar(sum(a["tamanho"] for a in normalizados), arquivos=len(normalizados) * 2)
+        area.raiz.mkdir(parents=True, exist_ok=True)
+        pasta = area.raiz / f"envio-{secrets.token_urlsafe(18)}"
+        pasta.mkdir()
+        for idx in range(len(normalizados)):
+            (pasta / f"arquivo-{idx}").mkdir()
+        _gravar_json(pasta / "sessao.json", {"arquivos": normalizados, "criada_em": time.time()})
+        _gravar_json(pasta / "estado.json", {"status": RECEBENDO})
+        return cls(pasta)
+
+    @classmethod
+    def carregar(cls, id_sessao: str) -> Optional["SessaoEnvio"]:
+        """Sessão existente, ou None se o id for inválido ou a sessão não existir (ou expirou)."""
+        if not _ID_VALIDO.match(id_sessao or ""):
+            return None
+        pasta = obter_area_temporaria().raiz / f"envio-{id_sessao}"
+        if not (pasta / "sessao.json").is_file():
+            return None
+        return cls(pasta)
+
+    def receber_parte(self, indice: int, offset: int, stream, tamanho: int) -> dict:
+        """
+        Grava uma parte de um arquivo, lida do `stream` em blocos.
+
+        Args:
+            indice: Posição do arquivo na sessão
+            offset: Posição da parte no arquivo (bytes)
+            stream: Corpo da requisição
+            tamanho: Tamanho da parte (Content-Length)
+
+        Returns:
+            Progresso do arquivo (ver `progresso_arquivo`)
+
+        Raises:
+            ErroEnvio: Arquivo inexistente, parte fora do arquivo, grande demais
+                ou recebida incompleta
+        """
+        arquivo = self._arquivo(indice)
+        if self.estado()["status"] != RECEBENDO:
+            raise ErroEnvio("Sessão já finalizada")
+        limite = Config.ENVIO_TAMANHO_MAXIMO_PARTE_MB * 1024 * 1024
+        if tamanho <= 0 or tamanho > limite:
+            raise ErroEnvio(f"Parte deve ter entre 1 byte e {Config.ENVIO_TAMANHO_MAXIMO_PARTE_MB} MB")
+        if offset < 0 or offset + tamanho > arquivo["tamanho"]:
+            raise ErroEnvio(f"Parte fora do arquivo ({arquivo['tamanho']} bytes)")
+        obter_area_temporaria().reservar(tamanho)
+
+        destino = self.pasta / f"arquivo-{indice}" / f"{offset}.parte"
+        temporario = destino.with_name(f"{destino.name}.{secrets.token_hex(4)}.tmp")
+        recebidos = 0
+        try:
+            with open(temporario, "wb") as f:
+                while recebidos < tamanho:
+                    bloco = stream.read(min(_BLOCO_COPIA, tamanho - recebidos))
+                    if not bloco:
+                        break
+                    f.write(bloco)
+                    recebidos += len(bloco)
+            if recebidos != tamanho:
+                raise ErroEnvio(f"Parte incompleta: {recebidos} de {tamanho} bytes")
+            os.replace(temporario, destino)
+        finally:
+            temporario.unlink(missing_ok=True)
+        self._tocar()
+        return self.progresso_arquivo(indice)
+
+    def progresso_arquivo(self, indice: int) -> dict:
+        """Nome, tamanho, faixas [início, fim) recebidas e bytes recebidos de um arquivo."""
+        arquivo = self._arquivo(indice)
+        pasta = self.pasta / f"arquivo-{indice}"
+        montado = pasta / arquivo["nome"]
+        if self.estado()["status"] == CONCLUIDO:
+            # Concluída: o resultado está no armazém (os arquivos da sessão foram apagados)
+            faixas = [[0, arquivo["tamanho"]]]
+        elif montado.is_file():
+            faixas = [[0, montado.stat().st_size]]
+        else:
+            # Só o que está em disco: uma montagem interrompida mantém todas as partes
+            faixas = _mesclar_faixas([
+                [int(parte.stem), int(parte.stem) + parte.stat().st_size]
+                for parte in pasta.glob("*.parte")
+            ])
+        return {
+            "indice": indice,
+            "nome": arquivo["nome"],
+            "tamanho": arquivo["tamanho"],
+            "faixas": faixas,
+            "recebido": sum(fim - inicio for inicio, fim in faixas),
+        }
+
+    def estado(self) -> dict:
+        """Estado do processamento (status, mensagem, registros) e progresso dos arquivos."""
+        with open(self.pasta / "estado.json", encoding="utf-8") as f:
+            estado = json.load(f)
+        if estado["status"] == PROCESSANDO and not processo_vivo(estado.get("pid", 0)):
+            # Processo encerrado no meio do lote: nova finalização retoma do diário
+            estado = {"status": ERRO, "mensagem": "Processamento interrompido; finalize novamente para retomar"}
+        return estado
+
+    def resumo(self) -> dict:
+        return {
+            "id": self.id,
+            **self.estado(),
+            "arquivos": [self.progresso_arquivo(idx) for idx in range(len(self.arquivos))],
+        }
+
+    def finalizar(self) -> bool:
+        """
+        Monta os PDFs a partir das partes e inicia o processamento em segundo plano.
+
+        Returns:
+            False se a sessão já estiver sendo processada (ou concluída)
+
+        Raises:
+            ErroEnvio: Se algum arquivo não foi recebido por inteiro
+        """
+        for idx in range(len(self.arquivos)):
+            progresso = self.progresso_arquivo(idx)
+            if progresso["recebido"] != progresso["tamanho"]:
+                raise ErroEnvio(
+                    f"Arquivo {progresso['nome']} incompleto: {progresso['recebido']} de {progresso['tamanho']} bytes"
+                )
+        # Uma única finalização por vez, mesmo entre processos do gunicorn
+        trava = self.pasta / ARQUIVO_TRAVA
+        try:
+            descritor = os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                pid = int(trava.read_text() or 0)
+            except (OSError, ValueError):
+                pid = 0
+            if pid and processo_vivo(pid):
+                return False
+            # Trava de um processo encerrado: assume o processamento
+            trava.unlink(missing_ok=True)
+            return self.finalizar()
+        with os.fdopen(descritor, "w") as f:
+            f.write(str(os.getpid()))
+        if self.estado()["status"] == CONCLUIDO:
+            trava.unlink(missing_ok=True)
+            return False
+
+        _gravar_json(self.pasta / "estado.json", {"status": PROCESSANDO, "pid": os.getpid()})
+        threading.Thread(target=self._processar, name=f"envio-{self.id[:8]}", daemon=True).start()
+        return True
+
+    def _processar(self):
+        # O worker do gunicorn não é aposentado por memória durante o processamento
+        with tarefa_em_segundo_plano("envio"), self._manter_ativa():
+            self._processar_lote()
+
+    @contextmanager
+    def _manter_ativa(self):
+        """Toca a pasta da sessão periodicamente, para a coleta por idade (mesmo sem páginas concluídas)."""
+        idade_maxima = Config.AREA_TEMPORARIA_IDADE_MAXIMA_S
+        if not idade_maxima:
+            yield
+            return
+        parar = threading.Event()
+
+        def tocar():
+            while not parar.wait(max(1.0, idade_maxima / 4)):
+                self._tocar()
+
+        thread = threading.Thread(target=tocar, name=f"envio-tocar-{self.id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            parar.set()
+            thread.join()
+
+    def _processar_lote(self):
+        try:
+            pdf_paths = [self._montar(idx) for idx in range(len(self.arquivos))]
+            chave = chave_artefato(
+                "xlsx",
+                [(pdf_path.name, hash_arquivo(pdf_path)) for pdf_path in pdf_paths],
+                regras=versao_regras(),
+            )
+            # Número de registros, quando o lote é processado aqui (e não reaproveitado)
+            registros = []
+
+            def gerar(destino):
+                quantidade, completo = self._gerar(pdf_paths, destino)
+                registros.append(quantidade)
+                return completo
+
+            # Lote com falhas: o resultado fica com uma chave avulsa (caminho.stem)
+            caminho, gerado = obter_armazem_artefatos().obter(chave, "xlsx", gerar)
+            # Só o estado fica na sessão (o resultado está no armazém)
+            for idx in range(len(self.arquivos)):
+                shutil.rmtree(self.pasta / f"arquivo-{idx}", ignore_errors=True)
+            estado = {"status": CONCLUIDO, "chave": caminho.stem, "reaproveitado": not gerado}
+            if registros:
+                estado["registros"] = registros[0]
+            _gravar_json(self.pasta / "estado.json", estado)
+        except Exception as e:
+            _gravar_json(self.pasta / "estado.json", {"status": ERRO, "mensagem": str(e)})
+        finally:
+            (self.pasta / ARQUIVO_TRAVA).unlink(missing_ok=True)
+
+    def _gerar(self, pdf_paths: list, destino: Path) -> Tuple[int, bool]:
+        """
+        Processa o lote (com diário na sessão) e gera o XLSX em `destino`.
+
+        Returns:
+            Tupla (número de registros, False se algum PDF teve falha no processamento)
+        """
+        arquivos_com_erro = []
+        diario = DiarioLote(self.pasta / "diario.jsonl")
+        diario.abrir()
+        try:
+            # Os .zip são trocados pelos PDFs que contêm (membros grandes vão para a sessão).
+            # Em segundo plano, o OCR aguarda na fila de admissão sem limite (não há 503)
+            with obter_controle_admissao().lote(esperar=True) as admissao:
+                registros = processar_lote(
+                    expandir_zips(pdf_paths, self.pasta), diario=diario, admissao=admissao,
+                    ao_finalizar_arquivo=lambda pdf, regs, erro: erro and arquivos_com_erro.append(pdf),
+                )
+        finally:
+            diario.fechar()
+
+        # Separa registros por aba baseado no código e coleta erros
+        registros_servidor, registros_patronal, todos_erros = separar_registros(registros)
+
+        gerar_excel(
+            registros_servidor, registros_patronal, todos_erros, destino,
+            registros_com_tempos(registros),
+        )
+        diario.remover()
+        return len(registros), not arquivos_com_erro
+
+    def _montar(self, indice: int) -> Path:
+        """
+        Concatena as partes do arquivo. As partes só são apagadas depois que o
+        arquivo montado está no lugar: se o processo morrer no meio, a próxima
+        finalização monta de novo a partir de todas elas.
+        """
+        arquivo = self.arquivos[indice]
+        pasta = self.pasta / f"arquivo-{indice}"
+        destino = pasta / arquivo["nome"]
+        if destino.is_file():
+            return destino
+        temporario = pasta / f"{arquivo['nome']}.montando"
+        partes = sorted(pasta.glob("*.parte"), key=lambda p: int(p.stem))
+        posicao = 0
+        try:
+            with open(temporario, "wb") as saida:
+                for parte in partes:
+                    inicio = int(parte.stem)
+                    if inicio > posicao:
+                        break
+                    with open(parte, "rb") as entrada:
+                        # Partes sobrepostas: pula o trecho já copiado
+                        entrada.seek(max(0, posicao - inicio))
+                        shutil.copyfileobj(entrada, saida, _BLOCO_COPIA)
+                    posicao = max(posicao, inicio + parte.stat().st_size)
+                    self._tocar()
+            if posicao != arquivo["tamanho"]:
+                raise ErroEnvio(f"Arquivo {arquivo['nome']} incompleto: {posicao} de {arquivo['tamanho']} bytes")
+            os.replace(temporario, destino)
+        finally:
+            temporario.unlink(missing_ok=True)
+        for parte in partes:
+            parte.unlink(missing_ok=True)
+        return destino
+
+    def _arquivo(self, indice: int) -> dict:
+        if not 0 <= indice < len(self.arquivos):
+            raise ErroEnvio(f"Arquivo {indice} não existe na sessão")
+        return self.arquivos[indice]
+
+    def _tocar(self):
+        # Mantém a sessão ativa para a coleta por idade da área temporária
+        try:
+            os.utime(self.pasta)
+        except FileNotFoundError:
+            pass
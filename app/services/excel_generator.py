@@ -5,8 +5,7 @@ Centraliza a lógica de formatação de registros e geração de arquivos Excel
 com múltiplas abas (servidor, patronal-gilrat, erros).
 """
 
-from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import pandas as pd
 
@@ -20,145 +19,202 @@ from app.utils.formatters import (
     limpar_data,
 )
 from app.utils.errors import coletar_erros_registro, formatar_linha_erro
+from app.utils.rastreamento import span
+from app.utils.tempos import ETAPAS
 try:
     # Tenta usar a versão direta (sem Flask) primeiro
-    from app.database.direct import get_uo_por_cnpj
+    from app.database.direct import get_aba_por_codigo, get_uo_por_cnpj
 except ImportError:
     # Fallback para versão Flask (compatibilidade)
-    from app.database import get_uo_por_cnpj
+    from app.database import get_aba_por_codigo, get_uo_por_cnpj
 
 
-def formatar_linha_patronal_gilrat(registro: dict) -> dict:
+# Colunas das abas "servidor" e "patronal-gilrat", na ordem
+COLUNAS_SERVIDOR = (
+    "Arquivo",
+    "Informe o Credor",
+    "Leitora Otica",
+    "Selecione com 'X'",
+    "Selecione a GUIA para Pagamento",
+    "Mes/Ano de Competencia:",
+    "UO Contribuinte",
+    "GMI FP",
+    "Ordenador Despesa",
+    "Nr Docto DARF",
+    "Codigo de Barra",
+    "Valor Total do Documento",
+    "Data Pagamento Prevista",
+    "Historico de Referencia",
+)
+COLUNAS_PATRONAL_GILRAT = (
+    "Arquivo",
+    "Informe o Credor",
+    "Leitora Otica",
+    "Selecione com 'X'",
+    "Selecione a GUIA para Pagamento",
+    "Ano/Nr. Folha",
+    "UO Contribuinte",
+    "Ordenador Despesa",
+    "Nr Docto DARF",
+    "Codigo de Barra",
+    "Valor Total do Documento",
+    "Data Pagamento Prevista",
+    "Historico de Referencia",
+)
+COLUNAS_ERROS = ("Arquivo", "Campo", "Tipo de Erro", "Mensagem", "Valor Extraído", "Severidade")
+
+CREDOR = limpar_cnpj("29.979.036/0001-40")
+ORDENADOR_DESPESA = "m1127166"
+
+
+def _dados_pagamento(registro) -> tuple:
+    """Valores comuns às duas abas: arquivo, UO, documento, código de barras, valor e data de pagamento."""
+    cnpj = registro.get("cnpj", "") or ""
+    return (
+        registro.get("arquivo", "") or "",
+        get_uo_por_cnpj(cnpj) or "",
+        extrair_apenas_numeros(registro.get("numero_documento", "") or ""),
+        extrair_apenas_numeros(registro.get("linha_digitavel", "") or ""),
+        limpar_valor_monetario(registro.get("valor_total_documento", "") or ""),
+        limpar_data(calcular_data_menos_um_dia(registro.get("data_vencimento", "") or "")),
+    )
+
+
+def linha_patronal_gilrat(registro, mes_comp: str = None) -> tuple:
     """
-    Formata um registro para a aba "patronal-gilrat".
+    Linha da aba "patronal-gilrat" (valores na ordem de COLUNAS_PATRONAL_GILRAT).
     
     Args:
-        registro: Dicionário com campos extraídos do PDF
-        
-    Returns:
-        Dicionário com colunas formatadas para a aba patronal-gilrat
+        registro: Registro extraído do PDF (RegistroDarf ou dict)
+        mes_comp: Mês de competência do histórico (padrão: calcular_mes_anterior())
     """
-    arquivo = registro.get("arquivo", "") or ""
-    cnpj = registro.get("cnpj", "") or ""
-    numero_doc = registro.get("numero_documento", "") or ""
-    linha_dig = registro.get("linha_digitavel", "") or ""
-    valor_total = registro.get("valor_total_documento", "") or ""
-    data_venc = registro.get("data_vencimento", "") or ""
+    arquivo, uo, nr_doc, codigo_barras, valor, data_pagamento = _dados_pagamento(registro)
+    mes_comp = mes_comp or calcular_mes_anterior()
+    return (
+        arquivo, CREDOR, "n", "Patronal (GPS/DARF)", "DARF", "", uo, ORDENADOR_DESPESA,
+        nr_doc, codigo_barras, valor, data_pagamento, f"Folha INSS {mes_comp}",
+    )
+
+
+def linha_servidor(registro, mes_comp: str = None) -> tuple:
+    """
+    Linha da aba "servidor" (valores na ordem de COLUNAS_SERVIDOR).
     
-    uo_contribuinte = get_uo_por_cnpj(cnpj) or ""
-    nr_doc_numeros = extrair_apenas_numeros(numero_doc)
-    codigo_barras_numeros = extrair_apenas_numeros(linha_dig)
-    data_pagamento = calcular_data_menos_um_dia(data_venc)
-    mes_comp = calcular_mes_anterior()
-    historico = f"Folha INSS {mes_comp}"
+    Args:
+        registro: Registro extraído do PDF (RegistroDarf ou dict)
+        mes_comp: Mês de competência do histórico (padrão: calcular_mes_anterior())
+    """
+    arquivo, uo, nr_doc, codigo_barras, valor, data_pagamento = _dados_pagamento(registro)
+    mes_comp = mes_comp or calcular_mes_anterior()
+    return (
+        arquivo, CREDOR, "n", "Consignacao (GPS/DARF)", "DARF", limpar_mes_ano(mes_comp), uo, "",
+        ORDENADOR_DESPESA, nr_doc, codigo_barras, valor, data_pagamento, f"Folha INSS {mes_comp}",
+    )
+
+
+def separar_registros(registros) -> tuple:
+    """
+    Separa os registros nas abas pelo código (regras código → aba) e coleta os erros.
     
-    return {
-        "Arquivo": arquivo,
-        "Informe o Credor": limpar_cnpj("29.979.036/0001-40"),
-        "Leitora Otica": "n",
-        "Selecione com 'X'": "Patronal (GPS/DARF)",
-        "Selecione a GUIA para Pagamento": "DARF",
-        "Ano/Nr. Folha": "",
-        "UO Contribuinte": uo_contribuinte,
-        "Ordenador Despesa": "m1127166",
-        "Nr Docto DARF": nr_doc_numeros,
-        "Codigo de Barra": codigo_barras_numeros,
-        "Valor Total do Documento": limpar_valor_monetario(valor_total),
-        "Data Pagamento Prevista": limpar_data(data_pagamento),
-        "Historico de Referencia": historico,
-    }
+    Args:
+        registros: Registros extraídos (RegistroDarf ou dict)
+    
+    Returns:
+        Tupla (linhas servidor, linhas patronal-gilrat, erros): as linhas são
+        tuplas na ordem de COLUNAS_SERVIDOR / COLUNAS_PATRONAL_GILRAT, prontas
+        para gerar_excel. Registros sem aba ficam de fora.
+    """
+    linhas_servidor = []
+    linhas_patronal = []
+    todos_erros = []
+    mes_comp = calcular_mes_anterior()
+    for registro in registros:
+        todos_erros.extend(coletar_erros_registro(registro))
+        aba = get_aba_por_codigo(registro.get("codigo", ""))
+        if aba == "servidor":
+            linhas_servidor.append(linha_servidor(registro, mes_comp))
+        elif aba == "patronal-gilrat":
+            linhas_patronal.append(linha_patronal_gilrat(registro, mes_comp))
+    return linhas_servidor, linhas_patronal, todos_erros
 
 
-def formatar_linha_servidor(registro: dict) -> dict:
+def formatar_linha_tempos(registro: dict) -> dict:
     """
-    Formata um registro para a aba "servidor".
+    Formata os tempos de um registro (chave "tempos", ver app.utils.tempos) para a aba "tempos".
     
     Args:
         registro: Dicionário com campos extraídos do PDF
         
     Returns:
-        Dicionário com colunas formatadas para a aba servidor
+        Dicionário com o caminho seguido e a duração (ms) de cada etapa
     """
-    arquivo = registro.get("arquivo", "") or ""
-    cnpj = registro.get("cnpj", "") or ""
-    numero_doc = registro.get("numero_documento", "") or ""
-    linha_dig = registro.get("linha_digitavel", "") or ""
-    valor_total = registro.get("valor_total_documento", "") or ""
-    data_venc = registro.get("data_vencimento", "") or ""
+    tempos = registro.get("tempos") or {}
+    etapas_ms = tempos.get("etapas_ms") or {}
+    cache = tempos.get("cache")
     
-    uo_contribuinte = get_uo_por_cnpj(cnpj) or ""
-    nr_doc_numeros = extrair_apenas_numeros(numero_doc)
-    codigo_barras_numeros = extrair_apenas_numeros(linha_dig)
-    data_pagamento = calcular_data_menos_um_dia(data_venc)
-    mes_comp = calcular_mes_anterior()
-    historico = f"Folha INSS {mes_comp}"
-    
-    return {
-        "Arquivo": arquivo,
-        "Informe o Credor": limpar_cnpj("29.979.036/0001-40"),
-        "Leitora Otica": "n",
-        "Selecione com 'X'": "Consignacao (GPS/DARF)",
-        "Selecione a GUIA para Pagamento": "DARF",
-        "Mes/Ano de Competencia:": limpar_mes_ano(mes_comp),
-        "UO Contribuinte": uo_contribuinte,
-        "GMI FP": "",
-        "Ordenador Despesa": "m1127166",
-        "Nr Docto DARF": nr_doc_numeros,
-        "Codigo de Barra": codigo_barras_numeros,
-        "Valor Total do Documento": limpar_valor_monetario(valor_total),
-        "Data Pagamento Prevista": limpar_data(data_pagamento),
-        "Historico de Referencia": historico,
+    linha = {
+        "Arquivo": registro.get("arquivo", "") or "",
+        "Caminho": tempos.get("caminho") or "",
+        "DPI": tempos.get("dpi") or "",
+        "Leitura Antecipada": "" if cache is None else ("sim" if cache else "não"),
+        "Total (ms)": tempos.get("total_ms", ""),
     }
+    for etapa in ETAPAS:
+        linha[f"{etapa} (ms)"] = etapas_ms.get(etapa, "")
+    return linha
 
 
 def gerar_excel(
-    registros_servidor: List[dict],
-    registros_patronal: List[dict],
+    registros_servidor: List[tuple],
+    registros_patronal: List[tuple],
     todos_erros: List[dict],
-    output_path: Path,
-) -> Path:
+    output_path,
+    registros_tempos: Optional[List[dict]] = None,
+):
     """
     Gera arquivo Excel com múltiplas abas a partir dos registros processados.
     
     Sempre cria as três abas (servidor, patronal-gilrat, erros), mesmo que vazias.
     
     Args:
-        registros_servidor: Lista de registros formatados para aba servidor
-        registros_patronal: Lista de registros formatados para aba patronal-gilrat
+        registros_servidor: Linhas da aba servidor (tuplas de linha_servidor)
+        registros_patronal: Linhas da aba patronal-gilrat (tuplas de linha_patronal_gilrat)
         todos_erros: Lista de erros formatados para aba erros
-        output_path: Caminho onde o arquivo Excel será salvo
+        output_path: Caminho onde o arquivo Excel será salvo (ou buffer, ex: BytesIO)
+        registros_tempos: Registros com a chave "tempos" (MEDIR_TEMPOS=1). Se
+            informado, cria também a aba "tempos".
         
     Returns:
-        Caminho do arquivo Excel gerado
+        `output_path` (caminho ou buffer do arquivo Excel gerado)
     """
     with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
         # Aba servidor (sempre criada, mesmo que vazia)
-        if registros_servidor:
-            df_servidor = pd.DataFrame(registros_servidor)
+        with span("escrever_aba", aba="servidor", linhas=len(registros_servidor)):
+            # Vazia: só os cabeçalhos
+            df_servidor = pd.DataFrame(registros_servidor or None, columns=COLUNAS_SERVIDOR)
             df_servidor.to_excel(writer, sheet_name="servidor", index=False)
-        else:
-            # Cria aba vazia com cabeçalhos
-            df_vazio_servidor = pd.DataFrame(columns=formatar_linha_servidor({}).keys())
-            df_vazio_servidor.to_excel(writer, sheet_name="servidor", index=False)
         
         # Aba patronal-gilrat (sempre criada, mesmo que vazia)
-        if registros_patronal:
-            df_patronal = pd.DataFrame(registros_patronal)
+        with span("escrever_aba", aba="patronal-gilrat", linhas=len(registros_patronal)):
+            df_patronal = pd.DataFrame(registros_patronal or None, columns=COLUNAS_PATRONAL_GILRAT)
             df_patronal.to_excel(writer, sheet_name="patronal-gilrat", index=False)
-        else:
-            # Cria aba vazia com cabeçalhos
-            df_vazio_patronal = pd.DataFrame(columns=formatar_linha_patronal_gilrat({}).keys())
-            df_vazio_patronal.to_excel(writer, sheet_name="patronal-gilrat", index=False)
         
         # Aba erros (sempre criada, mesmo que vazia)
-        if todos_erros:
-            erros_formatados = [formatar_linha_erro(erro) for erro in todos_erros]
-            df_erros = pd.DataFrame(erros_formatados)
-            df_erros.to_excel(writer, sheet_name="erros", index=False)
-        else:
-            # Cria aba vazia com cabeçalhos
-            df_vazio_erros = pd.DataFrame(columns=["Arquivo", "Campo", "Tipo de Erro", "Mensagem", "Valor Extraído", "Severidade"])
-            df_vazio_erros.to_excel(writer, sheet_name="erros", index=False)
+        with span("escrever_aba", aba="erros", linhas=len(todos_erros)):
+            if todos_erros:
+                erros_formatados = [formatar_linha_erro(erro) for erro in todos_erros]
+                df_erros = pd.DataFrame(erros_formatados)
+                df_erros.to_excel(writer, sheet_name="erros", index=False)
+            else:
+                # Cria aba vazia com cabeçalhos
+                df_vazio_erros = pd.DataFrame(columns=COLUNAS_ERROS)
+                df_vazio_erros.to_excel(writer, sheet_name="erros", index=False)
+        
+        # Aba tempos (opcional)
+        if registros_tempos is not None:
+            linhas_tempos = [formatar_linha_tempos(registro) for registro in registros_tempos]
+            df_tempos = pd.DataFrame(linhas_tempos, columns=formatar_linha_tempos({}).keys())
+            df_tempos.to_excel(writer, sheet_name="tempos", index=False)
     
     return output_path
 
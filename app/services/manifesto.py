@@ -0,0 +1,142 @@
+"""
+Manifesto do processamento incremental de uma pasta (`processar_pasta`).
+
+Salvo ao lado das saídas, guarda para cada PDF já processado o tamanho, a data
+de modificação, o hash do conteúdo, a versão do extrator e os registros
+extraídos. Na execução seguinte, só os PDFs novos ou alterados são processados;
+os demais reaproveitam os registros do manifesto.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+# Formato do arquivo de manifesto
+VERSAO_MANIFESTO = 1
+
+
+def caminho_manifesto(output_csv: Path) -> Path:
+    """Manifesto de uma saída (ex: resultado_darfs.csv → resultado_darfs.manifesto.json)."""
+    return output_csv.with_name(f"{output_csv.stem}.manifesto.json")
+
+
+def hash_arquivo(caminho: Path, tamanho_bloco: int = 1024 * 1024) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class Manifesto:
+    """
+    PDFs já processados de uma pasta e seus registros.
+
+    Uso:
+        manifesto = Manifesto.carregar(caminho, VERSAO_PARSER, campos)
+        registros = manifesto.verificar(pdf)  # None se novo ou alterado
+        ...
+        manifesto.atualizar(pdf, registros_novos)
+        manifesto.salvar()
+    """
+
+    def __init__(self, caminho: Path, versao_parser: str, campos):
+        self.caminho = caminho
+        self.versao_parser = versao_parser
+        self.campos = list(campos)
+        self.arquivos: dict = {}
+        # Hashes calculados nesta execução (evita ler o PDF duas vezes)
+        self._hashes: dict = {}
+
+    @classmethod
+    def carregar(cls, caminho: Path, versao_parser: str, campos) -> "Manifesto":
+        """
+        Lê o manifesto existente. Se não existir, estiver corrompido ou tiver
+        sido gerado com outra versão do extrator ou outros campos, começa vazio
+        (todos os PDFs são reprocessados).
+        """
+        manifesto = cls(caminho, versao_parser, campos)
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            return manifesto
+        except (OSError, ValueError) as e:
+            print(f"Manifesto ignorado ({caminho.name}): {e}")
+            return manifesto
+
+        if (
+            dados.get("versao") != VERSAO_MANIFESTO
+            or dados.get("versao_parser") != versao_parser
+            or dados.get("campos") != manifesto.campos
+        ):
+            print("Manifesto de outra versão do extrator ou de outros campos: reprocessando todos os PDFs.")
+            return manifesto
+        manifesto.arquivos = dados.get("arquivos", {})
+        return manifesto
+
+    def verificar(self, pdf_path: Path) -> Optional[list]:
+        """
+        Returns:
+            Registros do PDF se ele não mudou desde o último processamento,
+            ou None se for novo ou alterado.
+        """
+        entrada = self.arquivos.get(pdf_path.name)
+        if entrada is None:
+            return None
+        stat = pdf_path.stat()
+        if entrada["tamanho"] == stat.st_size and entrada["mtime_ns"] == stat.st_mtime_ns:
+            return entrada["registros"]
+        if entrada["tamanho"] != stat.st_size:
+            return None
+        # Mesmo tamanho, data diferente (ex: copiado de novo): compara o conteúdo
+        if self._hash(pdf_path) != entrada["sha256"]:
+            return None
+        entrada["mtime_ns"] = stat.st_mtime_ns
+        return entrada["registros"]
+
+    def atualizar(self, pdf_path: Path, registros: list):
+        """Registra um PDF processado com sucesso e seus registros."""
+        stat = pdf_path.stat()
+        self.arquivos[pdf_path.name] = {
+            "caminho": str(pdf_path),
+            "tamanho": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": self._hash(pdf_path),
+            "versao_parser": self.versao_parser,
+            # Os tempos por etapa valem só para a execução em que foram medidos
+            "registros": [{k: v for k, v in r.items() if k != "tempos"} for r in registros],
+        }
+
+    def remover_ausentes(self, nomes) -> list:
+        """Remove os PDFs que não estão mais na pasta. Retorna os nomes removidos."""
+        nomes = set(nomes)
+        removidos = [nome for nome in self.arquivos if nome not in nomes]
+        for nome in removidos:
+            del self.arquivos[nome]
+        return removidos
+
+    def salvar(self):
+        """Grava o manifesto (arquivo temporário + rename, para não corromper o anterior)."""
+        temporario = self.caminho.with_name(f"{self.caminho.name}.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "versao": VERSAO_MANIFESTO,
+                    "versao_parser": self.versao_parser,
+                    "campos": self.campos,
+                    "arquivos": self.arquivos,
+                },
+                f,
+                ensure_ascii=False,
+                default=str,
+            )
+        os.replace(temporario, self.caminho)
+
+    def _hash(self, pdf_path: Path) -> str:
+        if pdf_path.name not in self._hashes:
+            self._hashes[pdf_path.name] = hash_arquivo(pdf_path)
+        return self._hashes[pdf_path.name]
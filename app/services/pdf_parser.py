@@ -1,14 +1,35 @@
 import re
 import sys
 import os
+import queue
+import threading
+import time
+from collections.abc import Mapping
 from pathlib import Path
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation
-from typing import Optional
+from io import BytesIO
+from typing import Callable, Iterator, Optional
 
 import pdfplumber
 import pandas as pd
 
+from app.utils.tempos import (
+    CAMINHO_NATIVO,
+    CAMINHO_OCR,
+    CAMINHO_OCR_FALLBACK,
+    CRONOMETRO_INATIVO,
+    criar_cronometro,
+    registros_com_tempos,
+)
+from app.utils.rastreamento import RASTREAR, registrar_span, span
+from app.utils.metricas import (
+    registrar_extracao_nativa,
+    registrar_falhas_campos,
+    registrar_ocr,
+    registrar_pagina,
+)
+
 
 # ==========================
 # REGEX BÁSICOS E CONSTANTES
@@ -26,6 +47,22 @@ LINHA_DIGITAVEL_REGEX = re.compile(
 # Configurações de OCR
 TEXTO_MINIMO_PARA_VALIDO = 100
 OCR_RESOLUCAO_DPI = 400
+# Resolução da nova tentativa de uma página cujo OCR falhou (ex: falta de memória)
+OCR_RESOLUCAO_DPI_REPETICAO = 300
+# Páginas escaneadas renderizadas à frente do OCR (0 = sem leitura antecipada)
+OCR_LEITURA_ANTECIPADA = int(os.getenv("OCR_LEITURA_ANTECIPADA", "2"))
+
+# Objetos do PDF (fontes, conteúdo das páginas) mantidos em cache pelo pdfminer
+# enquanto o documento está aberto; acima disso, o cache é esvaziado (ver liberar_pagina)
+PDF_CACHE_OBJETOS_MAXIMO = 2000
+
+# Classificação de páginas (antes da extração)
+PAGINA_NATIVA = "nativa"
+PAGINA_ESCANEADA = "escaneada"
+PAGINA_VAZIA = "vazia"
+CLASSIFICACAO_RESOLUCAO_DPI = 18
+# Desvio padrão máximo (tons de cinza) da renderização em baixa resolução de uma página em branco
+CLASSIFICACAO_DESVIO_MAXIMO_VAZIA = 4.0
 
 
 # ==========================
@@ -139,6 +176,11 @@ def _obter_ocr_reader():
     return _ocr_reader
 
 
+def aquecer_ocr() -> bool:
+    """Carrega o OCR no processo atual (ex: workers do modo contínuo). Retorna se está disponível."""
+    return bool(_obter_ocr_reader())
+
+
 def extrair_texto_com_ocr(imagem_pil):
     """
     Extrai texto de uma imagem usando RapidOCR.
@@ -156,7 +198,17 @@ def extrair_texto_com_ocr(imagem_pil):
     try:
         # RapidOCR retorna lista de tuplas: [(bbox, text, confidence), ...]
         # O retorno pode ser uma tupla (result, elapsed_time) ou apenas a lista
+        inicio = time.perf_counter()
+        inicio_relogio = time.time()
         ocr_result = reader(imagem_pil)
+        registrar_ocr(time.perf_counter() - inicio)
+        
+        if RASTREAR and isinstance(ocr_result, tuple) and len(ocr_result) > 1:
+            # RapidOCR informa a duração de cada etapa: detecção, classificação e reconhecimento
+            deslocamento = 0.0
+            for nome, duracao in zip(("ocr.det", "ocr.cls", "ocr.rec"), ocr_result[1] or ()):
+                registrar_span(nome, inicio_relogio + deslocamento, duracao)
+                deslocamento += duracao
         
         # Tratar diferentes formatos de retorno
         if isinstance(ocr_result, tuple):
@@ -190,13 +242,165 @@ def extrair_texto_com_ocr(imagem_pil):
         return ""
 
 
+class PdfEmMemoria:
+    """
+    PDF mantido em memória (ex: upload), aceito no lugar de um caminho pelas
+    funções de extração e pelo motor de lote.
+
+    O atributo `name` (como em Path) é usado na coluna "arquivo" dos registros.
+
+    Os dados ficam em `bytes`, que vão por pickle aos processos do motor de
+    lote (um memoryview não iria). Sem cópia no CPython: `getvalue()` de um
+    BytesIO sem views abertas (getbuffer) entrega o próprio buffer interno, e o
+    BytesIO criado na leitura compartilha os bytes. Não escreva mais no BytesIO
+    entregue; `bytes(dados)` só copia entradas que não sejam bytes.
+    """
+
+    __slots__ = ("name", "dados")
+
+    def __init__(self, name: str, dados):
+        self.name = name
+        # Aceita bytes ou um BytesIO (já completo)
+        self.dados = dados.getvalue() if isinstance(dados, BytesIO) else bytes(dados)
+
+    def __repr__(self):
+        return f"PdfEmMemoria({self.name!r}, {len(self.dados)} bytes)"
+
+
+def abrir_pdf(pdf_path, paginas=None):
+    """
+    Abre com o pdfplumber um caminho ou um PdfEmMemoria.
+
+    Args:
+        pdf_path: Caminho do PDF ou PdfEmMemoria
+        paginas: Números das páginas (1-indexed) a carregar em `pdf.pages` (None = todas)
+    """
+    if isinstance(pdf_path, PdfEmMemoria):
+        return pdfplumber.open(BytesIO(pdf_path.dados), pages=paginas)
+    return pdfplumber.open(str(pdf_path), pages=paginas)
+
+
+def liberar_pagina(pdf, page):
+    """
+    Libera os objetos de layout de uma página já processada e, acima de
+    PDF_CACHE_OBJETOS_MAXIMO, o cache de objetos do documento (o pdfminer relê
+    do arquivo o que for pedido de novo). Assim, percorrer um PDF inteiro usa
+    memória constante, e não proporcional ao número de páginas.
+    """
+    page.close()
+    cache = getattr(pdf.doc, "_cached_objs", None)
+    if cache is not None and len(cache) > PDF_CACHE_OBJETOS_MAXIMO:
+        cache.clear()
+
+
 def obter_total_paginas(pdf_path: Path) -> int:
     """Retorna o número total de páginas do PDF."""
-    with pdfplumber.open(str(pdf_path)) as pdf:
+    with abrir_pdf(pdf_path) as pdf:
         return len(pdf.pages) if pdf.pages else 0
 
 
-def carregar_texto_pdf(pdf_path: Path, numero_pagina: int = None):
+def _cobertura_imagens(page) -> float:
+    """Retorna a fração da área da página coberta por imagens (XObjects de imagem)."""
+    area_pagina = float(page.width * page.height) or 1.0
+    area = 0.0
+    for img in page.images:
+        x0 = max(img["x0"], 0)
+        x1 = min(img["x1"], page.width)
+        top = max(img["top"], 0)
+        bottom = min(img["bottom"], page.height)
+        if x1 > x0 and bottom > top:
+            area += float((x1 - x0) * (bottom - top))
+    return min(area / area_pagina, 1.0)
+
+
+def classificar_pagina(page) -> dict:
+    """
+    Classifica uma página (pdfplumber) como nativa, escaneada ou vazia, sem
+    extrair o texto nem renderizar em alta resolução.
+    
+    - nativa: tem caracteres suficientes na camada de texto
+    - vazia: sem texto e sem conteúdo visível (renderização em baixa resolução uniforme)
+    - escaneada: sem texto suficiente, mas com conteúdo visível (precisa de OCR)
+    
+    Args:
+        page: Página do pdfplumber
+    
+    Returns:
+        Dicionário com "pagina" (1-indexed), "tipo", "caracteres" e "cobertura_imagem".
+    """
+    caracteres = sum(1 for c in page.chars if not c["text"].isspace())
+    cobertura = _cobertura_imagens(page)
+    info = {
+        "pagina": page.page_number,
+        "tipo": PAGINA_NATIVA,
+        "caracteres": caracteres,
+        "cobertura_imagem": round(cobertura, 3),
+    }
+    
+    if caracteres >= TEXTO_MINIMO_PARA_VALIDO:
+        return info
+    
+    # Sem texto, sem imagens e sem desenhos: não há o que ler
+    if caracteres == 0 and not page.images and not (page.rects or page.lines or page.curves):
+        info["tipo"] = PAGINA_VAZIA
+        return info
+    
+    # Renderização em baixa resolução: páginas em branco (inclusive escaneadas) são uniformes
+    try:
+        from PIL import ImageStat
+        
+        imagem = page.to_image(resolution=CLASSIFICACAO_RESOLUCAO_DPI).original.convert("L")
+        desvio = ImageStat.Stat(imagem).stddev[0]
+    except Exception as e:
+        print(f"Erro ao classificar página: {e}", file=sys.stderr)
+        desvio = None
+    
+    if desvio is not None and desvio <= CLASSIFICACAO_DESVIO_MAXIMO_VAZIA:
+        info["tipo"] = PAGINA_VAZIA
+    else:
+        info["tipo"] = PAGINA_ESCANEADA
+    return info
+
+
+def classificar_paginas_pdf(pdf_path: Path, ao_iniciar_pagina: Optional[Callable[[int], None]] = None) -> list[dict]:
+    """
+    Classifica todas as páginas de um PDF abrindo o arquivo uma única vez.
+    
+    Args:
+        pdf_path: Caminho do arquivo PDF
+        ao_iniciar_pagina: Chamado com o número de cada página antes de classificá-la
+            (ex: o motor de lote mede o tempo por página)
+    
+    Returns:
+        Lista de dicionários (um por página, na ordem) com "pagina" (1-indexed),
+        "tipo", "caracteres" e "cobertura_imagem".
+    """
+    classificacoes = []
+    with span("classificar", arquivo=pdf_path.name), abrir_pdf(pdf_path) as pdf:
+        for page in pdf.pages:
+            if ao_iniciar_pagina:
+                ao_iniciar_pagina(page.page_number)
+            classificacoes.append(classificar_pagina(page))
+            liberar_pagina(pdf, page)
+    return classificacoes
+
+
+def resumir_classificacao(classificacoes: list[dict]) -> dict:
+    """
+    Agrupa as páginas classificadas por destino.
+    
+    Returns:
+        Dicionário com as listas de páginas "nativas", "ocr" e "ignoradas".
+    """
+    return {
+        "nativas": [c["pagina"] for c in classificacoes if c["tipo"] == PAGINA_NATIVA],
+        "ocr": [c["pagina"] for c in classificacoes if c["tipo"] == PAGINA_ESCANEADA],
+        "ignoradas": [c["pagina"] for c in classificacoes if c["tipo"] == PAGINA_VAZIA],
+    }
+
+
+def carregar_texto_pdf(pdf_path: Path, numero_pagina: int = None, tipo_pagina: str = None,
+                       cronometro=CRONOMETRO_INATIVO):
     """
     Extrai o texto completo de uma página específica do PDF.
     Usa extração de texto nativo primeiro; se o texto extraído for insuficiente
@@ -205,11 +409,19 @@ def carregar_texto_pdf(pdf_path: Path, numero_pagina: int = None):
     Args:
         pdf_path: Caminho do arquivo PDF
         numero_pagina: Número da página (1-indexed). Se None, usa a primeira página.
+        tipo_pagina: Classificação prévia da página (ver classificar_pagina). Páginas
+            vazias retornam texto vazio e páginas escaneadas vão direto para o OCR.
+        cronometro: Registra o tempo de cada etapa e o caminho seguido (ver app.utils.tempos)
     
     Returns:
         Texto completo da página normalizado (nativo ou extraído via OCR).
     """
-    with pdfplumber.open(str(pdf_path)) as pdf:
+    if tipo_pagina == PAGINA_VAZIA:
+        return ""
+    
+    with cronometro.etapa("abrir_pdf"):
+        pdf = abrir_pdf(pdf_path)
+    with pdf:
         if not pdf.pages:
             return ""
         
@@ -220,31 +432,228 @@ def carregar_texto_pdf(pdf_path: Path, numero_pagina: int = None):
             if idx_pagina < 0 or idx_pagina >= len(pdf.pages):
                 return ""
         
-        page = pdf.pages[idx_pagina]
-        text = page.extract_text() or ""
+        return texto_da_pagina(pdf.pages[idx_pagina], tipo_pagina, cronometro)
+
+
+def texto_da_pagina(page, tipo_pagina: str = None, cronometro=CRONOMETRO_INATIVO) -> str:
+    """
+    Texto de uma página já aberta (pdfplumber): camada de texto nativa e, se for
+    insuficiente, OCR da página renderizada. Ver carregar_texto_pdf.
+    """
+    if tipo_pagina == PAGINA_VAZIA:
+        return ""
+    if tipo_pagina == PAGINA_ESCANEADA:
+        # Camada de texto já sabidamente insuficiente
+        text = ""
+        caminho_ocr = CAMINHO_OCR
+    else:
+        with cronometro.etapa("extract_text"):
+            inicio = time.perf_counter()
+            text = page.extract_text() or ""
+            registrar_extracao_nativa(time.perf_counter() - inicio)
         # Normaliza espaços múltiplos mas preserva quebras de linha
         text = re.sub(r"[ \t]+", " ", text)
-        
-        # Verificar se texto é insuficiente (após remover espaços)
-        texto_sem_espacos = text.replace(" ", "").replace("\n", "")
-        if len(texto_sem_espacos) < TEXTO_MINIMO_PARA_VALIDO:
-            # Texto insuficiente, tentar OCR
-            try:
-                # Converter página para imagem
+        caminho_ocr = CAMINHO_OCR_FALLBACK
+    
+    # Verificar se texto é insuficiente (após remover espaços)
+    texto_sem_espacos = text.replace(" ", "").replace("\n", "")
+    if len(texto_sem_espacos) < TEXTO_MINIMO_PARA_VALIDO:
+        # Texto insuficiente, tentar OCR
+        cronometro.definir_caminho(caminho_ocr, OCR_RESOLUCAO_DPI, cache=False)
+        registrar_pagina(CAMINHO_OCR)
+        try:
+            # Converter página para imagem
+            with cronometro.etapa("renderizacao"):
                 imagem = page.to_image(resolution=OCR_RESOLUCAO_DPI)
-                # Converter para PIL Image
-                imagem_pil = imagem.original
-                # Extrair texto com OCR
+            # Converter para PIL Image
+            imagem_pil = imagem.original
+            # Extrair texto com OCR
+            with cronometro.etapa("ocr"):
                 texto_ocr = extrair_texto_com_ocr(imagem_pil)
-                if texto_ocr:
-                    # Normalizar espaços do texto OCR
-                    texto_ocr = re.sub(r"[ \t]+", " ", texto_ocr)
-                    return texto_ocr
-            except Exception as e:
-                # Se OCR falhar, retornar texto original (mesmo que insuficiente)
-                print(f"Erro ao processar OCR para fallback: {e}", file=sys.stderr)
+            if texto_ocr:
+                # Normalizar espaços do texto OCR
+                texto_ocr = re.sub(r"[ \t]+", " ", texto_ocr)
+                return texto_ocr
+        except Exception as e:
+            # Se OCR falhar, retornar texto original (mesmo que insuficiente)
+            print(f"Erro ao processar OCR para fallback: {e}", file=sys.stderr)
+    else:
+        cronometro.definir_caminho(CAMINHO_NATIVO)
+        registrar_pagina(CAMINHO_NATIVO)
+    
+    return text
+
+
+class LeituraAntecipada:
+    """
+    Renderiza páginas de um PDF em uma thread de fundo, até `capacidade` páginas
+    à frente de quem consome as imagens.
+    
+    Enquanto o OCR (onnxruntime, que libera o GIL) reconhece a página N, as
+    páginas seguintes já estão sendo renderizadas. A fila limitada mantém no
+    máximo `capacidade` imagens em memória. Com capacidade 0, renderiza
+    sob demanda na thread de quem consome (sem sobreposição).
+    
+    Uso:
+        with LeituraAntecipada(pdf_path, [1, 2, 3]) as leitura:
+            for pagina, imagem, erro in leitura:
+                ...
+    """
+    
+    _FIM = object()
+    
+    def __init__(self, pdf_path: Path, paginas, resolucao: int = OCR_RESOLUCAO_DPI,
+                 capacidade: int = None):
+        self.pdf_path = pdf_path
+        self.paginas = list(paginas)
+        self.resolucao = resolucao
+        self.capacidade = OCR_LEITURA_ANTECIPADA if capacidade is None else capacidade
+        self._fila = None
+        self._thread = None
+        self._parar = threading.Event()
+        # Por página: início e duração da renderização e se a imagem já estava pronta ao ser pedida
+        self.inicios_renderizacao = {}
+        self.tempos_renderizacao = {}
+        self.acertos = {}
+    
+    def _renderizar(self, pdf, pagina):
+        self.inicios_renderizacao[pagina] = time.time()
+        inicio = time.perf_counter()
+        page = pdf.pages[pagina - 1]
+        try:
+            return page.to_image(resolution=self.resolucao).original
+        finally:
+            # Libera os objetos de layout da página já renderizada
+            liberar_pagina(pdf, page)
+            self.tempos_renderizacao[pagina] = time.perf_counter() - inicio
+    
+    def _produzir(self):
+        try:
+            with abrir_pdf(self.pdf_path) as pdf:
+                for pagina in self.paginas:
+                    if self._parar.is_set():
+                        return
+                    try:
+                        item = (pagina, self._renderizar(pdf, pagina), None)
+                    except Exception as e:
+                        item = (pagina, None, e)
+                    colocado = self._colocar(item)
+                    # Só a fila referencia a imagem enquanto a próxima página é renderizada
+                    del item
+                    if not colocado:
+                        return
+        except Exception as e:
+            # Falha ao abrir o PDF: todas as páginas restantes falham
+            for pagina in self.paginas:
+                if not self._colocar((pagina, None, e)):
+                    return
+        finally:
+            self._colocar(self._FIM)
+    
+    def _colocar(self, item) -> bool:
+        """Coloca um item na fila, desistindo se o consumidor tiver encerrado."""
+        while not self._parar.is_set():
+            try:
+                self._fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def __enter__(self):
+        if self.capacidade > 0:
+            self._fila = queue.Queue(maxsize=self.capacidade)
+            self._thread = threading.Thread(target=self._produzir, daemon=True)
+            self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        return False
+    
+    def __iter__(self):
+        if self._thread is None:
+            # Sem leitura antecipada: renderiza cada página quando pedida
+            with abrir_pdf(self.pdf_path) as pdf:
+                for pagina in self.paginas:
+                    self.acertos[pagina] = False
+                    try:
+                        yield pagina, self._renderizar(pdf, pagina), None
+                    except Exception as e:
+                        yield pagina, None, e
+            return
         
-        return text
+        # Sem variável local com o item: o gerador suspenso não mantém a imagem viva
+        yield from iter(self._proximo, self._FIM)
+
+    def _proximo(self):
+        acerto = not self._fila.empty()
+        item = self._fila.get()
+        if item is not self._FIM:
+            self.acertos[item[0]] = acerto
+        return item
+
+
+def processar_paginas_ocr(pdf_path: Path, paginas, campos=None, leitura_antecipada: int = None,
+                          resolucao: int = OCR_RESOLUCAO_DPI) -> list["RegistroDarf"]:
+    """
+    Processa páginas escaneadas de um PDF com renderização antecipada: as
+    próximas páginas são renderizadas em segundo plano enquanto a atual passa pelo OCR.
+    
+    Args:
+        pdf_path: Caminho do arquivo PDF
+        paginas: Números das páginas (1-indexed), na ordem de processamento
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        leitura_antecipada: Quantas páginas renderizar à frente (padrão: OCR_LEITURA_ANTECIPADA)
+        resolucao: DPI da renderização
+    
+    Returns:
+        Lista de registros (RegistroDarf), na mesma ordem de `paginas`.
+    """
+    return list(iterar_paginas_ocr(pdf_path, paginas, campos, leitura_antecipada, resolucao))
+
+
+def iterar_paginas_ocr(pdf_path: Path, paginas, campos=None, leitura_antecipada: int = None,
+                       resolucao: int = OCR_RESOLUCAO_DPI) -> Iterator["RegistroDarf"]:
+    """
+    Como processar_paginas_ocr, mas gera um registro por vez: só as imagens da
+    leitura antecipada ficam em memória.
+    """
+    campos = normalizar_campos(campos)
+    if not paginas:
+        return
+    with LeituraAntecipada(pdf_path, paginas, resolucao, capacidade=leitura_antecipada) as leitura:
+        imagens = iter(leitura)
+        while True:
+            cronometro = criar_cronometro()
+            # Desempacota direto (sem guardar a tupla), para o `del imagem` liberá-la
+            pagina, imagem, erro = next(imagens, (None, None, None))
+            if pagina is None:
+                return
+            if erro is not None:
+                raise erro
+            if cronometro.ativo:
+                # Tempo esperando a imagem + renderização (feita na thread de fundo)
+                cronometro.registrar("espera_renderizacao", time.perf_counter() - cronometro.inicio)
+                cronometro.registrar("renderizacao", leitura.tempos_renderizacao.get(pagina))
+                cronometro.definir_caminho(CAMINHO_OCR, leitura.resolucao, leitura.acertos.get(pagina))
+            with span("pagina", arquivo=pdf_path.name, pagina=pagina, tipo=PAGINA_ESCANEADA,
+                      leitura_antecipada=leitura.acertos.get(pagina)):
+                if RASTREAR and pagina in leitura.tempos_renderizacao:
+                    registrar_span("renderizacao", leitura.inicios_renderizacao[pagina],
+                                   leitura.tempos_renderizacao[pagina], dpi=leitura.resolucao)
+                with cronometro.etapa("ocr"):
+                    texto = extrair_texto_com_ocr(imagem)
+                registrar_pagina(CAMINHO_OCR)
+                # Libera a imagem antes da próxima página
+                del imagem
+                texto = re.sub(r"[ \t]+", " ", texto)
+                registro = extrair_campos_texto(f"{pdf_path.name} - Página {pagina}", texto, campos, cronometro)
+            if cronometro.ativo:
+                registro["tempos"] = cronometro.resultado()
+            yield registro
 
 
 def carregar_linhas_pdf(pdf_path: Path, numero_pagina: int = None):
@@ -259,11 +668,13 @@ def carregar_linhas_pdf(pdf_path: Path, numero_pagina: int = None):
         Lista de linhas de texto normalizadas da página especificada.
     """
     text = carregar_texto_pdf(pdf_path, numero_pagina)
-    
-    # quebrar em linhas e normalizar espaços
-    raw_lines = text.splitlines()
+    return texto_para_linhas(text)
+
+
+def texto_para_linhas(text: str):
+    """Quebra o texto de uma página em linhas com espaços normalizados (sem linhas vazias)."""
     lines = []
-    for line in raw_lines:
+    for line in text.splitlines():
         # remove espaços duplicados internos
         norm = re.sub(r"\s+", " ", line).strip()
         if norm:
@@ -1106,10 +1517,13 @@ def extrair_linha_digitavel(lines, text=""):
         if linha_cand not in linhas_unicas or score > linhas_unicas[linha_cand]:
             linhas_unicas[linha_cand] = score
 
-    # Escolhe a linha digitável com maior score
+    # Escolhe a linha digitável com maior score, priorizando as que têm DVs válidos
     if linhas_unicas:
-        # Ordena por score (maior primeiro)
-        linha_ordenada = sorted(linhas_unicas.items(), key=lambda x: -x[1])
+        # Ordena por DV válido e depois por score (maior primeiro)
+        linha_ordenada = sorted(
+            linhas_unicas.items(),
+            key=lambda x: (linha_digitavel_para_codigo_barras(x[0]) is None, -x[1]),
+        )
         linha = linha_ordenada[0][0]
     else:
         linha = None
@@ -1119,358 +1533,724 @@ def extrair_linha_digitavel(lines, text=""):
     return linha, erro
 
 
+# ==========================
+# DECODIFICAÇÃO DO CÓDIGO DE BARRAS
+# ==========================
+
+# Layout FEBRABAN de arrecadação (posições 0-indexed no código de barras de 44 dígitos):
+#   [0] produto "8", [1] segmento, [2] identificador de valor, [3] DV geral,
+#   [4:15] valor (11 dígitos, 2 decimais), [15:19] órgão/empresa, [19:44] campo livre.
+# No DARF numerado o campo livre traria a data de vencimento juliana (ADDD)
+# seguida do número do documento (17 dígitos). Esse layout foi deduzido, não
+# conferido com DARFs reais: só é usado com CODIGO_BARRAS_CAMPO_LIVRE=1.
+CODIGO_BARRAS_CAMPO_LIVRE = os.getenv("CODIGO_BARRAS_CAMPO_LIVRE", "0") == "1"
+IDENTIFICADORES_VALOR_MOD10 = ("6", "7")
+IDENTIFICADORES_VALOR_MOD11 = ("8", "9")
+IDENTIFICADORES_VALOR_EFETIVO = ("6", "8")
+CAMPO_LIVRE_VENCIMENTO = slice(19, 23)
+CAMPO_LIVRE_NUMERO_DOCUMENTO = slice(23, 40)
+
+
+def _dv_modulo10(digitos: str) -> str:
+    """Calcula o DV módulo 10 (pesos 2,1 da direita para a esquerda)."""
+    soma = 0
+    peso = 2
+    for d in reversed(digitos):
+        produto = int(d) * peso
+        soma += produto // 10 + produto % 10
+        peso = 1 if peso == 2 else 2
+    return str((10 - soma % 10) % 10)
+
+
+def _dv_modulo11(digitos: str) -> str:
+    """Calcula o DV módulo 11 de arrecadação (pesos 2 a 9 da direita para a esquerda)."""
+    soma = 0
+    peso = 2
+    for d in reversed(digitos):
+        soma += int(d) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    return "0" if resto in (0, 1) else str(11 - resto)
+
+
+def linha_digitavel_para_codigo_barras(linha: str) -> Optional[str]:
+    """
+    Converte a linha digitável (48 dígitos) no código de barras (44 dígitos),
+    validando os DVs de cada bloco e o DV geral.
+
+    Args:
+        linha: Linha digitável com ou sem formatação
+
+    Returns:
+        Código de barras com 44 dígitos, ou None se os DVs não conferirem
+    """
+    digitos = re.sub(r"\D", "", linha or "")
+    if len(digitos) != 48 or digitos[0] != "8":
+        return None
+
+    identificador = digitos[2]
+    if identificador in IDENTIFICADORES_VALOR_MOD10:
+        calcular_dv = _dv_modulo10
+    elif identificador in IDENTIFICADORES_VALOR_MOD11:
+        calcular_dv = _dv_modulo11
+    else:
+        return None
+
+    # Cada bloco tem 11 dígitos de dados + 1 DV
+    blocos = [digitos[i:i + 12] for i in range(0, 48, 12)]
+    for bloco in blocos:
+        if calcular_dv(bloco[:11]) != bloco[11]:
+            return None
+
+    codigo_barras = "".join(bloco[:11] for bloco in blocos)
+
+    # DV geral (posição 4) calculado sobre os outros 43 dígitos
+    if calcular_dv(codigo_barras[:3] + codigo_barras[4:]) != codigo_barras[3]:
+        return None
+
+    return codigo_barras
+
+
+def _decodificar_data_juliana(addd: str, referencia: Optional[datetime]) -> Optional[str]:
+    """
+    Decodifica uma data juliana no formato ADDD (último dígito do ano + dia do ano).
+
+    O ano é resolvido como o mais próximo da data de referência que termina
+    com o dígito informado.
+    """
+    if not addd or len(addd) != 4 or not addd.isdigit():
+        return None
+
+    digito_ano = int(addd[0])
+    dia_do_ano = int(addd[1:])
+    if not 1 <= dia_do_ano <= 366:
+        return None
+
+    referencia = referencia or datetime.now()
+    candidatos = [
+        ano for ano in range(referencia.year - 5, referencia.year + 6)
+        if ano % 10 == digito_ano
+    ]
+    ano = min(candidatos, key=lambda a: abs(a - referencia.year))
+
+    try:
+        data = datetime(ano, 1, 1) + timedelta(days=dia_do_ano - 1)
+    except ValueError:
+        return None
+    if data.year != ano:
+        # Dia 366 em ano não bissexto
+        return None
+
+    # O vencimento deve estar no máximo um ano distante da referência
+    if abs((data - referencia).days) > 366:
+        return None
+
+    return data.strftime("%d/%m/%Y")
+
+
+def decodificar_codigo_barras_darf(linha: str) -> Optional[dict]:
+    """
+    Decodifica os campos embutidos na linha digitável de um DARF.
+
+    Só retorna dados quando todos os DVs da linha digitável conferem. Os campos
+    decodificados conferem ou completam os do texto (ver conferir_codigo_barras);
+    número do documento e vencimento dependem do layout do campo livre (ver
+    CODIGO_BARRAS_CAMPO_LIVRE).
+
+    Args:
+        linha: Linha digitável (48 dígitos)
+
+    Returns:
+        Dicionário com "codigo_barras", "valor_total_documento", "numero_documento"
+        e "data_vencimento" (campos não decodificáveis ficam None), ou None se a
+        linha digitável for inválida.
+    """
+    codigo_barras = linha_digitavel_para_codigo_barras(linha)
+    if codigo_barras is None:
+        return None
+
+    valor = None
+    if codigo_barras[2] in IDENTIFICADORES_VALOR_EFETIVO:
+        centavos = int(codigo_barras[4:15])
+        if centavos > 0:
+            inteiro, decimal = divmod(centavos, 100)
+            valor = f"{inteiro:,}".replace(",", ".") + f",{decimal:02d}"
+
+    # Número do documento: 17 dígitos no formato NN.NN.NNNNN.NNNNNNN-N
+    # Os dígitos AADDD do número indicam a data de emissão (juliana); se não
+    # formarem uma data válida, o campo livre não segue o layout do DARF numerado
+    numero_documento = None
+    referencia = None
+    num = codigo_barras[CAMPO_LIVRE_NUMERO_DOCUMENTO]
+    try:
+        referencia = datetime.strptime(num[4:9], "%y%j")
+    except ValueError:
+        referencia = None
+    if referencia is not None:
+        numero_documento = f"{num[:2]}.{num[2:4]}.{num[4:9]}.{num[9:16]}-{num[16]}"
+
+    data_vencimento = None
+    if referencia is not None:
+        data_vencimento = _decodificar_data_juliana(
+            codigo_barras[CAMPO_LIVRE_VENCIMENTO], referencia
+        )
+        # Vencimento anterior à emissão indica layout diferente do esperado
+        if data_vencimento and datetime.strptime(data_vencimento, "%d/%m/%Y") < referencia:
+            data_vencimento = None
+
+    return {
+        "codigo_barras": codigo_barras,
+        "valor_total_documento": valor,
+        "numero_documento": numero_documento,
+        "data_vencimento": data_vencimento,
+    }
+
+
+def conferir_codigo_barras(valor, erro: Optional[str], valor_barras) -> tuple:
+    """
+    Confere o valor extraído do texto com o decodificado do código de barras.
+
+    O código de barras só completa o que o texto não trouxe: se os dois
+    divergirem, o valor do texto é mantido e a divergência vai para o erro.
+
+    Returns:
+        Tupla (valor, erro)
+    """
+    if not valor_barras:
+        return valor, erro
+    if valor is None:
+        return valor_barras, None
+    if re.sub(r"\D", "", valor) != re.sub(r"\D", "", valor_barras):
+        return valor, f"Divergente do código de barras ({valor_barras})."
+    return valor, erro
+
+
 # ==========================
 # PIPELINE PRINCIPAL
 # ==========================
 
-def processar_pdf_pagina(pdf_path: Path, numero_pagina: int) -> dict:
+# Versão da extração: incrementar quando uma mudança alterar os registros
+# gerados, para que o manifesto de processar_pasta reprocesse os PDFs
+VERSAO_PARSER = "2"
+
+# Campos do registro, na ordem das colunas de saída
+CAMPOS_REGISTRO = (
+    "cnpj",
+    "razao_social",
+    "periodo_apuracao",
+    "data_vencimento",
+    "numero_documento",
+    "valor_total_documento",
+    "codigo",
+    "denominacao",
+    "linha_digitavel",
+)
+
+# Campos que podem vir do código de barras decodificado
+CAMPOS_CODIGO_BARRAS = ("data_vencimento", "numero_documento", "valor_total_documento")
+
+
+def normalizar_campos(campos=None) -> tuple:
+    """
+    Valida e ordena um conjunto de campos solicitados.
+    
+    Args:
+        campos: Iterável com nomes de campos (ou string separada por vírgulas).
+            Se None ou vazio, retorna todos os campos.
+    
+    Returns:
+        Tupla com os campos na ordem de CAMPOS_REGISTRO.
+    
+    Raises:
+        ValueError: Se algum campo não existir.
+    """
+    if not campos:
+        return CAMPOS_REGISTRO
+    if isinstance(campos, str):
+        campos = campos.split(",")
+    
+    solicitados = {c.strip() for c in campos if c and c.strip()}
+    desconhecidos = solicitados - set(CAMPOS_REGISTRO)
+    if desconhecidos:
+        raise ValueError(
+            f"Campo(s) desconhecido(s): {', '.join(sorted(desconhecidos))}. "
+            f"Campos disponíveis: {', '.join(CAMPOS_REGISTRO)}."
+        )
+    if not solicitados:
+        return CAMPOS_REGISTRO
+    return tuple(c for c in CAMPOS_REGISTRO if c in solicitados)
+
+
+# Coluna de erro de cada campo e campo de cada coluna do registro
+_COLUNA_ERRO = {campo: f"{campo}_erro" for campo in CAMPOS_REGISTRO}
+_CAMPO_DA_COLUNA = {**{campo: campo for campo in CAMPOS_REGISTRO}, **{e: c for c, e in _COLUNA_ERRO.items()}}
+# Tuplas de campos compartilhadas entre os registros (uma por combinação de campos)
+_CAMPOS_COMPARTILHADOS = {}
+_COLUNAS_POR_CAMPOS = {}
+
+
+def colunas_registro(campos=None) -> tuple:
+    """
+    Colunas de um registro, na ordem de saída: "arquivo" e os pares campo / campo_erro.
+    
+    Args:
+        campos: Campos do registro (None = todos)
+    """
+    campos = normalizar_campos(campos)
+    colunas = _COLUNAS_POR_CAMPOS.get(campos)
+    if colunas is None:
+        colunas = ("arquivo",) + tuple(coluna for campo in campos for coluna in (campo, _COLUNA_ERRO[campo]))
+        _COLUNAS_POR_CAMPOS[campos] = colunas
+    return colunas
+
+
+class RegistroDarf(Mapping):
+    """
+    Registro de uma página: "arquivo", os pares campo / campo_erro dos campos
+    solicitados e, com MEDIR_TEMPOS=1, "tempos".
+    
+    Guardado em __slots__, sem um dicionário por registro (ocupa uma fração do
+    dict equivalente em lotes com centenas de milhares de páginas), mas lido
+    como um: registro["cnpj"], registro.get("codigo"), dict(registro). Campos
+    não solicitados não existem no registro (KeyError, como no dict).
+    """
+    
+    __slots__ = ("arquivo", "campos", "tempos", *CAMPOS_REGISTRO, *_COLUNA_ERRO.values())
+    
+    def __init__(self, arquivo: str, campos: tuple = CAMPOS_REGISTRO, erro: str = None):
+        self.arquivo = arquivo
+        self.campos = _CAMPOS_COMPARTILHADOS.setdefault(campos, campos)
+        for campo in campos:
+            setattr(self, campo, None)
+            setattr(self, _COLUNA_ERRO[campo], erro)
+    
+    def definir(self, campo: str, valor, erro: Optional[str]):
+        """Preenche um campo e sua mensagem de erro, se o campo foi solicitado."""
+        if campo in self.campos:
+            setattr(self, campo, valor)
+            setattr(self, _COLUNA_ERRO[campo], erro)
+    
+    def linha(self, colunas) -> tuple:
+        """Valores das colunas, na ordem (None nas ausentes), para os writers."""
+        return tuple(getattr(self, coluna, None) for coluna in colunas)
+    
+    def __getitem__(self, chave):
+        if chave == "arquivo" or chave == "tempos" or chave in _CAMPO_DA_COLUNA:
+            try:
+                return getattr(self, chave)
+            except AttributeError:
+                pass
+        raise KeyError(chave)
+    
+    def __setitem__(self, chave, valor):
+        if chave not in ("arquivo", "tempos") and _CAMPO_DA_COLUNA.get(chave) not in self.campos:
+            raise KeyError(chave)
+        setattr(self, chave, valor)
+    
+    def __iter__(self):
+        yield from colunas_registro(self.campos)
+        if hasattr(self, "tempos"):
+            yield "tempos"
+    
+    def __len__(self):
+        return len(colunas_registro(self.campos)) + hasattr(self, "tempos")
+    
+    def __reduce__(self):
+        # Entre os processos do motor de lote: recriado com as tuplas de campos compartilhadas
+        return registro_de_dict, (dict(self),)
+    
+    def __repr__(self):
+        return f"RegistroDarf({dict(self)!r})"
+
+
+def registro_de_dict(dados: Mapping) -> RegistroDarf:
+    """Recria um registro a partir do dicionário equivalente (ex: lido de um JSON)."""
+    campos = tuple(campo for campo in CAMPOS_REGISTRO if campo in dados)
+    registro = RegistroDarf(dados.get("arquivo"), campos)
+    for campo in campos:
+        setattr(registro, campo, dados[campo])
+        setattr(registro, _COLUNA_ERRO[campo], dados.get(_COLUNA_ERRO[campo]))
+    if "tempos" in dados:
+        registro.tempos = dados["tempos"]
+    return registro
+
+
+def linha_registro(registro: Mapping, colunas) -> tuple:
+    """Valores das colunas de um registro (RegistroDarf ou dict), na ordem, para os writers."""
+    if isinstance(registro, RegistroDarf):
+        return registro.linha(colunas)
+    return tuple(registro.get(coluna) for coluna in colunas)
+
+
+def criar_registro(arquivo: str, campos=None, erro: str = None) -> RegistroDarf:
+    """
+    Cria um registro com os campos solicitados vazios. Todos os registros
+    (páginas extraídas e erros) são criados por aqui.
+    
+    Args:
+        arquivo: Valor da coluna "arquivo" (ex: "nome.pdf - Página 1")
+        campos: Campos do registro (None = todos)
+        erro: Mensagem aplicada a todas as colunas de erro (ex: falha ao abrir o PDF)
+    
+    Returns:
+        RegistroDarf com "arquivo" e os pares campo / campo_erro.
+    """
+    return RegistroDarf(arquivo, normalizar_campos(campos), erro)
+
+
+def processar_pdf_pagina(pdf_path: Path, numero_pagina: int, campos=None, tipo_pagina: str = None) -> RegistroDarf:
     """
-    Processa uma página específica de um DARF em PDF e retorna um dicionário com
+    Processa uma página específica de um DARF em PDF e retorna o registro com
     campos + mensagens de erro por campo.
     
+    Apenas os extratores necessários para os campos solicitados são executados.
+    
     Args:
         pdf_path: Caminho do arquivo PDF
         numero_pagina: Número da página a processar (1-indexed)
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        tipo_pagina: Classificação prévia da página (ver classificar_pagina).
     
     Returns:
-        Dicionário com os campos extraídos e nome de arquivo formatado com número da página.
+        RegistroDarf (lido como um Mapping; aceita registro[campo] = valor nos campos
+        solicitados e em "tempos"; dict(registro) para serializar) com os campos
+        extraídos e nome de arquivo formatado com número da página.
     """
-    nome_arquivo = pdf_path.name
-    resultado = {
-        "arquivo": f"{nome_arquivo} - Página {numero_pagina}",
-        "cnpj": None,
-        "cnpj_erro": None,
-        "razao_social": None,
-        "razao_social_erro": None,
-        "periodo_apuracao": None,
-        "periodo_apuracao_erro": None,
-        "data_vencimento": None,
-        "data_vencimento_erro": None,
-        "numero_documento": None,
-        "numero_documento_erro": None,
-        "valor_total_documento": None,
-        "valor_total_documento_erro": None,
-        "codigo": None,
-        "codigo_erro": None,
-        "denominacao": None,
-        "denominacao_erro": None,
-        "linha_digitavel": None,
-        "linha_digitavel_erro": None,
-    }
+    cronometro = criar_cronometro()
+    with span("pagina", arquivo=pdf_path.name, pagina=numero_pagina, tipo=tipo_pagina):
+        # Carrega o texto uma única vez (evita abrir o PDF e rodar OCR duas vezes)
+        text = carregar_texto_pdf(pdf_path, numero_pagina, tipo_pagina, cronometro)
+        registro = extrair_campos_texto(f"{pdf_path.name} - Página {numero_pagina}", text, campos, cronometro)
+    if cronometro.ativo:
+        registro["tempos"] = cronometro.resultado()
+    return registro
 
-    lines = carregar_linhas_pdf(pdf_path, numero_pagina)
-    text = carregar_texto_pdf(pdf_path, numero_pagina)
+
+def extrair_campos_texto(arquivo: str, text: str, campos=None, cronometro=CRONOMETRO_INATIVO) -> RegistroDarf:
+    """
+    Executa os extratores sobre o texto já carregado de uma página.
+    
+    Args:
+        arquivo: Valor da coluna "arquivo" (ex: "nome.pdf - Página 1")
+        text: Texto da página (nativo ou OCR)
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        cronometro: Registra o tempo de cada extrator (ver app.utils.tempos)
+    
+    Returns:
+        RegistroDarf com os campos solicitados e suas mensagens de erro.
+    """
+    campos = normalizar_campos(campos)
+    registro = criar_registro(arquivo, campos)
+    lines = texto_para_linhas(text)
+
+    # Linha digitável primeiro: quando os DVs conferem, os campos decodificados
+    # do código de barras conferem (ou completam) os extraídos do texto
+    dados_barras = None
+    if "linha_digitavel" in campos or any(c in campos for c in CAMPOS_CODIGO_BARRAS):
+        with cronometro.etapa("extrair_linha_digitavel"):
+            linha, linha_erro = extrair_linha_digitavel(lines, text)
+        registro.definir("linha_digitavel", linha, linha_erro)
+        dados_barras = decodificar_codigo_barras_darf(linha) if linha else None
+        if dados_barras and not CODIGO_BARRAS_CAMPO_LIVRE:
+            # Layout do campo livre não conferido: só o valor (padrão FEBRABAN) é usado
+            dados_barras["numero_documento"] = dados_barras["data_vencimento"] = None
 
     # CNPJ + Razão Social
-    cnpj, cnpj_erro, razao, razao_erro = extrair_cnpj_e_razao_social(lines, text)
-    resultado["cnpj"] = cnpj
-    resultado["cnpj_erro"] = cnpj_erro
-    resultado["razao_social"] = razao
-    resultado["razao_social_erro"] = razao_erro
+    if "cnpj" in campos or "razao_social" in campos:
+        with cronometro.etapa("extrair_cnpj_e_razao_social"):
+            cnpj, cnpj_erro, razao, razao_erro = extrair_cnpj_e_razao_social(lines, text)
+        registro.definir("cnpj", cnpj, cnpj_erro)
+        registro.definir("razao_social", razao, razao_erro)
 
     # Período, Vencimento, Número do Documento
-    (periodo, periodo_erro,
-     venc, venc_erro,
-     num_doc, num_doc_erro) = extrair_periodo_vencimento_numdoc(lines, text)
-    resultado["periodo_apuracao"] = periodo
-    resultado["periodo_apuracao_erro"] = periodo_erro
-    resultado["data_vencimento"] = venc
-    resultado["data_vencimento_erro"] = venc_erro
-    resultado["numero_documento"] = num_doc
-    resultado["numero_documento_erro"] = num_doc_erro
+    if any(c in campos for c in ("periodo_apuracao", "data_vencimento", "numero_documento")):
+        with cronometro.etapa("extrair_periodo_vencimento_numdoc"):
+            (periodo, periodo_erro,
+             venc, venc_erro,
+             num_doc, num_doc_erro) = extrair_periodo_vencimento_numdoc(lines, text)
+        if dados_barras:
+            venc, venc_erro = conferir_codigo_barras(venc, venc_erro, dados_barras["data_vencimento"])
+            num_doc, num_doc_erro = conferir_codigo_barras(num_doc, num_doc_erro, dados_barras["numero_documento"])
+        registro.definir("periodo_apuracao", periodo, periodo_erro)
+        registro.definir("data_vencimento", venc, venc_erro)
+        registro.definir("numero_documento", num_doc, num_doc_erro)
 
     # Valor Total
-    valor_total, valor_erro = extrair_valor_total(lines, text)
-    resultado["valor_total_documento"] = valor_total
-    resultado["valor_total_documento_erro"] = valor_erro
-
-    # Código + Denominação
-    codigo, codigo_erro, denom, denom_erro = extrair_codigo_e_denom(lines, text)
-    resultado["codigo"] = codigo
-    resultado["codigo_erro"] = codigo_erro
-    resultado["denominacao"] = denom
-    resultado["denominacao_erro"] = denom_erro
+    if "valor_total_documento" in campos:
+        with cronometro.etapa("extrair_valor_total"):
+            valor_total, valor_erro = extrair_valor_total(lines, text)
+        if dados_barras:
+            valor_total, valor_erro = conferir_codigo_barras(
+                valor_total, valor_erro, dados_barras["valor_total_documento"]
+            )
+        registro.definir("valor_total_documento", valor_total, valor_erro)
 
-    # Linha digitável
-    linha, linha_erro = extrair_linha_digitavel(lines, text)
-    resultado["linha_digitavel"] = linha
-    resultado["linha_digitavel_erro"] = linha_erro
+    # Código + Denominação (extrator mais caro: só roda se solicitado)
+    if "codigo" in campos or "denominacao" in campos:
+        with cronometro.etapa("extrair_codigo_e_denom"):
+            codigo, codigo_erro, denom, denom_erro = extrair_codigo_e_denom(lines, text)
+        registro.definir("codigo", codigo, codigo_erro)
+        registro.definir("denominacao", denom, denom_erro)
 
-    return resultado
+    registrar_falhas_campos(registro, campos)
+    return registro
 
 
-def processar_pdf(pdf_path: Path) -> list[dict]:
+def processar_pdf(pdf_path: Path, campos=None, classificacao: list[dict] = None) -> list[RegistroDarf]:
     """
-    Processa todas as páginas de um DARF em PDF e retorna uma lista de dicionários,
+    Processa todas as páginas de um DARF em PDF e retorna uma lista de registros,
     um para cada página, com campos + mensagens de erro por campo.
     
+    As páginas são classificadas antes da extração: páginas em branco (separadores,
+    folhas de rosto) são ignoradas e páginas escaneadas vão direto para o OCR.
+    Para PDFs muito grandes, prefira iterar_paginas_pdf (um registro por vez).
+    
     Args:
         pdf_path: Caminho do arquivo PDF
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        classificacao: Resultado prévio de classificar_paginas_pdf (evita reclassificar).
     
     Returns:
-        Lista de dicionários, onde cada dicionário contém os campos extraídos de uma página.
-        Cada dicionário tem o campo "arquivo" formatado como "nome.pdf - Página X".
+        Lista de RegistroDarf (Mapping que aceita registro[campo] = valor nos campos
+        solicitados e em "tempos"; dict(registro) para serializar),
+        cada um com os campos extraídos de uma página e o campo "arquivo" formatado
+        como "nome.pdf - Página X".
     """
-    total_paginas = obter_total_paginas(pdf_path)
-    
-    if total_paginas == 0:
-        # PDF vazio ou inválido - retorna uma entrada de erro
-        nome_arquivo = pdf_path.name
-        return [{
-            "arquivo": f"{nome_arquivo} - Página 1",
-            "cnpj": None,
-            "cnpj_erro": "PDF vazio ou inválido.",
-            "razao_social": None,
-            "razao_social_erro": "PDF vazio ou inválido.",
-            "periodo_apuracao": None,
-            "periodo_apuracao_erro": "PDF vazio ou inválido.",
-            "data_vencimento": None,
-            "data_vencimento_erro": "PDF vazio ou inválido.",
-            "numero_documento": None,
-            "numero_documento_erro": "PDF vazio ou inválido.",
-            "valor_total_documento": None,
-            "valor_total_documento_erro": "PDF vazio ou inválido.",
-            "codigo": None,
-            "codigo_erro": "PDF vazio ou inválido.",
-            "denominacao": None,
-            "denominacao_erro": "PDF vazio ou inválido.",
-            "linha_digitavel": None,
-            "linha_digitavel_erro": "PDF vazio ou inválido.",
-        }]
-    
-    resultados = []
-    for numero_pagina in range(1, total_paginas + 1):
-        resultado = processar_pdf_pagina(pdf_path, numero_pagina)
-        resultados.append(resultado)
-    
-    return resultados
+    return list(iterar_paginas_pdf(pdf_path, campos, classificacao))
 
 
-# ==========================
-# IMPORTS DE FUNÇÕES AUXILIARES
-# ==========================
-
-# Importa funções do módulo de configuração
-try:
-    # Tenta usar a versão direta (sem Flask) primeiro
-    from app.database.direct import get_aba_por_codigo, get_uo_por_cnpj
-except ImportError:
-    # Fallback para versão Flask (compatibilidade)
-    from app.database import get_aba_por_codigo, get_uo_por_cnpj
-
-# Importa funções de formatação do módulo utils
-try:
-    from app.utils.formatters import (
-        extrair_apenas_numeros,
-        calcular_data_menos_um_dia,
-        calcular_mes_anterior,
-        limpar_valor_monetario,
-        limpar_cnpj,
-        limpar_mes_ano,
-        limpar_data,
-    )
-except ImportError:
-    # Fallback para compatibilidade se app.utils não estiver disponível
-    # (não deve acontecer em produção, mas mantém compatibilidade)
-    def extrair_apenas_numeros(texto: str) -> str:
-        if not texto:
-            return ""
-        return re.sub(r"\D", "", str(texto))
-    
-    def calcular_data_menos_um_dia(data_str: str) -> str:
-        if not data_str:
-            return ""
-        try:
-            data = datetime.strptime(data_str.strip(), "%d/%m/%Y")
-            data_menos_um = data - timedelta(days=1)
-            return data_menos_um.strftime("%d/%m/%Y")
-        except (ValueError, AttributeError):
-            return ""
+def iterar_paginas_pdf(pdf_path: Path, campos=None, classificacao: list[dict] = None) -> Iterator[RegistroDarf]:
+    """
+    Gera os registros das páginas de um PDF um por vez, na ordem das páginas,
+    com memória constante: o PDF é aberto uma única vez e os objetos de cada
+    página são liberados logo após o uso (ver liberar_pagina).
     
-    def calcular_mes_anterior() -> str:
-        hoje = datetime.now()
-        if hoje.month == 1:
-            mes_anterior = 12
-            ano_anterior = hoje.year - 1
-        else:
-            mes_anterior = hoje.month - 1
-            ano_anterior = hoje.year
-        return f"{mes_anterior:02d}/{ano_anterior}"
+    As páginas escaneadas passam pelo OCR com leitura antecipada (em paralelo
+    às páginas nativas); páginas em branco são ignoradas.
     
-    def limpar_valor_monetario(valor: str) -> str:
-        if not valor:
-            return ""
-        return str(valor).replace(".", "").replace(",", "")
+    Args:
+        pdf_path: Caminho do arquivo PDF (ou PdfEmMemoria)
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        classificacao: Resultado prévio de classificar_paginas_pdf (evita
+            reclassificar), ou só as páginas a processar (ex: um bloco do motor de lote)
     
-    def limpar_cnpj(cnpj: str) -> str:
-        if not cnpj:
-            return ""
-        return str(cnpj).replace(".", "").replace("/", "").replace("-", "")
+    Yields:
+        RegistroDarf de cada página com conteúdo, ou o registro de erro de um PDF sem conteúdo.
+    """
+    campos = normalizar_campos(campos)
+    if classificacao is None:
+        classificacao = classificar_paginas_pdf(pdf_path)
     
-    def limpar_mes_ano(mes_ano: str) -> str:
-        if not mes_ano:
-            return ""
-        return str(mes_ano).replace("/", "")
+    sem_conteudo = registro_pdf_sem_conteudo(pdf_path, classificacao, campos)
+    if sem_conteudo:
+        yield sem_conteudo
+        return
     
-    def limpar_data(data: str) -> str:
-        if not data:
-            return ""
-        return str(data).replace("/", "")
+    alvo = sorted(
+        (info for info in classificacao if info["tipo"] != PAGINA_VAZIA), key=lambda info: info["pagina"]
+    )
+    paginas_ocr = [info["pagina"] for info in alvo if info["tipo"] == PAGINA_ESCANEADA]
+    paginas_nativas = [info["pagina"] for info in alvo if info["tipo"] != PAGINA_ESCANEADA]
+    registros_ocr = iterar_paginas_ocr(pdf_path, paginas_ocr, campos)
+    try:
+        if not paginas_nativas:
+            yield from registros_ocr
+            return
+        # Só as páginas nativas são carregadas em `pdf.pages`, na ordem
+        with abrir_pdf(pdf_path, paginas_nativas) as pdf:
+            nativas = iter(pdf.pages)
+            for info in alvo:
+                if info["tipo"] == PAGINA_ESCANEADA:
+                    yield next(registros_ocr)
+                    continue
+                page = next(nativas)
+                cronometro = criar_cronometro()
+                with span("pagina", arquivo=pdf_path.name, pagina=info["pagina"], tipo=info["tipo"]):
+                    text = texto_da_pagina(page, info["tipo"], cronometro)
+                    registro = extrair_campos_texto(
+                        f"{pdf_path.name} - Página {info['pagina']}", text, campos, cronometro
+                    )
+                liberar_pagina(pdf, page)
+                if cronometro.ativo:
+                    registro["tempos"] = cronometro.resultado()
+                yield registro
+    finally:
+        # Encerra a leitura antecipada se o consumidor parar antes do fim
+        registros_ocr.close()
+
+
+def registro_pdf_sem_conteudo(pdf_path: Path, classificacao: list[dict], campos=None) -> Optional[RegistroDarf]:
+    """
+    Retorna o registro de erro de um PDF sem páginas a extrair (vazio, inválido
+    ou só com páginas em branco), ou None se houver ao menos uma página com conteúdo.
+    """
+    if not classificacao:
+        # PDF vazio ou inválido - retorna uma entrada de erro
+        return criar_registro(f"{pdf_path.name} - Página 1", campos, "PDF vazio ou inválido.")
+    if all(info["tipo"] == PAGINA_VAZIA for info in classificacao):
+        return criar_registro(
+            f"{pdf_path.name} - Página 1", campos, "PDF sem conteúdo (todas as páginas em branco)."
+        )
+    return None
 
 
-# Importa funções de formatação do módulo de serviços
-try:
-    from app.services.excel_generator import (
-        formatar_linha_servidor,
-        formatar_linha_patronal_gilrat,
+def processar_pasta(
+    pasta_pdf: Path,
+    output_csv: Path,
+    output_xlsx: Path,
+    campos=None,
+    incremental: bool = True,
+    arquivos=None,
+):
+    """
+    Extrai os DARFs de uma pasta e gera o CSV e o XLSX.
+
+    No modo incremental, um manifesto salvo ao lado do CSV (ver
+    app.services.manifesto) guarda os registros de cada PDF já processado: só os
+    PDFs novos ou alterados são processados, e as saídas são regravadas com os
+    registros novos e os do manifesto. PDFs removidos da pasta saem das saídas.
+
+    Arquivos .zip da pasta entram com os PDFs que contêm, lidos direto do ZIP
+    (ver app.services.zip_pdfs); no manifesto, a unidade é o ZIP.
+
+    Args:
+        pasta_pdf: Pasta com os PDFs
+        output_csv: Caminho do CSV
+        output_xlsx: Caminho do XLSX
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        incremental: Se False, reprocessa todos os PDFs (o manifesto é refeito)
+        arquivos: PDFs da pasta a considerar (padrão: todos os *.pdf e *.zip). Usado
+            pelo modo contínuo para deixar de fora PDFs ainda sendo gravados.
+    """
+    campos = normalizar_campos(campos)
+    pdf_files = sorted(arquivos) if arquivos is not None else sorted(
+        [*pasta_pdf.glob("*.pdf"), *pasta_pdf.glob("*.zip")]
     )
-except ImportError:
-    # Fallback para compatibilidade se app.services não estiver disponível
-    # (usado quando script é executado diretamente sem Flask)
-    def formatar_linha_patronal_gilrat(registro: dict) -> dict:
-        arquivo = registro.get("arquivo", "") or ""
-        cnpj = registro.get("cnpj", "") or ""
-        numero_doc = registro.get("numero_documento", "") or ""
-        linha_dig = registro.get("linha_digitavel", "") or ""
-        valor_total = registro.get("valor_total_documento", "") or ""
-        data_venc = registro.get("data_vencimento", "") or ""
-        
-        uo_contribuinte = get_uo_por_cnpj(cnpj) or ""
-        nr_doc_numeros = extrair_apenas_numeros(numero_doc)
-        codigo_barras_numeros = extrair_apenas_numeros(linha_dig)
-        data_pagamento = calcular_data_menos_um_dia(data_venc)
-        mes_comp = calcular_mes_anterior()
-        historico = f"Folha INSS {mes_comp}"
-        
-        return {
-            "Arquivo": arquivo,
-            "Informe o Credor": limpar_cnpj("29.979.036/0001-40"),
-            "Leitora Otica": "n",
-            "Selecione com 'X'": "Patronal (GPS/DARF)",
-            "Selecione a GUIA para Pagamento": "DARF",
-            "Ano/Nr. Folha": "",
-            "UO Contribuinte": uo_contribuinte,
-            "Ordenador Despesa": "m1127166",
-            "Nr Docto DARF": nr_doc_numeros,
-            "Codigo de Barra": codigo_barras_numeros,
-            "Valor Total do Documento": limpar_valor_monetario(valor_total),
-            "Data Pagamento Prevista": limpar_data(data_pagamento),
-            "Historico de Referencia": historico,
-        }
-    
-    def formatar_linha_servidor(registro: dict) -> dict:
-        arquivo = registro.get("arquivo", "") or ""
-        cnpj = registro.get("cnpj", "") or ""
-        numero_doc = registro.get("numero_documento", "") or ""
-        linha_dig = registro.get("linha_digitavel", "") or ""
-        valor_total = registro.get("valor_total_documento", "") or ""
-        data_venc = registro.get("data_vencimento", "") or ""
-        
-        uo_contribuinte = get_uo_por_cnpj(cnpj) or ""
-        nr_doc_numeros = extrair_apenas_numeros(numero_doc)
-        codigo_barras_numeros = extrair_apenas_numeros(linha_dig)
-        data_pagamento = calcular_data_menos_um_dia(data_venc)
-        mes_comp = calcular_mes_anterior()
-        historico = f"Folha INSS {mes_comp}"
-        
-        return {
-            "Arquivo": arquivo,
-            "Informe o Credor": limpar_cnpj("29.979.036/0001-40"),
-            "Leitora Otica": "n",
-            "Selecione com 'X'": "Consignacao (GPS/DARF)",
-            "Selecione a GUIA para Pagamento": "DARF",
-            "Mes/Ano de Competencia:": limpar_mes_ano(mes_comp),
-            "UO Contribuinte": uo_contribuinte,
-            "GMI FP": "",
-            "Ordenador Despesa": "m1127166",
-            "Nr Docto DARF": nr_doc_numeros,
-            "Codigo de Barra": codigo_barras_numeros,
-            "Valor Total do Documento": limpar_valor_monetario(valor_total),
-            "Data Pagamento Prevista": limpar_data(data_pagamento),
-            "Historico de Referencia": historico,
-        }
-
-
-def processar_pasta(pasta_pdf: Path, output_csv: Path, output_xlsx: Path):
-    pdf_files = sorted(pasta_pdf.glob("*.pdf"))
     if not pdf_files:
         print(f"Nenhum PDF encontrado em: {pasta_pdf}")
         return
 
-    registros = []
+    # As páginas de todos os PDFs são distribuídas entre a fila nativa e a de OCR
+    from app.services.batch_engine import processar_lote
+    from app.services.manifesto import Manifesto, caminho_manifesto
+    from app.services.diario import DiarioLote, caminho_diario
+    from app.services.zip_pdfs import ZipInvalido, eh_zip, iterar_pdfs_zip
+
+    if incremental:
+        manifesto = Manifesto.carregar(caminho_manifesto(output_csv), VERSAO_PARSER, campos)
+    else:
+        manifesto = Manifesto(caminho_manifesto(output_csv), VERSAO_PARSER, campos)
+    manifesto.remover_ausentes(pdf.name for pdf in pdf_files)
+
+    registros_por_arquivo = {}
+    pendentes = []
     for pdf in pdf_files:
-        print(f"Processando: {pdf.name}")
+        anteriores = manifesto.verificar(pdf)
+        if anteriores is None:
+            pendentes.append(pdf)
+        else:
+            registros_por_arquivo[pdf.name] = anteriores
+    print(
+        f"{len(pendentes)} PDF(s) a processar (novos, alterados ou com falha anterior), "
+        f"{len(pdf_files) - len(pendentes)} sem alteração (registros do manifesto)"
+    )
+
+    # PDFs de cada ZIP: os registros são agrupados no ZIP, que só entra no
+    # manifesto se todos os seus PDFs forem processados sem erro
+    zip_de_membro = {}
+    zips_com_erro = set()
+
+    def entradas():
+        for arquivo in pendentes:
+            if not eh_zip(arquivo):
+                yield arquivo
+                continue
+            registros_por_arquivo[arquivo.name] = []
+            try:
+                for membro in iterar_pdfs_zip(arquivo):
+                    zip_de_membro[membro] = arquivo
+                    yield membro
+            except ZipInvalido as e:
+                print(f"Erro no ZIP: {e}")
+                zips_com_erro.add(arquivo.name)
+                registros_por_arquivo[arquivo.name] = [criar_registro(f"{arquivo.name} - Página 1", campos, str(e))]
+
+    def ao_finalizar_arquivo(pdf, registros_arquivo, erro):
+        if pdf in zip_de_membro:
+            zip_path = zip_de_membro.pop(pdf)
+            registros_por_arquivo[zip_path.name].extend(registros_arquivo)
+            if erro is not None:
+                zips_com_erro.add(zip_path.name)
+            return
+        registros_por_arquivo[pdf.name] = registros_arquivo
+        # PDFs com falha no processamento são tentados de novo na próxima execução
+        if erro is None:
+            manifesto.atualizar(pdf, registros_arquivo)
+
+    totais = {"nativas": 0, "ocr": 0, "ignoradas": 0}
+
+    def ao_classificar(pdf, classificacao):
+        resumo = resumir_classificacao(classificacao)
+        for chave in totais:
+            totais[chave] += len(resumo[chave])
+        print(
+            f"Processando: {pdf.name} ({len(resumo['nativas'])} página(s) com texto nativo, "
+            f"{len(resumo['ocr'])} para OCR, {len(resumo['ignoradas'])} em branco)"
+        )
+
+    # Diário das páginas concluídas: se o processo morrer no meio do lote, a
+    # próxima execução retoma dele (removido quando as saídas são gravadas)
+    diario = DiarioLote(caminho_diario(output_csv), campos)
+    if pendentes:
+        if not incremental:
+            diario.remover()
+        retomadas = diario.abrir()
+        if retomadas:
+            print(f"Retomando execução interrompida: {retomadas} página(s) já concluída(s) no diário")
         try:
-            # processar_pdf agora retorna uma lista de resultados (um por página)
-            resultados_paginas = processar_pdf(pdf)
-            registros.extend(resultados_paginas)
-        except Exception as e:
-            # em caso de erro geral, registra linha com erro genérico (pelo menos uma página)
-            nome_arquivo = pdf.name
-            registros.append({
-                "arquivo": f"{nome_arquivo} - Página 1",
-                "cnpj": None,
-                "cnpj_erro": f"Erro geral ao processar PDF: {e}",
-                "razao_social": None,
-                "razao_social_erro": f"Erro geral ao processar PDF: {e}",
-                "periodo_apuracao": None,
-                "periodo_apuracao_erro": f"Erro geral ao processar PDF: {e}",
-                "data_vencimento": None,
-                "data_vencimento_erro": f"Erro geral ao processar PDF: {e}",
-                "numero_documento": None,
-                "numero_documento_erro": f"Erro geral ao processar PDF: {e}",
-                "valor_total_documento": None,
-                "valor_total_documento_erro": f"Erro geral ao processar PDF: {e}",
-                "codigo": None,
-                "codigo_erro": f"Erro geral ao processar PDF: {e}",
-                "denominacao": None,
-                "denominacao_erro": f"Erro geral ao processar PDF: {e}",
-                "linha_digitavel": None,
-                "linha_digitavel_erro": f"Erro geral ao processar PDF: {e}",
-            })
-
-    df = pd.DataFrame(registros)
+            processar_lote(
+                entradas() if any(eh_zip(arquivo) for arquivo in pendentes) else pendentes, campos,
+                ao_classificar=ao_classificar, ao_finalizar_arquivo=ao_finalizar_arquivo, diario=diario,
+            )
+        finally:
+            diario.fechar()
+        for arquivo in pendentes:
+            if eh_zip(arquivo) and arquivo.name not in zips_com_erro:
+                manifesto.atualizar(arquivo, registros_por_arquivo[arquivo.name])
+        print(
+            f"Páginas: {totais['nativas']} com texto nativo, {totais['ocr']} via OCR, "
+            f"{totais['ignoradas']} em branco (ignoradas)"
+        )
+    registros = [registro for pdf in pdf_files for registro in registros_por_arquivo.get(pdf.name, [])]
+
+    # Os tempos por etapa (MEDIR_TEMPOS=1) vão para a aba "tempos" do XLSX, não para o CSV
+    colunas = colunas_registro(campos)
+    df = pd.DataFrame([linha_registro(registro, colunas) for registro in registros], columns=colunas)
 
     # salva CSV (mantém formato original para compatibilidade)
     df.to_csv(output_csv, index=False, encoding="utf-8-sig")
     
-    # Separa registros por aba baseado no código para o XLSX
-    registros_servidor = []
-    registros_patronal = []
-    
-    for registro in registros:
-        codigo = registro.get("codigo", "")
-        aba = get_aba_por_codigo(codigo)
-        
-        if aba == "servidor":
-            linha_formatada = formatar_linha_servidor(registro)
-            registros_servidor.append(linha_formatada)
-        elif aba == "patronal-gilrat":
-            linha_formatada = formatar_linha_patronal_gilrat(registro)
-            registros_patronal.append(linha_formatada)
-        # Se aba for None, o registro não será incluído em nenhuma aba
-
-    # Cria DataFrames para cada aba
-    df_servidor = pd.DataFrame(registros_servidor) if registros_servidor else pd.DataFrame()
-    df_patronal = pd.DataFrame(registros_patronal) if registros_patronal else pd.DataFrame()
-
-    # Salva o Excel com múltiplas abas usando ExcelWriter
+    # Separa registros por aba baseado no código para o XLSX (linhas em tuplas)
+    from app.services.excel_generator import COLUNAS_PATRONAL_GILRAT, COLUNAS_SERVIDOR, separar_registros
+    registros_servidor, registros_patronal, _ = separar_registros(registros)
+
+    # Salva o Excel com múltiplas abas usando ExcelWriter (abas vazias só com os cabeçalhos)
     with pd.ExcelWriter(output_xlsx, engine="openpyxl") as writer:
-        # Escreve a aba "servidor" (mesmo que vazia)
-        if registros_servidor:
-            df_servidor.to_excel(writer, sheet_name="servidor", index=False)
-        else:
-            # Cria aba vazia com cabeçalhos
-            df_vazio_servidor = pd.DataFrame(columns=formatar_linha_servidor({}).keys())
-            df_vazio_servidor.to_excel(writer, sheet_name="servidor", index=False)
-        
-        # Escreve a aba "patronal-gilrat" (mesmo que vazia)
-        if registros_patronal:
-            df_patronal.to_excel(writer, sheet_name="patronal-gilrat", index=False)
-        else:
-            # Cria aba vazia com cabeçalhos
-            df_vazio_patronal = pd.DataFrame(columns=formatar_linha_patronal_gilrat({}).keys())
-            df_vazio_patronal.to_excel(writer, sheet_name="patronal-gilrat", index=False)
+        df_servidor = pd.DataFrame(registros_servidor or None, columns=COLUNAS_SERVIDOR)
+        df_servidor.to_excel(writer, sheet_name="servidor", index=False)
+        df_patronal = pd.DataFrame(registros_patronal or None, columns=COLUNAS_PATRONAL_GILRAT)
+        df_patronal.to_excel(writer, sheet_name="patronal-gilrat", index=False)
+
+        registros_tempos = registros_com_tempos(registros)
+        if registros_tempos is not None:
+            from app.services.excel_generator import formatar_linha_tempos
+            linhas_tempos = [formatar_linha_tempos(registro) for registro in registros_tempos]
+            df_tempos = pd.DataFrame(linhas_tempos, columns=formatar_linha_tempos({}).keys())
+            df_tempos.to_excel(writer, sheet_name="tempos", index=False)
+
+    # Depois das saídas: se algo falhar antes, a próxima execução reprocessa os PDFs novos
+    manifesto.salvar()
+    diario.remover()
 
     print(f"\nArquivos gerados:")
     print(f"  - CSV : {output_csv}")
@@ -1478,19 +2258,53 @@ def processar_pasta(pasta_pdf: Path, output_csv: Path, output_xlsx: Path):
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Uso: python parse_darf.py CAMINHO_PASTA_PDFS")
-        sys.exit(1)
+    import argparse
 
-    pasta = Path(sys.argv[1]).expanduser().resolve()
+    parser = argparse.ArgumentParser(
+        prog="parse_darf.py",
+        description="Extrai as informações dos DARFs de uma pasta e gera CSV + XLSX.",
+    )
+    parser.add_argument("pasta", help="Pasta com os arquivos PDF (e .zip com PDFs)")
+    parser.add_argument(
+        "--campos",
+        help=(
+            "Campos a extrair, separados por vírgula (padrão: todos). "
+            f"Disponíveis: {', '.join(CAMPOS_REGISTRO)}"
+        ),
+    )
+    parser.add_argument(
+        "--completo",
+        action="store_true",
+        help="Reprocessa todos os PDFs, ignorando o manifesto da execução anterior",
+    )
+    parser.add_argument(
+        "--vigiar",
+        action="store_true",
+        help="Modo contínuo: vigia a pasta e processa os PDFs conforme chegam (Ctrl+C encerra)",
+    )
+    args = parser.parse_args()
+
+    pasta = Path(args.pasta).expanduser().resolve()
     if not pasta.is_dir():
         print(f"Pasta não encontrada: {pasta}")
         sys.exit(1)
 
+    try:
+        campos = normalizar_campos(args.campos)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
     output_csv = pasta / "resultado_darfs.csv"
     output_xlsx = pasta / "resultado_darfs.xlsx"
 
-    processar_pasta(pasta, output_csv, output_xlsx)
+    if args.vigiar:
+        from app.services.vigia_pasta import vigiar_pasta
+
+        vigiar_pasta(pasta, output_csv, output_xlsx, campos, incremental=not args.completo)
+        return
+
+    processar_pasta(pasta, output_csv, output_xlsx, campos, incremental=not args.completo)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""
+Modo contínuo do processamento de pasta (`python -m app.services.pdf_parser PASTA --vigiar`).
+
+Vigia a pasta (inotify no Linux; varredura a cada VIGIA_INTERVALO_S nos demais
+sistemas ou se o inotify não estiver disponível) e processa os PDFs (e .zip)
+conforme chegam. Um PDF só entra quando seu tamanho e data de modificação ficam
+estáveis por VIGIA_ESTABILIZACAO_S segundos, para não ler arquivos ainda
+sendo copiados. Cada ciclo usa o processamento incremental de
+`processar_pasta` (manifesto) e regrava o CSV e o XLSX.
+
+Entre os ciclos, os processos do motor de lote (com o OCR carregado) e o
+snapshot das regras (código → aba, CNPJ → UO) ficam em memória; as regras
+são relidas do banco a cada VIGIA_REGRAS_RECARGA_S segundos.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.config import Config
+from app.services.batch_engine import encerrar_executores, obter_executor
+from app.services.pdf_parser import aquecer_ocr, normalizar_campos, processar_pasta
+
+try:
+    # Tenta usar a versão direta (sem Flask) primeiro
+    from app.database.direct import carregar_snapshot_regras, definir_snapshot_regras
+except ImportError:
+    carregar_snapshot_regras = definir_snapshot_regras = None
+
+# Eventos do inotify que indicam mudança nos arquivos da pasta
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_EVENTOS = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+class _ObservadorInotify:
+    """Acorda quando algo muda na pasta (Linux)."""
+
+    def __init__(self, pasta: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        if libc.inotify_add_watch(self.fd, os.fsencode(pasta), _EVENTOS) < 0:
+            erro = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(erro, "inotify_add_watch falhou")
+
+    def aguardar(self, timeout: float):
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if prontos:
+            # Os eventos só acordam o laço; a pasta é varrida em seguida
+            try:
+                while os.read(self.fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def fechar(self):
+        os.close(self.fd)
+
+
+class _ObservadorVarredura:
+    """Sem inotify: apenas espera o intervalo até a próxima varredura."""
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+
+    def aguardar(self, timeout: float):
+        time.sleep(min(timeout, self.intervalo))
+
+    def fechar(self):
+        pass
+
+
+def _criar_observador(pasta: Path):
+    if sys.platform.startswith("linux"):
+        try:
+            return _ObservadorInotify(pasta)
+        except (OSError, AttributeError) as e:
+            print(f"inotify indisponível ({e}); usando varredura a cada {Config.VIGIA_INTERVALO_S}s")
+    return _ObservadorVarredura(Config.VIGIA_INTERVALO_S)
+
+
+def _pdfs_estaveis(pasta: Path, vistos: dict, espera: float):
+    """
+    Varre a pasta e separa os PDFs completos dos ainda em gravação.
+
+    Args:
+        pasta: Pasta vigiada
+        vistos: {nome: ((tamanho, mtime_ns), visto desde)} da varredura anterior (atualizado)
+        espera: Segundos sem mudança para o PDF ser considerado completo
+
+    Returns:
+        Tupla (PDFs estáveis, há PDFs aguardando estabilização)
+    """
+    agora = time.monotonic()
+    atuais = {}
+    estaveis = []
+    aguardando = False
+    for pdf in sorted([*pasta.glob("*.pdf"), *pasta.glob("*.zip")]):
+        try:
+            stat = pdf.stat()
+        except FileNotFoundError:
+            continue
+        assinatura = (stat.st_size, stat.st_mtime_ns)
+        anterior = vistos.get(pdf.name)
+        desde = anterior[1] if anterior and anterior[0] == assinatura else agora
+        atuais[pdf.name] = (assinatura, desde)
+        if stat.st_size > 0 and agora - desde >= espera:
+            estaveis.append(pdf)
+        else:
+            aguardando = True
+    vistos.clear()
+    vistos.update(atuais)
+    return estaveis, aguardando
+
+
+def _aquecer_ocr():
+    """Carrega o OCR nos workers da fila de OCR antes do primeiro PDF escaneado."""
+    executor = obter_executor("ocr")
+    futures = [executor.submit(aquecer_ocr) for _ in range(max(1, Config.LOTE_WORKERS_OCR))]
+    if not all(future.result() for future in futures):
+        print("Aviso: OCR não disponível; PDFs escaneados não terão texto extraído.")
+
+
+def vigiar_pasta(
+    pasta_pdf: Path,
+    output_csv: Path,
+    output_xlsx: Path,
+    campos=None,
+    incremental: bool = True,
+    deve_parar: Optional[Callable[[], bool]] = None,
+):
+    """
+    Processa continuamente os PDFs que chegam à pasta, até Ctrl+C ou `deve_parar()`.
+
+    Args:
+        pasta_pdf: Pasta vigiada
+        output_csv: Caminho do CSV (regravado a cada ciclo)
+        output_xlsx: Caminho do XLSX (regravado a cada ciclo)
+        campos: Campos a extrair (None = todos). Ver CAMPOS_REGISTRO.
+        incremental: Se False, o primeiro ciclo reprocessa todos os PDFs
+        deve_parar: Consultado a cada ciclo; se retornar True, encerra
+    """
+    campos = normalizar_campos(campos)
+    observador = _criar_observador(pasta_pdf)
+    print(f"Vigiando {pasta_pdf} ({type(observador).__name__}). Ctrl+C para encerrar.")
+    _aquecer_ocr()
+
+    vistos = {}
+    processados = None  # assinaturas dos PDFs do último ciclo concluído
+    regras_lidas_em = None
+    try:
+        while not (deve_parar and deve_parar()):
+            estaveis, aguardando = _pdfs_estaveis(pasta_pdf, vistos, Config.VIGIA_ESTABILIZACAO_S)
+            assinaturas = {pdf.name: vistos[pdf.name][0] for pdf in estaveis}
+            if estaveis and assinaturas != processados:
+                agora = time.monotonic()
+                if carregar_snapshot_regras and (
+                    regras_lidas_em is None or agora - regras_lidas_em >= Config.VIGIA_REGRAS_RECARGA_S
+                ):
+                    definir_snapshot_regras(carregar_snapshot_regras())
+                    regras_lidas_em = agora
+                try:
+                    processar_pasta(
+                        pasta_pdf, output_csv, output_xlsx, campos,
+                        incremental=incremental or processados is not None, arquivos=estaveis,
+                    )
+                    processados = assinaturas
+                except Exception as e:
+                    # Ex: XLSX aberto no Excel; tenta de novo na próxima varredura
+                    print(f"Erro no ciclo de processamento: {e}")
+            # Com PDFs ainda em gravação, acorda a tempo de conferir se terminaram
+            observador.aguardar(Config.VIGIA_ESTABILIZACAO_S if aguardando else Config.VIGIA_INTERVALO_S)
+    except KeyboardInterrupt:
+        print("\nEncerrando o modo contínuo...")
+    finally:
+        observador.fechar()
+        if definir_snapshot_regras:
+            definir_snapshot_regras(None)
+        encerrar_executores()
@@ -0,0 +1,140 @@
+"""
+PDFs dentro de arquivos .zip (upload web, interface desktop e processamento de pasta).
+
+Os membros .pdf do ZIP são descompactados um a um, em blocos, direto para a
+memória (PdfEmMemoria) e entregues ao motor de lote, sem extrair o arquivo
+inteiro em disco. Com `pasta_grandes`, membros acima de
+UPLOAD_LIMITE_MEMORIA_BYTES vão para essa pasta em vez da memória.
+
+Limites contra "zip bombs" (ZIP_*): número de membros, tamanho de cada membro
+e do total descompactado e taxa de compressão. Os tamanhos declarados no ZIP
+são conferidos antes de descompactar e os bytes realmente produzidos durante a
+descompactação (o cabeçalho pode mentir). ZIPs dentro do ZIP e outros tipos
+de arquivo são ignorados; membros criptografados geram erro.
+"""
+
+import tempfile
+import zipfile
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Iterator, Optional
+
+from werkzeug.utils import secure_filename
+
+from app.config import Config
+from app.services.pdf_parser import PdfEmMemoria
+
+_BLOCO = 256 * 1024
+
+
+class ZipInvalido(ValueError):
+    """ZIP corrompido, criptografado ou acima dos limites ZIP_*."""
+
+
+def eh_zip(arquivo) -> bool:
+    """Indica se o arquivo (caminho, PdfEmMemoria ou nome) é um .zip."""
+    nome = arquivo if isinstance(arquivo, str) else arquivo.name
+    return nome.lower().endswith(".zip")
+
+
+def _membros_pdf(zf: zipfile.ZipFile, nome: str) -> list:
+    membros = [
+        info for info in zf.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(".pdf")
+        # Metadados do macOS (__MACOSX/._arquivo.pdf)
+        and not info.filename.startswith("__MACOSX/")
+    ]
+    if len(membros) > Config.ZIP_MAXIMO_MEMBROS:
+        raise ZipInvalido(f"{nome}: {len(membros)} PDFs (máximo {Config.ZIP_MAXIMO_MEMBROS})")
+    limite_membro = Config.ZIP_TAMANHO_MAXIMO_MEMBRO_MB * 1024 * 1024
+    total = 0
+    for info in membros:
+        if info.flag_bits & 0x1:
+            raise ZipInvalido(f"{nome}: {info.filename} está criptografado")
+        if info.file_size > limite_membro:
+            raise ZipInvalido(f"{nome}: {info.filename} passa de {Config.ZIP_TAMANHO_MAXIMO_MEMBRO_MB} MB")
+        if info.file_size > Config.ZIP_TAXA_MAXIMA_COMPRESSAO * max(info.compress_size, 1):
+            raise ZipInvalido(f"{nome}: taxa de compressão suspeita em {info.filename}")
+        total += info.file_size
+    if total > Config.ZIP_TAMANHO_MAXIMO_TOTAL_MB * 1024 * 1024:
+        raise ZipInvalido(f"{nome}: conteúdo passa de {Config.ZIP_TAMANHO_MAXIMO_TOTAL_MB} MB")
+    return membros
+
+
+def iterar_pdfs_zip(origem, pasta_grandes: Optional[Path] = None) -> Iterator:
+    """
+    Entrega os PDFs de um ZIP, um membro por vez.
+
+    Args:
+        origem: Caminho do ZIP ou PdfEmMemoria com seus bytes
+        pasta_grandes: Pasta para membros acima de UPLOAD_LIMITE_MEMORIA_BYTES
+            (None = todos em memória)
+
+    Yields:
+        PdfEmMemoria (ou caminho em `pasta_grandes`) nomeado "<zip>/<membro>"
+
+    Raises:
+        ZipInvalido: ZIP corrompido, criptografado ou acima dos limites
+    """
+    nome = origem.name
+    arquivo = BytesIO(origem.dados) if isinstance(origem, PdfEmMemoria) else open(origem, "rb")
+    try:
+        try:
+            zf = zipfile.ZipFile(arquivo)
+        except zipfile.BadZipFile as e:
+            raise ZipInvalido(f"{nome}: ZIP inválido ({e})")
+        with zf:
+            membros = _membros_pdf(zf, nome)
+            limite_membro = Config.ZIP_TAMANHO_MAXIMO_MEMBRO_MB * 1024 * 1024
+            restante_total = Config.ZIP_TAMANHO_MAXIMO_TOTAL_MB * 1024 * 1024
+            for info in membros:
+                limite = min(
+                    limite_membro,
+                    restante_total,
+                    Config.ZIP_TAXA_MAXIMA_COMPRESSAO * max(info.compress_size, 1),
+                )
+                nome_membro = f"{nome}/{info.filename}"
+                buffer = BytesIO()
+                saida = buffer
+                caminho = None
+                lidos = 0
+                try:
+                    with zf.open(info) as membro:
+                        while True:
+                            bloco = membro.read(_BLOCO)
+                            if not bloco:
+                                break
+                            lidos += len(bloco)
+                            if lidos > limite:
+                                raise ZipInvalido(f"{nome}: {info.filename} passa dos limites ao descompactar")
+                            if (
+                                caminho is None and pasta_grandes is not None
+                                and lidos > Config.UPLOAD_LIMITE_MEMORIA_BYTES
+                            ):
+                                # Membro grande: continua em disco
+                                pasta = Path(tempfile.mkdtemp(prefix="zip-", dir=pasta_grandes))
+                                caminho = pasta / (secure_filename(PurePosixPath(info.filename).name) or "membro.pdf")
+                                saida = open(caminho, "wb")
+                                saida.write(buffer.getbuffer())
+                                buffer = None
+                            saida.write(bloco)
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError) as e:
+                    # CRC incorreto, senha ou método de compressão não suportado
+                    raise ZipInvalido(f"{nome}: não foi possível ler {info.filename} ({e})")
+                finally:
+                    if caminho is not None:
+                        saida.close()
+                restante_total -= lidos
+                yield caminho if caminho is not None else PdfEmMemoria(nome_membro, buffer)
+    finally:
+        arquivo.close()
+
+
+def expandir_zips(arquivos: Iterable, pasta_grandes: Optional[Path] = None) -> Iterator:
+    """Entrega os arquivos, trocando cada ZIP pelos PDFs que ele contém."""
+    for arquivo in arquivos:
+        if eh_zip(arquivo):
+            yield from iterar_pdfs_zip(arquivo, pasta_grandes)
+        else:
+            yield arquivo
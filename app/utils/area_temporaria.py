@@ -0,0 +1,279 @@
+"""
+Área temporária gerenciada: pastas por requisição, cota e coleta por idade.
+
+Cada requisição que precisa gravar em disco (ex: PDFs acima de
+UPLOAD_LIMITE_MEMORIA_BYTES) recebe uma pasta própria dentro de
+AREA_TEMPORARIA_DIRETORIO, apagada ao fim da requisição. Uma thread em
+segundo plano apaga, a cada AREA_TEMPORARIA_INTERVALO_GC_S, o que sobrou de
+processos encerrados no meio do caminho (pastas mais antigas que
+AREA_TEMPORARIA_IDADE_MAXIMA_S). Se a área passar da cota (bytes ou número de
+arquivos), as entradas mais antigas que não estão em uso são apagadas; se
+ainda assim não houver espaço, a requisição falha com `CotaExcedida`. Estão
+em uso as pastas do próprio processo, as com o pid de um processo vivo no
+nome e as com uma trava (`ARQUIVO_TRAVA`) de um processo vivo, como as
+sessões de /api/envios em processamento.
+
+No executável, os resultados salvos em Downloads (ou %APPDATA%) usam a
+mesma coleta, restrita aos arquivos `resultado_darfs_*.xlsx`.
+
+O uso de disco é exposto em /metrics (`darf_area_temporaria_bytes` e
+`darf_area_temporaria_arquivos`).
+"""
+
+import os
+import secrets
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from app.config import Config
+from app.utils.metricas import registrar_area_temporaria
+
+
+# Arquivo com o pid do processo que usa uma pasta da área (ex: sessão de /api/envios
+# em processamento): enquanto o processo viver, a pasta não é coletada
+ARQUIVO_TRAVA = "processamento.trava"
+
+
+class CotaExcedida(OSError):
+    """A área temporária não tem espaço para a requisição, mesmo após a coleta."""
+
+
+def processo_vivo(pid: int) -> bool:
+    """Indica se há um processo com o pid informado."""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _travada(caminho: Path) -> bool:
+    """Indica se a pasta tem um ARQUIVO_TRAVA com o pid de um processo vivo."""
+    try:
+        pid = int((caminho / ARQUIVO_TRAVA).read_text() or 0)
+    except (OSError, ValueError):
+        return False
+    return processo_vivo(pid)
+
+
+def _medir(caminho: Path):
+    """Tupla (bytes, arquivos) de um arquivo ou pasta (recursivo)."""
+    try:
+        if not caminho.is_dir():
+            return caminho.stat().st_size, 1
+    except FileNotFoundError:
+        return 0, 0
+    total, arquivos = 0, 1
+    for raiz, pastas, nomes in os.walk(caminho):
+        arquivos += len(pastas) + len(nomes)
+        for nome in nomes:
+            try:
+                total += os.lstat(os.path.join(raiz, nome)).st_size
+            except FileNotFoundError:
+                pass
+    return total, arquivos
+
+
+def _apagar(caminho: Path):
+    if caminho.is_dir() and not caminho.is_symlink():
+        shutil.rmtree(caminho, ignore_errors=True)
+    else:
+        caminho.unlink(missing_ok=True)
+
+
+class AreaTemporaria:
+    """
+    Pasta com cota e coleta por idade.
+
+    Uso:
+        area = obter_area_temporaria()
+        with area.diretorio("upload") as pasta:
+            area.reservar(tamanho)  # CotaExcedida se não couber
+            ...
+    """
+
+    def __init__(
+        self,
+        raiz: Path,
+        cota_bytes: int,
+        cota_arquivos: int,
+        idade_maxima_s: float,
+        padrao: str = "*",
+        nome: str = "uploads",
+    ):
+        self.raiz = Path(raiz)
+        self.cota_bytes = cota_bytes
+        self.cota_arquivos = cota_arquivos
+        self.idade_maxima_s = idade_maxima_s
+        self.padrao = padrao
+        self.nome = nome
+        self._ativos = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def diretorio(self, prefixo: str = "req"):
+        """Pasta exclusiva (apagada na saída do bloco). O pid no nome protege pastas em uso por outros processos."""
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        pasta = self.raiz / f"{prefixo}-{os.getpid()}-{secrets.token_hex(6)}"
+        pasta.mkdir()
+        with self._lock:
+            self._ativos.add(pasta)
+        try:
+            yield pasta
+        finally:
+            with self._lock:
+                self._ativos.discard(pasta)
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def uso(self):
+        """Tupla (bytes, arquivos) das entradas da área."""
+        total, arquivos = 0, 0
+        for entrada in self._entradas():
+            tamanho, quantidade = _medir(entrada)
+            total += tamanho
+            arquivos += quantidade
+        return total, arquivos
+
+    def reservar(self, tamanho_bytes: int, arquivos: int = 1):
+        """
+        Garante espaço para gravar `tamanho_bytes` (coletando as entradas
+        antigas, se preciso).
+
+        Raises:
+            CotaExcedida: Se não couber mesmo após a coleta
+        """
+        total, quantidade = self.uso()
+        if self._cabe(total + tamanho_bytes, quantidade + arquivos):
+            return
+        total, quantidade = self.coletar(tamanho_bytes, arquivos)
+        if not self._cabe(total + tamanho_bytes, quantidade + arquivos):
+            raise CotaExcedida(
+                f"Área temporária sem espaço ({total / 1024 / 1024:.0f} MB em {quantidade} "
+                f"arquivos; cota de {self.cota_bytes / 1024 / 1024:.0f} MB e {self.cota_arquivos} arquivos)"
+            )
+
+    def coletar(self, tamanho_bytes: int = 0, arquivos: int = 0, manter=()):
+        """
+        Apaga as entradas que não estão em uso mais antigas que
+        AREA_TEMPORARIA_IDADE_MAXIMA_S e, se a área passar da cota (somando
+        `tamanho_bytes` e `arquivos` a gravar), as mais antigas que não estão em uso.
+
+        Args:
+            tamanho_bytes: Bytes que serão gravados em seguida
+            arquivos: Arquivos que serão gravados em seguida
+            manter: Caminhos que não podem ser apagados (ex: resultado recém-gerado)
+
+        Returns:
+            Tupla (bytes, arquivos) após a coleta
+        """
+        agora = time.time()
+        manter = {Path(p) for p in manter}
+        with self._lock:
+            ativos = set(self._ativos)
+
+        entradas = []
+        for entrada in self._entradas():
+            try:
+                modificado = entrada.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entrada in ativos or entrada in manter:
+                protegido = True
+            else:
+                # Pasta de requisição de outro processo ainda vivo
+                pid = entrada.name.split("-")[1] if entrada.name.count("-") >= 2 else ""
+                protegido = (
+                    pid.isdigit() and int(pid) != os.getpid() and processo_vivo(int(pid))
+                ) or _travada(entrada)
+                if not protegido and self.idade_maxima_s and agora - modificado > self.idade_maxima_s:
+                    _apagar(entrada)
+                    continue
+            tamanho, quantidade = _medir(entrada)
+            entradas.append((modificado, entrada, tamanho, quantidade, protegido))
+
+        total = sum(e[2] for e in entradas)
+        quantidade_total = sum(e[3] for e in entradas)
+        for _, entrada, tamanho, quantidade, protegido in sorted(entradas, key=lambda e: e[0]):
+            if self._cabe(total + tamanho_bytes, quantidade_total + arquivos):
+                break
+            if protegido:
+                continue
+            _apagar(entrada)
+            total -= tamanho
+            quantidade_total -= quantidade
+
+        registrar_area_temporaria(self.nome, total, quantidade_total)
+        return total, quantidade_total
+
+    def iniciar_coleta_periodica(self, intervalo_s: float):
+        """Inicia (uma vez por processo) a thread que chama `coletar()` a cada `intervalo_s`."""
+        if intervalo_s <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._coletar_periodicamente, args=(intervalo_s,),
+                name=f"coleta-area-{self.nome}", daemon=True,
+            )
+            self._thread.start()
+
+    def _coletar_periodicamente(self, intervalo_s: float):
+        while True:
+            try:
+                self.coletar()
+            except Exception as e:
+                print(f"Erro na coleta da área temporária ({self.raiz}): {e}")
+            time.sleep(intervalo_s)
+
+    def _cabe(self, total: int, quantidade: int) -> bool:
+        return (not self.cota_bytes or total <= self.cota_bytes) and (
+            not self.cota_arquivos or quantidade <= self.cota_arquivos
+        )
+
+    def _entradas(self):
+        if not self.raiz.is_dir():
+            return []
+        return list(self.raiz.glob(self.padrao))
+
+
+_area_uploads: Optional[AreaTemporaria] = None
+
+
+def obter_area_temporaria() -> AreaTemporaria:
+    """Área das requisições (AREA_TEMPORARIA_*), com a coleta periódica iniciada no primeiro uso."""
+    global _area_uploads
+    if _area_uploads is None:
+        _area_uploads = AreaTemporaria(
+            Path(Config.AREA_TEMPORARIA_DIRETORIO),
+            Config.AREA_TEMPORARIA_COTA_MB * 1024 * 1024,
+            Config.AREA_TEMPORARIA_COTA_ARQUIVOS,
+            Config.AREA_TEMPORARIA_IDADE_MAXIMA_S,
+        )
+        _area_uploads.iniciar_coleta_periodica(Config.AREA_TEMPORARIA_INTERVALO_GC_S)
+    return _area_uploads
+
+
+def coletar_resultados(pasta: Path, manter: Path):
+    """
+    Aplica a retenção (RESULTADOS_*) aos `resultado_darfs_*.xlsx` salvos pelo
+    executável em `pasta`. Os demais arquivos da pasta não são tocados.
+    """
+    area = AreaTemporaria(
+        pasta,
+        Config.RESULTADOS_COTA_MB * 1024 * 1024,
+        Config.RESULTADOS_MAXIMO,
+        Config.RESULTADOS_IDADE_MAXIMA_DIAS * 24 * 3600,
+        padrao="resultado_darfs_*.xlsx",
+        nome="resultados",
+    )
+    return area.coletar(manter=[manter])
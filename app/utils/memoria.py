@@ -0,0 +1,103 @@
+"""
+Memória dos processos: RSS atual e aposentadoria do worker do gunicorn.
+
+O cache de layout do pdfminer, as imagens do PIL e as arenas do onnxruntime
+fazem o RSS crescer a cada upload grande. Após cada requisição (hook
+`post_request` do gunicorn.conf.py) e cada tarefa em segundo plano (ex:
+/api/envios), o RSS do worker é medido. Acima de WORKER_RSS_MAXIMO_MB, o
+worker é marcado para aposentadoria: termina a requisição atual e as tarefas
+em segundo plano em andamento e recebe o encerramento gracioso do gunicorn
+(SIGTERM), e o mestre cria outro worker no lugar.
+
+Os processos do motor de lote têm reciclagem própria, por páginas e por RSS
+(ver app.services.batch_engine). Usa o `psutil` se estiver instalado; sem ele,
+o RSS é lido de /proc (Linux) ou não é medido.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from app.config import Config
+from app.utils.metricas import registrar_reciclagem, registrar_rss
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_lock = threading.Lock()
+_tarefas_ativas = 0
+# Encerramento gracioso do worker (definido pelo gunicorn.conf.py; None fora do gunicorn)
+_aposentar: Optional[Callable[[], None]] = None
+_marcado = False
+
+
+def rss_atual() -> Optional[int]:
+    """RSS atual do processo em bytes, ou None se não for possível medir."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def definir_aposentadoria(aposentar: Optional[Callable[[], None]]):
+    """Define como encerrar o worker de forma graciosa (ver gunicorn.conf.py)."""
+    global _aposentar
+    _aposentar = aposentar
+
+
+def verificar_memoria(origem: str) -> Optional[int]:
+    """
+    Mede o RSS do worker e, acima de WORKER_RSS_MAXIMO_MB, marca-o para
+    aposentadoria (efetivada quando não houver tarefas em segundo plano).
+
+    Args:
+        origem: O que acabou de terminar ("requisicao", "envio"), para o log
+
+    Returns:
+        RSS em bytes, ou None se não for possível medir
+    """
+    global _marcado
+    rss = rss_atual()
+    if rss is not None:
+        registrar_rss("worker", rss)
+        limite = Config.WORKER_RSS_MAXIMO_MB * 1024 * 1024
+        if limite and rss > limite and _aposentar is not None:
+            with _lock:
+                if not _marcado:
+                    _marcado = True
+                    registrar_reciclagem("worker", "rss")
+                    print(
+                        f"Worker {os.getpid()} com {rss / 1024 / 1024:.0f} MB de RSS após {origem} "
+                        f"(limite {Config.WORKER_RSS_MAXIMO_MB} MB): será substituído"
+                    )
+    _aposentar_se_livre()
+    return rss
+
+
+def _aposentar_se_livre():
+    with _lock:
+        if _marcado and _tarefas_ativas == 0 and _aposentar is not None:
+            _aposentar()
+
+
+@contextmanager
+def tarefa_em_segundo_plano(origem: str):
+    """
+    Bloco de uma tarefa que roda fora das requisições: o worker não é
+    aposentado durante ela, e o RSS é verificado ao final.
+    """
+    global _tarefas_ativas
+    with _lock:
+        _tarefas_ativas += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _tarefas_ativas -= 1
+        verificar_memoria(origem)
@@ -0,0 +1,211 @@
+"""
+Métricas no formato Prometheus (rota /metrics).
+
+Usa `prometheus_client` se estiver instalado; caso contrário, as funções de
+registro não fazem nada e /metrics responde 503.
+
+Agregação entre processos: os workers do gunicorn e os processos do motor de
+lote registram em arquivos no diretório PROMETHEUS_MULTIPROC_DIR, somados na
+leitura de /metrics. Sob o gunicorn, o diretório é preparado em
+`gunicorn.conf.py`, antes da criação dos workers. Fora dele, sem a variável, um
+diretório temporário é criado no primeiro processo e herdado pelos processos
+do motor de lote.
+"""
+
+import atexit
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+if importlib.util.find_spec("prometheus_client") is not None:
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Precisa estar definido antes do import do prometheus_client; removido
+        # ao encerrar o processo que o criou
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="darf_metricas_")
+        atexit.register(shutil.rmtree, os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+else:
+    Counter = None
+
+# Faixas dos histogramas (segundos e bytes)
+FAIXAS_OCR = (0.5, 1, 2, 4, 8, 16, 32, 64)
+FAIXAS_EXTRACAO_NATIVA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+FAIXAS_EXCEL = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAIXAS_ADMISSAO = (0.1, 1, 5, 15, 30, 60, 120, 300)
+FAIXAS_UPLOAD = tuple(1024 * kb for kb in (64, 256, 1024, 4096, 16384, 65536, 102400))
+
+if Counter is not None:
+    PAGINAS_PROCESSADAS = Counter(
+        "darf_paginas_processadas_total", "Páginas extraídas, por caminho (nativo ou ocr)", ["caminho"]
+    )
+    OCR_INVOCACOES = Counter("darf_ocr_invocacoes_total", "Chamadas ao OCR")
+    OCR_LATENCIA = Histogram(
+        "darf_ocr_latencia_segundos", "Duração do OCR de uma página", buckets=FAIXAS_OCR
+    )
+    EXTRACAO_NATIVA_LATENCIA = Histogram(
+        "darf_extracao_nativa_latencia_segundos", "Duração do extract_text de uma página",
+        buckets=FAIXAS_EXTRACAO_NATIVA,
+    )
+    FALHAS_CAMPO = Counter(
+        "darf_falhas_extracao_total", "Campos não extraídos ou inválidos, por campo", ["campo"]
+    )
+    CONSULTAS_REGRAS = Counter(
+        "darf_consultas_regras_total",
+        "Consultas às regras (código → aba, CNPJ → UO), por resultado",
+        ["regra", "resultado"],
+    )
+    UPLOAD_TAMANHO = Histogram(
+        "darf_upload_bytes", "Tamanho de cada PDF enviado", buckets=FAIXAS_UPLOAD
+    )
+    EXCEL_LATENCIA = Histogram(
+        "darf_excel_geracao_segundos", "Duração da geração do XLSX", buckets=FAIXAS_EXCEL
+    )
+    ARTEFATOS = Counter(
+        "darf_artefatos_total",
+        "Resultados de lote entregues, por origem (gerado ou reaproveitado do armazém)",
+        ["resultado"],
+    )
+    ADMISSOES = Counter(
+        "darf_admissao_total",
+        "Lotes pelo controle de admissão, por resultado (leve, admitido ou recusado)",
+        ["resultado"],
+    )
+    ADMISSAO_ESPERA = Histogram(
+        "darf_admissao_espera_segundos", "Espera de um lote pesado por uma vaga para OCR",
+        buckets=FAIXAS_ADMISSAO,
+    )
+    # Maior valor entre os processos vivos (ver child_exit em gunicorn.conf.py)
+    PROCESSO_RSS = Gauge(
+        "darf_processo_rss_bytes",
+        "RSS do worker (após cada requisição) e do último processo de cada fila do motor de lote a concluir uma tarefa",
+        ["processo"],
+        multiprocess_mode="livemax",
+    )
+    RECICLAGENS = Counter(
+        "darf_reciclagens_total",
+        "Workers do gunicorn aposentados e pools do motor de lote substituídos, por motivo (rss ou paginas)",
+        ["processo", "motivo"],
+    )
+    # Valor da última coleta, de qualquer processo
+    AREA_TEMPORARIA_BYTES = Gauge(
+        "darf_area_temporaria_bytes", "Bytes ocupados na área temporária, por área", ["area"],
+        multiprocess_mode="mostrecent",
+    )
+    AREA_TEMPORARIA_ARQUIVOS = Gauge(
+        "darf_area_temporaria_arquivos", "Arquivos e pastas na área temporária, por área", ["area"],
+        multiprocess_mode="mostrecent",
+    )
+
+
+def metricas_disponiveis() -> bool:
+    """Indica se o prometheus_client está instalado."""
+    return Counter is not None
+
+
+def registrar_pagina(caminho: str):
+    """Conta uma página extraída ("nativo" ou "ocr")."""
+    if Counter is not None:
+        PAGINAS_PROCESSADAS.labels(caminho).inc()
+
+
+def registrar_ocr(segundos: float):
+    """Registra uma chamada ao OCR e sua duração."""
+    if Counter is not None:
+        OCR_INVOCACOES.inc()
+        OCR_LATENCIA.observe(segundos)
+
+
+def registrar_extracao_nativa(segundos: float):
+    if Counter is not None:
+        EXTRACAO_NATIVA_LATENCIA.observe(segundos)
+
+
+def registrar_falhas_campos(registro: dict, campos):
+    """Conta os campos do registro que têm mensagem de erro."""
+    if Counter is not None:
+        for campo in campos:
+            if registro.get(f"{campo}_erro"):
+                FALHAS_CAMPO.labels(campo).inc()
+
+
+def registrar_consulta_regra(regra: str, encontrada: bool):
+    """Conta uma consulta às regras ("codigo" ou "cnpj"), encontrada ou não."""
+    if Counter is not None:
+        CONSULTAS_REGRAS.labels(regra, "encontrada" if encontrada else "nao_encontrada").inc()
+
+
+def registrar_upload(tamanho_bytes: int):
+    if Counter is not None:
+        UPLOAD_TAMANHO.observe(tamanho_bytes)
+
+
+def registrar_area_temporaria(area: str, tamanho_bytes: int, arquivos: int):
+    """Registra o uso de disco de uma área temporária ("uploads" ou "resultados")."""
+    if Counter is not None:
+        AREA_TEMPORARIA_BYTES.labels(area).set(tamanho_bytes)
+        AREA_TEMPORARIA_ARQUIVOS.labels(area).set(arquivos)
+
+
+def registrar_artefato(resultado: str):
+    """Conta um resultado de lote entregue ("gerado", "com_falhas" ou "reaproveitado")."""
+    if Counter is not None:
+        ARTEFATOS.labels(resultado).inc()
+
+
+def registrar_admissao(resultado: str, espera_s: float = None):
+    """Conta um lote no controle de admissão ("leve", "admitido" ou "recusado") e a espera do admitido."""
+    if Counter is not None:
+        ADMISSOES.labels(resultado).inc()
+        if espera_s is not None:
+            ADMISSAO_ESPERA.observe(espera_s)
+
+
+def registrar_rss(processo: str, rss_bytes: int):
+    """Registra o RSS do worker ("worker") ou de um processo do motor de lote ("nativa", "ocr")."""
+    if Counter is not None:
+        PROCESSO_RSS.labels(processo).set(rss_bytes)
+
+
+def registrar_reciclagem(processo: str, motivo: str):
+    """Conta a aposentadoria do worker ou a substituição de um pool do motor de lote."""
+    if Counter is not None:
+        RECICLAGENS.labels(processo, motivo).inc()
+
+
+@contextmanager
+def medir_geracao_excel():
+    """Mede a duração da geração do XLSX."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if Counter is not None:
+            EXCEL_LATENCIA.observe(time.perf_counter() - inicio)
+
+
+def gerar_metricas():
+    """
+    Agrega as métricas de todos os processos.
+
+    Returns:
+        Tupla (conteúdo, content type) no formato de texto do Prometheus,
+        ou None se o prometheus_client não estiver instalado.
+    """
+    if Counter is None:
+        return None
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
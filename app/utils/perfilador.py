@@ -0,0 +1,146 @@
+"""
+Perfilador por amostragem, ativado sob demanda.
+
+Uma thread amostra a pilha de chamadas das threads perfiladas a cada
+PERFIL_INTERVALO_MS e grava as pilhas no formato "folded" (uma linha
+"quadro;quadro;... contagem" por pilha), aceito por flamegraph.pl, inferno
+e speedscope. Cada perfil é salvo em PERFIL_DIRETORIO/<id da requisição>.folded.
+
+Ativação:
+- cabeçalho `X-Perfilar: 1` em uma requisição de usuário autenticado;
+- PERFILAR=1 para perfilar todas as requisições decoradas com `perfilavel`.
+
+Durante um perfil, o motor de lote processa as páginas na própria thread
+(sem processos auxiliares), para que o trabalho apareça no perfil.
+Desligado, nada é medido: o decorador só consulta a configuração e o cabeçalho.
+"""
+
+import contextvars
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from flask import make_response, request, session
+
+from app.config import Config
+
+# Indica, para o motor de lote, que a execução atual está sendo perfilada
+_perfil_ativo = contextvars.ContextVar("perfil_ativo", default=False)
+
+
+def perfil_ativo() -> bool:
+    """Indica se a execução atual está sendo perfilada."""
+    return _perfil_ativo.get()
+
+
+class AmostradorPerfil:
+    """
+    Amostra as pilhas de chamadas de uma thread (e das threads que ela criar)
+    em intervalos fixos.
+    """
+
+    def __init__(self, intervalo_ms: float = None):
+        self.intervalo = (intervalo_ms or Config.PERFIL_INTERVALO_MS) / 1000
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+        self._ignorar = set()
+
+    def iniciar(self):
+        # Threads que já existiam (exceto a atual) não fazem parte do perfil
+        self._ignorar = set(sys._current_frames()) - {threading.get_ident()}
+        self._thread = threading.Thread(target=self._amostrar, name="perfilador", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _amostrar(self):
+        proprio = threading.get_ident()
+        nomes = {}
+        while not self._parar.wait(self.intervalo):
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio or ident in self._ignorar:
+                    continue
+                if ident not in nomes:
+                    nomes = {t.ident: t.name for t in threading.enumerate()}
+                quadros = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    quadros.append(
+                        f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                quadros.append(nomes.get(ident, str(ident)))
+                self.pilhas[";".join(reversed(quadros))] += 1
+            self.amostras += 1
+
+    def salvar(self, caminho: Path) -> Path:
+        """Grava as pilhas no formato folded."""
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            for pilha, contagem in self.pilhas.most_common():
+                f.write(f"{pilha} {contagem}\n")
+        return caminho
+
+
+@contextmanager
+def perfilar(chave: str, diretorio: Path = None):
+    """
+    Executa o bloco sob o perfilador e salva o perfil em `diretorio`/`chave`.folded.
+
+    Uso (ex: um job):
+        with perfilar(job_id):
+            processar_lote(pdf_paths)
+    """
+    chave = re.sub(r"[^A-Za-z0-9_.-]", "_", chave)[:100] or uuid.uuid4().hex
+    destino = Path(diretorio or Config.PERFIL_DIRETORIO) / f"{chave}.folded"
+    amostrador = AmostradorPerfil()
+    token = _perfil_ativo.set(True)
+    amostrador.iniciar()
+    try:
+        yield destino
+    finally:
+        amostrador.parar()
+        _perfil_ativo.reset(token)
+        amostrador.salvar(destino)
+
+
+def _perfil_solicitado() -> bool:
+    if Config.PERFILAR:
+        return True
+    if request.headers.get(Config.PERFIL_CABECALHO) != "1":
+        return False
+    # O cabeçalho só vale para usuários autenticados (ver msal_auth.py)
+    return bool(session.get(Config.SESSION_USER_KEY))
+
+
+def perfilavel(view_func):
+    """
+    Decorator que executa a rota sob o perfilador quando solicitado.
+
+    O perfil é salvo com o id da requisição (cabeçalho X-Request-ID ou um novo
+    id), devolvido no cabeçalho X-Perfil-Id da resposta.
+    """
+
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        if not _perfil_solicitado():
+            return view_func(*args, **kwargs)
+
+        request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        with perfilar(request_id) as destino:
+            resposta = make_response(view_func(*args, **kwargs))
+        resposta.headers["X-Perfil-Id"] = destino.stem
+        return resposta
+
+    return wrapper
@@ -0,0 +1,321 @@
+"""
+Rastreamento por spans: requisição → arquivo → página → etapa.
+
+Com RASTREAR=1, cada span (nome, ids do trace, do span e do pai, início,
+duração e atributos) é gravado como uma linha JSON em
+RASTREAMENTO_DIRETORIO/spans-<pid>.jsonl, com rotação por tamanho. Cada
+processo (workers do gunicorn e do motor de lote) grava no próprio arquivo; o
+contexto do span pai é repassado às tarefas enviadas aos processos do lote.
+
+Se OTEL_EXPORTER_OTLP_ENDPOINT estiver definido e os pacotes
+`opentelemetry-sdk` e `opentelemetry-exporter-otlp-proto-http` estiverem
+instalados, os spans também são enviados ao coletor OTLP (ex: um coletor local).
+
+Desligado (padrão), `span()` devolve um contexto vazio compartilhado.
+
+Resumo dos spans mais lentos:
+    python -m app.utils.rastreamento [--diretorio DIR] [--nome pagina] [--top 20]
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import secrets
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+RASTREAR = os.getenv("RASTREAR", "0") == "1"
+RASTREAMENTO_DIRETORIO = os.getenv(
+    "RASTREAMENTO_DIRETORIO", os.path.join(tempfile.gettempdir(), "darf_rastreamento")
+)
+RASTREAMENTO_TAMANHO_MAXIMO_MB = int(os.getenv("RASTREAMENTO_TAMANHO_MAXIMO_MB", "10"))
+RASTREAMENTO_ARQUIVOS_ROTACIONADOS = int(os.getenv("RASTREAMENTO_ARQUIVOS_ROTACIONADOS", "5"))
+
+# Span atual: (trace_id, span_id)
+_contexto = contextvars.ContextVar("span_atual", default=None)
+_NULO = nullcontext()
+
+_logger = None
+_processador_otlp = None
+
+
+def _obter_logger():
+    """Cria, na primeira chamada do processo, o arquivo JSONL rotativo do processo."""
+    global _logger
+    if _logger is None:
+        os.makedirs(RASTREAMENTO_DIRETORIO, exist_ok=True)
+        logger = logging.getLogger(f"darf.rastreamento.{os.getpid()}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            os.path.join(RASTREAMENTO_DIRETORIO, f"spans-{os.getpid()}.jsonl"),
+            maxBytes=RASTREAMENTO_TAMANHO_MAXIMO_MB * 1024 * 1024,
+            backupCount=RASTREAMENTO_ARQUIVOS_ROTACIONADOS,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+        _iniciar_otlp()
+    return _logger
+
+
+def _iniciar_otlp():
+    """Configura o envio OTLP, se houver endpoint e os pacotes do OpenTelemetry."""
+    global _processador_otlp
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print("OTEL_EXPORTER_OTLP_ENDPOINT definido, mas o OpenTelemetry não está instalado.",
+              file=sys.stderr)
+        return
+    # O exportador lê o endpoint das variáveis OTEL_EXPORTER_OTLP_*
+    _processador_otlp = BatchSpanProcessor(OTLPSpanExporter())
+    atexit.register(_processador_otlp.shutdown)
+
+
+def _exportar_otlp(registro: dict):
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan
+    from opentelemetry.trace import SpanContext, TraceFlags
+
+    def contexto(span_id):
+        return SpanContext(
+            int(registro["trace_id"], 16), int(span_id, 16), is_remote=False,
+            trace_flags=TraceFlags(TraceFlags.SAMPLED),
+        )
+
+    inicio_ns = int(registro["inicio"] * 1e9)
+    _processador_otlp.on_end(ReadableSpan(
+        name=registro["nome"],
+        context=contexto(registro["span_id"]),
+        parent=contexto(registro["pai_id"]) if registro["pai_id"] else None,
+        resource=Resource.create({"service.name": "extrator-darf"}),
+        attributes={k: v for k, v in registro["atributos"].items() if v is not None},
+        start_time=inicio_ns,
+        end_time=inicio_ns + int(registro["duracao_ms"] * 1e6),
+    ))
+
+
+def _gravar(trace_id, span_id, pai, nome, inicio, duracao, atributos):
+    registro = {
+        "trace_id": trace_id,
+        "span_id": span_id,
+        "pai_id": pai[1] if pai else None,
+        "nome": nome,
+        "inicio": round(inicio, 6),
+        "duracao_ms": round(duracao * 1000, 3),
+        "pid": os.getpid(),
+        "atributos": atributos,
+    }
+    _obter_logger().info(json.dumps(registro, ensure_ascii=False, default=str))
+    if _processador_otlp is not None:
+        _exportar_otlp(registro)
+
+
+def registrar_span(nome: str, inicio: float, duracao: float, pai=None, **atributos):
+    """
+    Grava um span já medido.
+
+    Args:
+        nome: Nome do span (ex: "pagina", "ocr.det")
+        inicio: Início (time.time())
+        duracao: Duração em segundos
+        pai: Contexto (trace_id, span_id) do pai; padrão: o span atual
+        atributos: Atributos do span (valores serializáveis em JSON)
+
+    Returns:
+        id do span gravado (None se o rastreamento estiver desligado)
+    """
+    if not RASTREAR:
+        return None
+    pai = pai if pai is not None else _contexto.get()
+    trace_id = pai[0] if pai else secrets.token_hex(16)
+    span_id = secrets.token_hex(8)
+    _gravar(trace_id, span_id, pai, nome, inicio, duracao, atributos)
+    return span_id
+
+
+class Span:
+    """Span aberto explicitamente (ex: um arquivo cujas páginas terminam em outros processos)."""
+
+    def __init__(self, nome: str, pai=None, **atributos):
+        self.nome = nome
+        self.atributos = atributos
+        self.pai = pai if pai is not None else _contexto.get()
+        self.trace_id = self.pai[0] if self.pai else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.inicio = time.time()
+        self._inicio_perf = time.perf_counter()
+
+    @property
+    def contexto(self):
+        return (self.trace_id, self.span_id)
+
+    def finalizar(self, **atributos):
+        self.atributos.update(atributos)
+        _gravar(
+            self.trace_id, self.span_id, self.pai, self.nome, self.inicio,
+            time.perf_counter() - self._inicio_perf, self.atributos,
+        )
+
+
+class _SpanInativo:
+    contexto = None
+
+    def finalizar(self, **atributos):
+        pass
+
+
+SPAN_INATIVO = _SpanInativo()
+
+
+def iniciar_span(nome: str, pai=None, **atributos):
+    """Abre um span sem torná-lo o span atual; feche com `finalizar()`."""
+    if not RASTREAR:
+        return SPAN_INATIVO
+    return Span(nome, pai, **atributos)
+
+
+@contextmanager
+def _span_ativo(nome: str, atributos: dict):
+    aberto = Span(nome, **atributos)
+    token = _contexto.set(aberto.contexto)
+    try:
+        yield aberto
+    except Exception as e:
+        aberto.atributos["erro"] = str(e)
+        raise
+    finally:
+        _contexto.reset(token)
+        aberto.finalizar()
+
+
+def span(nome: str, **atributos):
+    """
+    Contexto que grava um span filho do span atual.
+
+    Uso:
+        with span("classificar", arquivo=pdf_path.name):
+            ...
+    """
+    if not RASTREAR:
+        return _NULO
+    return _span_ativo(nome, atributos)
+
+
+def contexto_atual():
+    """Contexto (trace_id, span_id) do span atual, para repassar a outro processo."""
+    return _contexto.get()
+
+
+def executar_no_contexto(contexto, fn, *args, **kwargs):
+    """Executa `fn` com `contexto` como span pai (usado nas tarefas do motor de lote)."""
+    token = _contexto.set(contexto)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _contexto.reset(token)
+
+
+def rastreado(nome: str):
+    """Decorator que envolve uma rota Flask em um span de requisição."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            if not RASTREAR:
+                return view_func(*args, **kwargs)
+            from flask import request
+
+            with span(nome, metodo=request.method, rota=request.path,
+                      request_id=request.headers.get("X-Request-ID")):
+                return view_func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ======================================================================
+# RESUMO (linha de comando)
+# ======================================================================
+
+def ler_spans(diretorio: Path):
+    """Lê os spans de todos os arquivos JSONL (inclusive os rotacionados) do diretório."""
+    for arquivo in sorted(Path(diretorio).glob("spans-*.jsonl*")):
+        with open(arquivo, encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if linha:
+                    try:
+                        yield json.loads(linha)
+                    except json.JSONDecodeError:
+                        continue
+
+
+def _percentil(ordenados: list, p: float):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def resumir_spans(spans: list[dict], nome: str = None, top: int = 20) -> str:
+    """Monta o resumo: percentis por nome de span e os spans mais lentos com seus ancestrais."""
+    por_id = {s["span_id"]: s for s in spans}
+    duracoes = {}
+    for s in spans:
+        duracoes.setdefault(s["nome"], []).append(s["duracao_ms"])
+
+    linhas = [f"{'span':<36} {'n':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}"]
+    for nome_span, valores in sorted(duracoes.items(), key=lambda i: -sum(i[1])):
+        valores.sort()
+        linhas.append(
+            f"{nome_span:<36} {len(valores):>7} {_percentil(valores, 0.5):>10.1f} "
+            f"{_percentil(valores, 0.95):>10.1f} {_percentil(valores, 0.99):>10.1f} {valores[-1]:>10.1f}"
+        )
+
+    selecionados = [s for s in spans if nome is None or s["nome"] == nome]
+    selecionados.sort(key=lambda s: -s["duracao_ms"])
+    linhas.append("")
+    linhas.append(f"Spans mais lentos{f' ({nome})' if nome else ''}:")
+    for s in selecionados[:top]:
+        caminho = []
+        atual = por_id.get(s["pai_id"])
+        while atual is not None:
+            caminho.append(atual["nome"])
+            atual = por_id.get(atual["pai_id"])
+        atributos = ", ".join(f"{k}={v}" for k, v in s["atributos"].items() if v is not None)
+        linhas.append(
+            f"{s['duracao_ms']:>10.1f} ms  {' > '.join(list(reversed(caminho)) + [s['nome']])}"
+            f"  [{atributos}]  trace={s['trace_id']}"
+        )
+    return "\n".join(linhas)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resume os spans gravados com RASTREAR=1.")
+    parser.add_argument("--diretorio", default=RASTREAMENTO_DIRETORIO)
+    parser.add_argument("--nome", help="Lista apenas spans com este nome (ex: pagina)")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    spans = list(ler_spans(Path(args.diretorio)))
+    if not spans:
+        print(f"Nenhum span encontrado em: {args.diretorio}")
+        return
+    print(resumir_spans(spans, args.nome, args.top))
+
+
+if __name__ == "__main__":
+    main()
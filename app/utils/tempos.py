@@ -0,0 +1,130 @@
+"""
+Medição de tempos por etapa da extração.
+
+Quando MEDIR_TEMPOS=1, cada registro recebe a chave "tempos" com a duração de
+cada etapa (abertura do PDF, extração de texto, renderização, OCR e cada
+extrator) e o caminho seguido (texto nativo ou OCR, DPI, leitura antecipada).
+Desligado, o cronômetro inativo não mede nada. Cada etapa também é um span
+do rastreamento (ver app.utils.rastreamento).
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from app.utils.rastreamento import span
+
+MEDIR_TEMPOS = os.getenv("MEDIR_TEMPOS", "0") == "1"
+
+# Etapas medidas, na ordem das colunas da aba "tempos"
+ETAPAS = (
+    "abrir_pdf",
+    "extract_text",
+    "espera_renderizacao",
+    "renderizacao",
+    "ocr",
+    "extrair_linha_digitavel",
+    "extrair_cnpj_e_razao_social",
+    "extrair_periodo_vencimento_numdoc",
+    "extrair_valor_total",
+    "extrair_codigo_e_denom",
+)
+
+# Caminhos possíveis de uma página
+CAMINHO_NATIVO = "nativo"
+CAMINHO_OCR = "ocr"
+CAMINHO_OCR_FALLBACK = "ocr_fallback"  # texto nativo insuficiente, OCR em seguida
+
+
+class Cronometro:
+    """
+    Acumula a duração de cada etapa do processamento de uma página.
+
+    Uso:
+        cronometro = criar_cronometro()
+        with cronometro.etapa("ocr"):
+            ...
+        if cronometro.ativo:
+            registro["tempos"] = cronometro.resultado()
+    """
+
+    ativo = True
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.caminho = None
+        self.dpi = None
+        self.cache = None
+
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            with span(nome):
+                yield
+        finally:
+            self.registrar(nome, time.perf_counter() - inicio)
+
+    def registrar(self, nome: str, segundos: float):
+        """Soma uma duração já medida (ex: renderização feita em outra thread)."""
+        if segundos is not None:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def definir_caminho(self, caminho: str, dpi: int = None, cache: bool = None):
+        self.caminho = caminho
+        self.dpi = dpi
+        self.cache = cache
+
+    def resultado(self) -> dict:
+        """
+        Returns:
+            {"caminho", "dpi", "cache", "total_ms", "etapas_ms": {etapa: ms}}
+        """
+        return {
+            "caminho": self.caminho,
+            "dpi": self.dpi,
+            "cache": self.cache,
+            "total_ms": round((time.perf_counter() - self.inicio) * 1000, 2),
+            "etapas_ms": {nome: round(s * 1000, 2) for nome, s in self.etapas.items()},
+        }
+
+
+class _CronometroInativo:
+    """Cronômetro que não mede nada (MEDIR_TEMPOS desligado)."""
+
+    ativo = False
+
+    def etapa(self, nome: str):
+        # Ainda grava o span da etapa se o rastreamento estiver ligado (RASTREAR=1)
+        return span(nome)
+
+    def registrar(self, nome: str, segundos: float):
+        pass
+
+    def definir_caminho(self, caminho: str, dpi: int = None, cache: bool = None):
+        pass
+
+    def resultado(self) -> dict:
+        return {}
+
+
+CRONOMETRO_INATIVO = _CronometroInativo()
+
+
+def criar_cronometro():
+    """Retorna um novo Cronometro, ou o cronômetro inativo se MEDIR_TEMPOS estiver desligado."""
+    return Cronometro() if MEDIR_TEMPOS else CRONOMETRO_INATIVO
+
+
+def registros_com_tempos(registros: list[dict]):
+    """
+    Seleciona os registros com tempos para a aba "tempos" do Excel.
+
+    Returns:
+        Lista de registros com a chave "tempos", ou None se MEDIR_TEMPOS estiver
+        desligado (sem aba "tempos").
+    """
+    if not MEDIR_TEMPOS:
+        return None
+    return [registro for registro in registros if registro.get("tempos")]
@@ -0,0 +1,187 @@
+"""
+Leitura dos PDFs enviados nas rotas de upload.
+
+PDFs de até UPLOAD_LIMITE_MEMORIA_BYTES são processados direto da memória
+(PdfEmMemoria), sem passar pelo disco. Os maiores são gravados na pasta da
+requisição na área temporária gerenciada (ver `area_temporaria`), apagada
+quando a requisição termina.
+
+Em /upload, o corpo multipart é lido aos poucos (`UploadsEmFluxo`): cada PDF
+entra no motor de lote assim que sua parte termina de chegar, enquanto os
+seguintes ainda estão sendo transferidos. Os PDFs de um .zip entram quando o
+ZIP termina de chegar (o índice do ZIP fica no fim do arquivo).
+"""
+
+import hashlib
+from io import BytesIO
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from app.config import Config
+from app.services.pdf_parser import PdfEmMemoria
+from app.services.zip_pdfs import eh_zip, iterar_pdfs_zip
+from app.utils.area_temporaria import obter_area_temporaria
+from app.utils.metricas import registrar_upload
+from app.utils.validators import allowed_file
+
+# Bytes lidos do corpo da requisição por vez
+TAMANHO_BLOCO_UPLOAD = 16 * 1024
+
+
+def _tamanho_upload(file: FileStorage) -> int:
+    stream = file.stream
+    inicio = stream.tell()
+    stream.seek(0, 2)
+    tamanho = stream.tell() - inicio
+    stream.seek(inicio)
+    return tamanho
+
+
+def ler_upload(file: FileStorage, idx: int, temp_dir: Path):
+    """
+    Prepara um PDF enviado para o motor de lote.
+
+    Args:
+        file: Arquivo do formulário
+        idx: Posição do arquivo no upload (subpasta em disco; preserva nomes repetidos)
+        temp_dir: Pasta temporária da requisição (usada só por PDFs grandes)
+
+    Returns:
+        PdfEmMemoria ou o caminho do PDF gravado em `temp_dir`
+
+    Raises:
+        CotaExcedida: Se o PDF não couber na cota da área temporária
+    """
+    # Trata o nome do arquivo para evitar problemas de segurança
+    filename = secure_filename(file.filename) or f"arquivo_{idx + 1}.pdf"
+    tamanho = _tamanho_upload(file)
+    registrar_upload(tamanho)
+
+    if tamanho <= Config.UPLOAD_LIMITE_MEMORIA_BYTES:
+        return PdfEmMemoria(filename, file.stream.read())
+
+    obter_area_temporaria().reservar(tamanho, arquivos=2)
+    file_dir = temp_dir / str(idx)
+    file_dir.mkdir()
+    file_path = file_dir / filename
+    file.save(str(file_path))
+    return file_path
+
+
+class _ParteUpload:
+    """PDF sendo recebido: em memória até UPLOAD_LIMITE_MEMORIA_BYTES, depois em disco."""
+
+    def __init__(self, filename: str, idx: int, temp_dir: Path, limite_reserva: int):
+        self.filename = filename
+        self.idx = idx
+        self.temp_dir = temp_dir
+        self.limite_reserva = limite_reserva
+        self.tamanho = 0
+        self.sha256 = hashlib.sha256()
+        self.buffer = BytesIO()
+        self.arquivo = None
+        self.file_path = None
+
+    def escrever(self, dados: bytes):
+        self.tamanho += len(dados)
+        self.sha256.update(dados)
+        if self.arquivo is None and self.tamanho > Config.UPLOAD_LIMITE_MEMORIA_BYTES:
+            # Passou do limite de memória: continua em disco. O restante do corpo
+            # da requisição é o máximo que esta parte ainda pode ocupar.
+            obter_area_temporaria().reservar(self.limite_reserva, arquivos=2)
+            file_dir = self.temp_dir / str(self.idx)
+            file_dir.mkdir()
+            self.file_path = file_dir / self.filename
+            self.arquivo = open(self.file_path, "wb")
+            self.arquivo.write(self.buffer.getbuffer())
+            self.buffer = None
+        if self.arquivo is not None:
+            self.arquivo.write(dados)
+        else:
+            self.buffer.write(dados)
+
+    def finalizar(self):
+        registrar_upload(self.tamanho)
+        if self.arquivo is None:
+            return PdfEmMemoria(self.filename, self.buffer)
+        self.arquivo.close()
+        return self.file_path
+
+    def descartar(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+
+
+class UploadsEmFluxo:
+    """
+    PDFs de um upload multipart entregues conforme chegam.
+
+    Uso:
+        uploads = UploadsEmFluxo(request, temp_dir)
+        registros = processar_lote(iter(uploads))  # lido na thread do motor de lote
+        uploads.arquivos, uploads.pdfs  # partes recebidas no campo / PDFs válidos
+        uploads.entradas  # (nome, sha256) de cada PDF ou ZIP recebido, para chave_artefato
+
+    O stream, o boundary e o tamanho são obtidos no construtor, na thread da
+    requisição (o proxy `request` do Flask não vale em outras threads).
+    """
+
+    def __init__(self, request, temp_dir: Path, campo: str = "files"):
+        self.stream = request.stream
+        self.boundary = request.mimetype_params.get("boundary", "").encode("latin-1")
+        self.restante = request.content_length or Config.MAX_CONTENT_LENGTH
+        self.temp_dir = temp_dir
+        self.campo = campo
+        # Partes recebidas no campo (com nome de arquivo) e, delas, PDFs
+        self.arquivos = 0
+        self.pdfs = 0
+        self.entradas = []
+
+    def __iter__(self):
+        if not self.boundary:
+            raise ValueError("Requisição multipart sem boundary")
+        decoder = MultipartDecoder(self.boundary)
+        parte = None
+        lidos = 0
+        try:
+            while True:
+                bloco = self.stream.read(TAMANHO_BLOCO_UPLOAD)
+                lidos += len(bloco)
+                decoder.receive_data(bloco or None)
+                evento = decoder.next_event()
+                while not isinstance(evento, NeedData):
+                    if isinstance(evento, File):
+                        parte = None
+                        if evento.name == self.campo and evento.filename:
+                            self.arquivos += 1
+                            if allowed_file(evento.filename):
+                                # Trata o nome do arquivo para evitar problemas de segurança
+                                filename = secure_filename(evento.filename) or f"arquivo_{self.pdfs + 1}.pdf"
+                                parte = _ParteUpload(
+                                    filename, self.pdfs, self.temp_dir, max(0, self.restante - lidos)
+                                )
+                                self.pdfs += 1
+                    elif isinstance(evento, Data):
+                        if parte is not None:
+                            parte.escrever(evento.data)
+                            if not evento.more_data:
+                                self.entradas.append((parte.filename, parte.sha256.hexdigest()))
+                                pronto, parte = parte.finalizar(), None
+                                if eh_zip(pronto):
+                                    yield from iterar_pdfs_zip(pronto, self.temp_dir)
+                                else:
+                                    yield pronto
+                    elif isinstance(evento, Epilogue):
+                        return
+                    else:
+                        # Campo comum do formulário (ignorado)
+                        parte = None
+                    evento = decoder.next_event()
+                if not bloco:
+                    raise ValueError("Upload interrompido antes do fim do corpo multipart")
+        finally:
+            if parte is not None:
+                parte.descartar()
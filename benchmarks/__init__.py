@@ -0,0 +1,6 @@
+"""
+Benchmarks de desempenho da extração de DARFs.
+
+Os scripts deste pacote são executados com `python -m benchmarks.<nome>` a
+partir da raiz do projeto.
+"""
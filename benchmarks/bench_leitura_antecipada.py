@@ -0,0 +1,85 @@
+"""
+Benchmark da renderização antecipada no OCR de PDFs escaneados.
+
+Compara o processamento das páginas escaneadas de um PDF sem leitura
+antecipada (renderiza a página N+1 só depois do OCR da página N) com a
+leitura antecipada de K páginas em segundo plano.
+
+Uso:
+    python -m benchmarks.bench_leitura_antecipada [--pdf ARQUIVO.pdf] [--paginas 50] [-k 2]
+
+Sem --pdf, gera um PDF escaneado sintético com o número de páginas pedido.
+O resultado é impresso em JSON.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.pdf_parser import (
+    OCR_LEITURA_ANTECIPADA,
+    _obter_ocr_reader,
+    obter_total_paginas,
+    processar_paginas_ocr,
+)
+from benchmarks.gerador import escrever_pdf, gerar_dados_darf, linhas_darf, rasterizar_pagina
+
+
+def gerar_pdf_escaneado(destino: Path, paginas: int, seed: int = 42) -> Path:
+    """Gera um PDF só com páginas escaneadas de DARFs sintéticos."""
+    rng = random.Random(seed)
+    conteudo = [
+        rasterizar_pagina(linhas_darf(gerar_dados_darf(rng)), rng) for _ in range(paginas)
+    ]
+    destino.write_bytes(escrever_pdf(conteudo))
+    return destino
+
+
+def medir(pdf_path: Path, paginas: list, leitura_antecipada: int) -> float:
+    inicio = time.perf_counter()
+    processar_paginas_ocr(pdf_path, paginas, leitura_antecipada=leitura_antecipada)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", help="PDF escaneado (padrão: gera um sintético)")
+    parser.add_argument("--paginas", type=int, default=50, help="Páginas do PDF sintético")
+    parser.add_argument("-k", type=int, default=max(OCR_LEITURA_ANTECIPADA, 1),
+                        help="Páginas renderizadas à frente do OCR")
+    args = parser.parse_args()
+
+    if _obter_ocr_reader() is False:
+        print("RapidOCR não está disponível; instale rapidocr-onnxruntime.", file=sys.stderr)
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.pdf:
+            pdf_path = Path(args.pdf)
+        else:
+            pdf_path = gerar_pdf_escaneado(Path(temp_dir) / "escaneado.pdf", args.paginas)
+
+        paginas = list(range(1, obter_total_paginas(pdf_path) + 1))
+
+        sequencial = medir(pdf_path, paginas, 0)
+        antecipada = medir(pdf_path, paginas, args.k)
+
+    resultado = {
+        "pdf": str(args.pdf or "sintetico"),
+        "paginas": len(paginas),
+        "leitura_antecipada": args.k,
+        "sequencial_s": round(sequencial, 3),
+        "antecipada_s": round(antecipada, 3),
+        "sequencial_paginas_por_s": round(len(paginas) / sequencial, 3),
+        "antecipada_paginas_por_s": round(len(paginas) / antecipada, 3),
+        "ganho": round(sequencial / antecipada, 3),
+    }
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Gerador de corpus sintético de DARFs para os benchmarks.
+
+Produz PDFs com:
+- páginas de texto nativo (escritas diretamente em PDF, fonte Helvetica);
+- páginas "escaneadas" (a página nativa rasterizada, com ruído, leve rotação
+  e desfoque, embutida como JPEG);
+- páginas em branco (separadores);
+- arquivos com várias páginas e com páginas nativas e escaneadas misturadas;
+- as variações de layout da composição tratadas por `extrair_codigo_e_denom`.
+
+Os dados de cada página (valores esperados) são gravados em `corpus.json`,
+junto dos PDFs.
+
+Uso:
+    python -m benchmarks.gerador DESTINO [--arquivos 20] [--escaneados 0.25] [--seed 42]
+"""
+
+import argparse
+import io
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+from app.database.direct import CNPJS_PADRAO
+from app.services.pdf_parser import _dv_modulo11
+
+# Denominações por código (códigos de CODIGOS_PADRAO)
+DENOMINACOES = {
+    "1082": "CP SEGURADOS - CONTRIBUINTE INDIVIDUAL",
+    "1099": "CP SEGURADOS - SERVIDOR PUBLICO",
+    "1138": "CP PATRONAL - EMPREGADOS/AVULSOS (GERAL)",
+    "1646": "CP PATRONAL - GILRAT - RISCOS AMBIENTAIS DO TRABALHO",
+}
+
+RAZOES_SOCIAIS = [
+    "SECRETARIA DE ESTADO DE FAZENDA",
+    "SECRETARIA DE ESTADO DE EDUCACAO",
+    "SECRETARIA DE ESTADO DE SAUDE",
+    "FUNDACAO ESTADUAL DE MEIO AMBIENTE",
+]
+
+# Layouts da tabela "Composição do Documento de Arrecadação"
+LAYOUT_PADRAO = "padrao"                    # código, denominação e valores na mesma linha
+LAYOUT_MULTILINHA = "denominacao_multilinha"  # denominação quebrada em duas linhas
+LAYOUT_TABELA = "tabela"                    # colunas separadas por "|"
+LAYOUT_SEM_COMPOSICAO = "sem_composicao"    # sem o título da composição (busca alternativa)
+LAYOUTS = (LAYOUT_PADRAO, LAYOUT_MULTILINHA, LAYOUT_TABELA, LAYOUT_SEM_COMPOSICAO)
+
+# Páginas A4 em pontos
+LARGURA_PAGINA = 595
+ALTURA_PAGINA = 842
+RESOLUCAO_ESCANEADO_DPI = 200
+
+
+def formatar_valor(centavos: int) -> str:
+    """Formata centavos no padrão brasileiro (ex: 138600 -> "1.386,00")."""
+    inteiro, resto = divmod(centavos, 100)
+    return f"{inteiro:,}".replace(",", ".") + f",{resto:02d}"
+
+
+def gerar_linha_digitavel(centavos: int, vencimento: date, numero_documento: str) -> str:
+    """
+    Monta a linha digitável de arrecadação (48 dígitos com DVs módulo 11).
+
+    O campo livre segue o layout assumido em `decodificar_codigo_barras_darf`:
+    vencimento juliano (ADDD) seguido dos 17 dígitos do número do documento.
+    """
+    addd = f"{vencimento.year % 10}{vencimento.timetuple().tm_yday:03d}"
+    corpo = "858" + "0" + f"{centavos:011d}" + "0385" + addd + numero_documento + "0000"
+    codigo_barras = corpo[:3] + _dv_modulo11(corpo[:3] + corpo[4:]) + corpo[4:]
+    blocos = [codigo_barras[i:i + 11] for i in range(0, 44, 11)]
+    return " ".join(f"{bloco} {_dv_modulo11(bloco)}" for bloco in blocos)
+
+
+def gerar_dados_darf(rng: random.Random) -> dict:
+    """Sorteia os dados de um DARF (valores esperados da extração)."""
+    cnpj, _ = rng.choice(CNPJS_PADRAO)
+    codigo = rng.choice(sorted(DENOMINACOES))
+    centavos = rng.randint(1_000, 50_000_000)
+
+    emissao = date(2025, 1, 1) + timedelta(days=rng.randint(0, 330))
+    vencimento = emissao + timedelta(days=rng.randint(5, 30))
+    periodo = emissao.replace(day=1) - timedelta(days=1)
+
+    # 17 dígitos: órgão (4) + AADDD da emissão (5) + sequencial (7) + DV (1)
+    numero = (
+        f"{rng.randint(1, 99):02d}{rng.randint(1, 99):02d}"
+        f"{emissao.year % 100:02d}{emissao.timetuple().tm_yday:03d}"
+        f"{rng.randint(0, 9_999_999):07d}{rng.randint(0, 9)}"
+    )
+    numero_formatado = f"{numero[:2]}.{numero[2:4]}.{numero[4:9]}.{numero[9:16]}-{numero[16]}"
+
+    return {
+        "cnpj": cnpj,
+        "razao_social": rng.choice(RAZOES_SOCIAIS),
+        "periodo_apuracao": periodo.strftime("%d/%m/%Y"),
+        "data_vencimento": vencimento.strftime("%d/%m/%Y"),
+        "numero_documento": numero_formatado,
+        "valor_total_documento": formatar_valor(centavos),
+        "codigo": codigo,
+        "denominacao": DENOMINACOES[codigo],
+        "linha_digitavel": gerar_linha_digitavel(centavos, vencimento, numero),
+    }
+
+
+def linhas_darf(dados: dict, layout: str = LAYOUT_PADRAO) -> list[str]:
+    """Monta as linhas de texto de uma página de DARF no layout pedido."""
+    valor = dados["valor_total_documento"]
+    linhas = [
+        "Ministério da Fazenda",
+        "Documento de Arrecadação de Receitas Federais",
+        "CNPJ Razão Social",
+        f"{dados['cnpj']} {dados['razao_social']}",
+        "Período de Apuração Data de Vencimento Número do Documento",
+        f"{dados['periodo_apuracao']} {dados['data_vencimento']} {dados['numero_documento']}",
+        "Valor Total do Documento",
+        valor,
+    ]
+
+    codigo, denominacao = dados["codigo"], dados["denominacao"]
+    if layout == LAYOUT_SEM_COMPOSICAO:
+        linhas += [
+            "Código Denominação Principal Multa Juros Total",
+            f"{codigo} {denominacao} {valor} {valor}",
+        ]
+    elif layout == LAYOUT_TABELA:
+        linhas += [
+            "Composição do Documento de Arrecadação",
+            "| Código | Denominação | Principal | Multa | Juros | Total |",
+            f"| {codigo} | {denominacao} | {valor} | | | {valor} |",
+        ]
+    elif layout == LAYOUT_MULTILINHA:
+        palavras = denominacao.split()
+        meio = len(palavras) // 2
+        linhas += [
+            "Composição do Documento de Arrecadação",
+            "Código Denominação Principal Multa Juros Total",
+            f"{codigo} {' '.join(palavras[:meio])}",
+            " ".join(palavras[meio:]),
+            f"{valor} {valor}",
+        ]
+    else:
+        linhas += [
+            "Composição do Documento de Arrecadação",
+            "Código Denominação Principal Multa Juros Total",
+            f"{codigo} {denominacao} {valor} {valor}",
+        ]
+
+    linhas += [f"Totais {valor} {valor}", "", dados["linha_digitavel"]]
+    return linhas
+
+
+def _escapar_texto_pdf(texto: str) -> bytes:
+    dados = texto.encode("cp1252", errors="replace")
+    return dados.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def escrever_pdf(paginas: list[dict]) -> bytes:
+    """
+    Escreve um PDF mínimo.
+
+    Args:
+        paginas: Lista de páginas, cada uma {"linhas": [...]} (texto nativo),
+            {"jpeg": bytes, "largura": px, "altura": px} (imagem) ou {} (em branco)
+
+    Returns:
+        Conteúdo do PDF
+    """
+    objetos: list[bytes] = []
+
+    def adicionar(conteudo: bytes) -> int:
+        objetos.append(conteudo)
+        return len(objetos)
+
+    fonte = adicionar(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    )
+    id_paginas = adicionar(b"")
+    filhos = []
+
+    for pagina in paginas:
+        recursos = b"<< >>"
+        if "linhas" in pagina:
+            comandos = [b"BT /F1 10 Tf 40 800 Td 14 TL"]
+            for linha in pagina["linhas"]:
+                comandos.append(b"(" + _escapar_texto_pdf(linha) + b") Tj T*")
+            comandos.append(b"ET")
+            conteudo = b"\n".join(comandos)
+            recursos = b"<< /Font << /F1 %d 0 R >> >>" % fonte
+        elif "jpeg" in pagina:
+            imagem = adicionar(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+                % (pagina["largura"], pagina["altura"], len(pagina["jpeg"]))
+                + pagina["jpeg"] + b"\nendstream"
+            )
+            conteudo = b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (LARGURA_PAGINA, ALTURA_PAGINA)
+            recursos = b"<< /XObject << /Im0 %d 0 R >> >>" % imagem
+        else:
+            conteudo = b""
+
+        id_conteudo = adicionar(
+            b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream"
+        )
+        filhos.append(adicionar(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>"
+            % (id_paginas, LARGURA_PAGINA, ALTURA_PAGINA, recursos, id_conteudo)
+        ))
+
+    objetos[id_paginas - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % f for f in filhos), len(filhos)
+    )
+    catalogo = adicionar(b"<< /Type /Catalog /Pages %d 0 R >>" % id_paginas)
+
+    saida = bytearray(b"%PDF-1.4\n")
+    deslocamentos = []
+    for numero, objeto in enumerate(objetos, start=1):
+        deslocamentos.append(len(saida))
+        saida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    inicio_xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % d for d in deslocamentos)
+    saida += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objetos) + 1, catalogo, inicio_xref
+    )
+    return bytes(saida)
+
+
+def rasterizar_pagina(linhas: list[str], rng: random.Random) -> dict:
+    """
+    Gera uma página "escaneada": rasteriza o texto e aplica rotação, ruído e desfoque.
+
+    Returns:
+        Página no formato de `escrever_pdf` ({"jpeg", "largura", "altura"})
+    """
+    import pdfplumber
+    from PIL import Image, ImageFilter
+
+    with pdfplumber.open(io.BytesIO(escrever_pdf([{"linhas": linhas}]))) as pdf:
+        imagem = pdf.pages[0].to_image(resolution=RESOLUCAO_ESCANEADO_DPI).original.convert("L")
+
+    imagem = imagem.rotate(rng.uniform(-1.5, 1.5), resample=Image.BICUBIC, fillcolor=255)
+    ruido = Image.effect_noise(imagem.size, rng.uniform(20, 45))
+    imagem = Image.blend(imagem, ruido, 0.12)
+    if rng.random() < 0.5:
+        imagem = imagem.filter(ImageFilter.GaussianBlur(0.6))
+
+    buffer = io.BytesIO()
+    imagem.save(buffer, format="JPEG", quality=rng.randint(60, 85))
+    return {"jpeg": buffer.getvalue(), "largura": imagem.width, "altura": imagem.height}
+
+
+def gerar_corpus(
+    destino: Path,
+    arquivos: int = 20,
+    proporcao_escaneados: float = 0.25,
+    max_paginas: int = 3,
+    seed: int = 42,
+) -> list[dict]:
+    """
+    Gera o corpus sintético em `destino` e grava o manifesto `corpus.json`.
+
+    Cada arquivo tem de 1 a `max_paginas` DARFs. Cerca de `proporcao_escaneados`
+    das páginas são escaneadas; alguns arquivos recebem um separador em branco.
+
+    Returns:
+        Manifesto: lista de {"arquivo", "paginas": [{"pagina", "tipo", "layout", "esperado"}]}
+    """
+    rng = random.Random(seed)
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+
+    manifesto = []
+    for i in range(arquivos):
+        paginas_pdf = []
+        paginas_info = []
+        for _ in range(rng.randint(1, max_paginas)):
+            if paginas_pdf and rng.random() < 0.1:
+                paginas_pdf.append({})
+                paginas_info.append({"pagina": len(paginas_pdf), "tipo": "vazia"})
+
+            dados = gerar_dados_darf(rng)
+            layout = rng.choice(LAYOUTS)
+            linhas = linhas_darf(dados, layout)
+            if rng.random() < proporcao_escaneados:
+                paginas_pdf.append(rasterizar_pagina(linhas, rng))
+                tipo = "escaneada"
+            else:
+                paginas_pdf.append({"linhas": linhas})
+                tipo = "nativa"
+            paginas_info.append({
+                "pagina": len(paginas_pdf), "tipo": tipo, "layout": layout, "esperado": dados,
+            })
+
+        nome = f"darf_{i + 1:04d}.pdf"
+        (destino / nome).write_bytes(escrever_pdf(paginas_pdf))
+        manifesto.append({"arquivo": nome, "paginas": paginas_info})
+
+    (destino / "corpus.json").write_text(
+        json.dumps(manifesto, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    return manifesto
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de DARFs.")
+    parser.add_argument("destino", help="Pasta de saída")
+    parser.add_argument("--arquivos", type=int, default=20)
+    parser.add_argument("--escaneados", type=float, default=0.25, help="Proporção de páginas escaneadas")
+    parser.add_argument("--max-paginas", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    manifesto = gerar_corpus(
+        Path(args.destino), args.arquivos, args.escaneados, args.max_paginas, args.seed
+    )
+    total = sum(len(m["paginas"]) for m in manifesto)
+    print(f"{len(manifesto)} arquivo(s), {total} página(s) gerados em {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Suíte de benchmarks do pipeline de extração.
+
+Mede, sobre um corpus sintético (ver `benchmarks.gerador`) ou uma pasta de PDFs:
+- `processar_pdf`: páginas/s, latência por arquivo e acerto dos campos;
+- `gerar_excel`: latência da geração do XLSX com os registros extraídos;
+- `upload`: a rota `/upload` completa (motor de lote + Excel) via cliente de teste do Flask.
+
+Cada etapa roda em um processo novo, para que o pico de memória (RSS) medido
+seja apenas o daquela etapa. O resultado é gravado em JSON, com o commit atual,
+para comparação entre versões.
+
+Uso:
+    python -m benchmarks.suite [--corpus PASTA] [--arquivos 20] [--escaneados 0.25]
+                               [--etapas processar_pdf,gerar_excel,upload]
+                               [--saida resultado.json] [--comparar anterior.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem getrusage, o pico de memória não é medido
+    resource = None
+
+ETAPAS = ("processar_pdf", "gerar_excel", "upload")
+
+
+def _pico_rss_mb(quem=None) -> float | None:
+    """Pico de memória residente (MB) do processo atual ou dos filhos encerrados."""
+    if resource is None:
+        return None
+    if quem is None:
+        quem = resource.RUSAGE_SELF
+    pico = resource.getrusage(quem).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(pico / divisor, 1)
+
+
+def _resumir_latencias(latencias: list[float]) -> dict:
+    if not latencias:
+        return {}
+    ordenadas = sorted(latencias)
+    return {
+        "media_s": round(statistics.mean(ordenadas), 4),
+        "p50_s": round(ordenadas[len(ordenadas) // 2], 4),
+        "p95_s": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))], 4),
+        "max_s": round(ordenadas[-1], 4),
+    }
+
+
+def _listar_pdfs(corpus: Path) -> list[Path]:
+    return sorted(p for p in corpus.iterdir() if p.suffix.lower() == ".pdf")
+
+
+def _normalizar(campo: str, valor) -> str:
+    valor = (valor or "").strip()
+    if campo == "linha_digitavel":
+        return re.sub(r"\D", "", valor)
+    return valor
+
+
+# ======================================================================
+# ETAPAS (executadas em processos separados)
+# ======================================================================
+
+def _etapa_processar_pdf(corpus: Path, repeticoes: int) -> dict:
+    from app.services.pdf_parser import _obter_ocr_reader, processar_pdf
+
+    # Carrega o OCR fora da medição (custo único por processo)
+    inicio = time.perf_counter()
+    _obter_ocr_reader()
+    carga_ocr = time.perf_counter() - inicio
+
+    manifesto = {}
+    arquivo_manifesto = corpus / "corpus.json"
+    if arquivo_manifesto.exists():
+        manifesto = {
+            m["arquivo"]: [p for p in m["paginas"] if p["tipo"] != "vazia"]
+            for m in json.loads(arquivo_manifesto.read_text(encoding="utf-8"))
+        }
+
+    pdfs = _listar_pdfs(corpus)
+    latencias = []
+    paginas = 0
+    acertos = {}
+    total_s = 0.0
+    for rodada in range(repeticoes):
+        for pdf_path in pdfs:
+            inicio = time.perf_counter()
+            registros = processar_pdf(pdf_path)
+            latencia = time.perf_counter() - inicio
+            latencias.append(latencia)
+            total_s += latencia
+            paginas += len(registros)
+
+            if rodada == 0:
+                for pagina, registro in zip(manifesto.get(pdf_path.name, []), registros):
+                    for campo, esperado in pagina["esperado"].items():
+                        certos, total = acertos.get(campo, (0, 0))
+                        ok = _normalizar(campo, registro.get(campo)) == _normalizar(campo, esperado)
+                        acertos[campo] = (certos + ok, total + 1)
+
+    return {
+        "arquivos": len(pdfs),
+        "paginas": paginas // max(repeticoes, 1),
+        "total_s": round(total_s, 3),
+        "paginas_por_s": round(paginas / total_s, 3) if total_s else None,
+        "latencia_arquivo": _resumir_latencias(latencias),
+        "carga_ocr_s": round(carga_ocr, 3),
+        "acerto_campos": {c: round(certos / total, 3) for c, (certos, total) in sorted(acertos.items())},
+        "pico_rss_mb": _pico_rss_mb(),
+    }
+
+
+def _etapa_gerar_excel(corpus: Path, repeticoes: int) -> dict:
+    from app.services.excel_generator import gerar_excel, separar_registros
+    from app.services.pdf_parser import processar_pdf
+
+    registros = []
+    for pdf_path in _listar_pdfs(corpus):
+        registros.extend(processar_pdf(pdf_path))
+    rss_antes = _pico_rss_mb()
+
+    latencias = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        saida = Path(temp_dir) / "resultado_darfs.xlsx"
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            servidor, patronal, erros = separar_registros(registros)
+            gerar_excel(servidor, patronal, erros, saida)
+            latencias.append(time.perf_counter() - inicio)
+
+    return {
+        "registros": len(registros),
+        "latencia": _resumir_latencias(latencias),
+        "registros_por_s": round(len(registros) / statistics.mean(latencias), 1),
+        "pico_rss_mb_extracao": rss_antes,
+        "pico_rss_mb": _pico_rss_mb(),
+    }
+
+
+def _etapa_upload(corpus: Path, repeticoes: int) -> dict:
+    from app import create_app
+    from app.services.batch_engine import encerrar_executores
+
+    app = create_app()
+    app.config["TESTING"] = True
+    cliente = app.test_client()
+
+    pdfs = _listar_pdfs(corpus)
+    conteudos = [(p.name, p.read_bytes()) for p in pdfs]
+    paginas = None
+    latencias = []
+    try:
+        for _ in range(repeticoes):
+            dados = {"files": [(BytesIO(c), nome) for nome, c in conteudos]}
+            inicio = time.perf_counter()
+            resposta = cliente.post("/upload", data=dados, content_type="multipart/form-data")
+            latencias.append(time.perf_counter() - inicio)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"/upload retornou HTTP {resposta.status_code}")
+    finally:
+        # Encerra os workers para que o pico de memória deles seja contabilizado
+        encerrar_executores()
+
+    if (corpus / "corpus.json").exists():
+        manifesto = json.loads((corpus / "corpus.json").read_text(encoding="utf-8"))
+        paginas = sum(1 for m in manifesto for p in m["paginas"] if p["tipo"] != "vazia")
+
+    media = statistics.mean(latencias)
+    return {
+        "arquivos": len(pdfs),
+        "paginas": paginas,
+        "latencia": _resumir_latencias(latencias),
+        "paginas_por_s": round(paginas / media, 3) if paginas else None,
+        "pico_rss_mb": _pico_rss_mb(),
+        "pico_rss_mb_workers": _pico_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+_FUNCOES_ETAPAS = {
+    "processar_pdf": _etapa_processar_pdf,
+    "gerar_excel": _etapa_gerar_excel,
+    "upload": _etapa_upload,
+}
+
+
+def executar_etapa(etapa: str, corpus: Path, repeticoes: int = 1) -> dict:
+    """Executa uma etapa em um processo novo e retorna suas métricas."""
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+        return executor.submit(_FUNCOES_ETAPAS[etapa], corpus, repeticoes).result()
+
+
+# ======================================================================
+# EXECUÇÃO
+# ======================================================================
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual: dict, anterior: dict) -> list[str]:
+    """Compara as métricas principais de duas execuções (razão atual/anterior)."""
+    linhas = [f"Comparação com {anterior.get('commit')} ({anterior.get('data')}):"]
+    metricas = ("paginas_por_s", "registros_por_s", "total_s", "pico_rss_mb")
+    for etapa, dados in atual["etapas"].items():
+        antes = anterior.get("etapas", {}).get(etapa)
+        if not antes:
+            continue
+        for metrica in metricas:
+            if dados.get(metrica) and antes.get(metrica):
+                razao = dados[metrica] / antes[metrica]
+                linhas.append(f"  {etapa}.{metrica}: {antes[metrica]} -> {dados[metrica]} ({razao:.2f}x)")
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline de extração de DARFs.")
+    parser.add_argument("--corpus", help="Pasta com PDFs (padrão: gera um corpus sintético)")
+    parser.add_argument("--arquivos", type=int, default=20, help="Arquivos do corpus sintético")
+    parser.add_argument("--escaneados", type=float, default=0.25, help="Proporção de páginas escaneadas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help="Etapas separadas por vírgula")
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    args = parser.parse_args()
+
+    etapas = [e.strip() for e in args.etapas.split(",") if e.strip()]
+    invalidas = [e for e in etapas if e not in _FUNCOES_ETAPAS]
+    if invalidas:
+        parser.error(f"Etapas inválidas: {', '.join(invalidas)}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if not os.getenv("DATABASE_URL"):
+            # Banco temporário com as regras padrão (herdado pelos processos das etapas)
+            os.environ["DATABASE_URL"] = f"sqlite:///{Path(temp_dir) / 'config.db'}"
+            from app.database.db_session import init_database
+            from app.database.direct import init_db_data
+            init_database()
+            init_db_data()
+
+        if args.corpus:
+            corpus = Path(args.corpus)
+        else:
+            from benchmarks.gerador import gerar_corpus
+            corpus = Path(temp_dir) / "corpus"
+            print(f"Gerando corpus sintético ({args.arquivos} arquivos)...", file=sys.stderr)
+            gerar_corpus(corpus, args.arquivos, args.escaneados, seed=args.seed)
+
+        resultado = {
+            "commit": _commit_atual(),
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "corpus": str(args.corpus or f"sintetico(arquivos={args.arquivos}, "
+                                         f"escaneados={args.escaneados}, seed={args.seed})"),
+            "etapas": {},
+        }
+        for etapa in etapas:
+            print(f"Executando {etapa}...", file=sys.stderr)
+            resultado["etapas"][etapa] = executar_etapa(etapa, corpus, args.repeticoes)
+
+    saida = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(saida, encoding="utf-8")
+    else:
+        print(saida)
+
+    if args.comparar:
+        anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8"))
+        print("\n".join(comparar(resultado, anterior)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Configuração do gunicorn (carregada automaticamente a partir da raiz do projeto).
+
+Prepara o diretório das métricas Prometheus compartilhado entre os workers
+(ver app/utils/metricas.py). Precisa ser definido no processo mestre, antes
+dos workers serem criados, para que /metrics some as métricas de todos eles.
+
+Também liga o controle de memória dos workers (ver app/utils/memoria.py): o
+RSS é medido após cada requisição e, acima de WORKER_RSS_MAXIMO_MB, o worker
+é encerrado de forma graciosa e substituído pelo mestre.
+"""
+
+import os
+import shutil
+import signal
+import tempfile
+
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="darf_metricas_")
+
+
+def on_starting(server):
+    """Esvazia o diretório de métricas (descarta valores de execuções anteriores)."""
+    diretorio = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    if os.path.isdir(diretorio):
+        shutil.rmtree(diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """Aposentadoria por memória: o worker se envia o SIGTERM do encerramento gracioso."""
+    from app.utils.memoria import definir_aposentadoria
+
+    definir_aposentadoria(lambda: os.kill(os.getpid(), signal.SIGTERM))
+
+
+def post_request(worker, req, environ, resp):
+    """Mede o RSS do worker após cada requisição."""
+    from app.utils.memoria import verificar_memoria
+
+    verificar_memoria("requisicao")
+
+
+def child_exit(server, worker):
+    """Descarta as métricas "live*" do worker encerrado (ex: RSS)."""
+    # Importa só o prometheus_client: importar o pacote `app` criaria a aplicação no mestre
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
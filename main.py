@@ -6,6 +6,7 @@ Inicializa o banco de dados e inicia a interface gráfica.
 
 import sys
 import os
+import multiprocessing
 from pathlib import Path
 
 # Adiciona o diretório do script ao path (importante para PyInstaller)
@@ -90,5 +91,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necessário para os processos do motor de lote no executável (PyInstaller)
+    multiprocessing.freeze_support()
     main()
 
@@ -9,6 +9,7 @@ Quando a janela for fechada, o processo é encerrado completamente.
 
 import sys
 import os
+import multiprocessing
 import socket
 import threading
 import time
@@ -133,5 +134,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necessário para os processos do motor de lote no executável (PyInstaller)
+    multiprocessing.freeze_support()
     main()
 
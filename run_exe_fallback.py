@@ -9,6 +9,7 @@ Use este arquivo se pywebview não puder ser instalado.
 
 import sys
 import os
+import multiprocessing
 import socket
 import threading
 import time
@@ -134,5 +135,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necessário para os processos do motor de lote no executável (PyInstaller)
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,40 @@
+"""
+Configuração dos testes.
+
+As variáveis de ambiente são definidas antes de qualquer import de `app`
+(Config lê o ambiente no import): banco SQLite, área temporária e armazém de
+resultados ficam numa pasta temporária própria da execução.
+"""
+
+import os
+import random
+import tempfile
+from pathlib import Path
+
+_PASTA = Path(tempfile.mkdtemp(prefix="darf-testes-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_PASTA / 'config.db'}")
+os.environ.setdefault("AREA_TEMPORARIA_DIRETORIO", str(_PASTA / "area_temporaria"))
+os.environ.setdefault("ARTEFATOS_DIRETORIO", str(_PASTA / "artefatos"))
+
+import pytest  # noqa: E402
+
+from benchmarks.gerador import escrever_pdf, gerar_dados_darf, linhas_darf  # noqa: E402
+
+
+@pytest.fixture
+def gerar_pdf(tmp_path):
+    """
+    Gera um PDF com DARFs de texto nativo (ver benchmarks/gerador.py).
+
+    Uso:
+        caminho, esperados = gerar_pdf("a.pdf", paginas=3)
+    """
+    rng = random.Random(7)
+
+    def gerar(nome: str = "darf.pdf", paginas: int = 1):
+        esperados = [gerar_dados_darf(rng) for _ in range(paginas)]
+        caminho = tmp_path / nome
+        caminho.write_bytes(escrever_pdf([{"linhas": linhas_darf(dados)} for dados in esperados]))
+        return caminho, esperados
+
+    return gerar
@@ -0,0 +1,115 @@
+"""Armazém de resultados: trava de envios idênticos e retenção (app.services.artefatos)."""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services.artefatos import ArmazemArtefatos, chave_artefato
+
+CHAVE = chave_artefato("json", [("a.pdf", "0" * 64)])
+OUTRA_CHAVE = chave_artefato("json", [("b.pdf", "0" * 64)])
+
+
+@pytest.fixture
+def armazem(tmp_path):
+    return ArmazemArtefatos(tmp_path / "artefatos", cota_bytes=10 * 1024 * 1024, cota_arquivos=100, idade_maxima_s=60)
+
+
+def _pid_encerrado() -> int:
+    processo = subprocess.Popen([sys.executable, "-c", "pass"])
+    processo.wait()
+    return processo.pid
+
+
+def _gerar(conteudo: bytes = b"{}", completo: bool = True):
+    chamadas = []
+
+    def gerar(destino):
+        chamadas.append(destino)
+        destino.write_bytes(conteudo)
+        return completo
+
+    return gerar, chamadas
+
+
+def test_trava_de_processo_vivo_impede_outro_processamento(armazem):
+    assert armazem.travar(CHAVE)
+    assert not armazem.travar(CHAVE)
+    assert armazem.travar(OUTRA_CHAVE)
+    armazem.liberar(CHAVE)
+    assert armazem.travar(CHAVE)
+
+
+def test_trava_de_processo_encerrado_e_assumida(armazem):
+    armazem.travas.mkdir(parents=True)
+    (armazem.travas / f"{CHAVE}.trava").write_text(str(_pid_encerrado()))
+    # Quem aguardava o envio idêntico desiste (nada publicado) ...
+    assert armazem.aguardar(CHAVE) is None
+    # ... e assume o processamento
+    assert armazem.travar(CHAVE)
+    assert (armazem.travas / f"{CHAVE}.trava").read_text() == str(os.getpid())
+
+
+def test_obter_reaproveita_o_resultado(armazem):
+    gerar, chamadas = _gerar(b'{"registros": []}')
+    caminho, gerado = armazem.obter(CHAVE, "json", gerar)
+    assert gerado and caminho.stem == CHAVE
+    assert not (armazem.travas / f"{CHAVE}.trava").exists()
+
+    caminho_de_novo, gerado = armazem.obter(CHAVE, "json", gerar)
+    assert not gerado and caminho_de_novo == caminho
+    assert len(chamadas) == 1
+    assert caminho.read_bytes() == b'{"registros": []}'
+
+
+def test_lote_com_falhas_recebe_chave_avulsa(armazem):
+    gerar, chamadas = _gerar(completo=False)
+    caminho, gerado = armazem.obter(CHAVE, "json", gerar)
+    assert gerado and caminho.stem != CHAVE
+    assert armazem.buscar(CHAVE) is None
+    assert armazem.buscar(caminho.stem) == caminho
+
+    # Envio idêntico processa de novo
+    armazem.obter(CHAVE, "json", gerar)
+    assert len(chamadas) == 2
+
+
+def test_resultado_expirado_e_apagado(armazem):
+    caminho = armazem.publicar(CHAVE, "json", _gerar()[0])
+    antigo = time.time() - 120
+    os.utime(caminho, (antigo, antigo))
+    armazem.area.coletar()
+    assert armazem.buscar(CHAVE) is None
+    assert not caminho.exists()
+
+
+def test_acesso_renova_o_resultado(armazem):
+    caminho = armazem.publicar(CHAVE, "json", _gerar()[0])
+    antigo = time.time() - 120
+    os.utime(caminho, (antigo, antigo))
+    assert armazem.buscar(CHAVE, renovar=False) == caminho
+    assert caminho.stat().st_mtime == pytest.approx(antigo)
+    assert armazem.buscar(CHAVE) == caminho
+    armazem.area.coletar()
+    assert armazem.buscar(CHAVE) == caminho
+
+
+def test_cota_apaga_o_acessado_ha_mais_tempo(tmp_path):
+    armazem = ArmazemArtefatos(tmp_path / "artefatos", cota_bytes=10 * 1024 * 1024, cota_arquivos=2, idade_maxima_s=0)
+    chaves = [chave_artefato("json", [(f"{i}.pdf", "0" * 64)]) for i in range(3)]
+    primeiro = armazem.publicar(chaves[0], "json", _gerar()[0])
+    segundo = armazem.publicar(chaves[1], "json", _gerar()[0])
+    os.utime(primeiro, (time.time() - 20,) * 2)
+    os.utime(segundo, (time.time() - 10,) * 2)
+    armazem.publicar(chaves[2], "json", _gerar()[0])
+    assert armazem.buscar(chaves[0]) is None
+    assert armazem.buscar(chaves[1]) == segundo
+    assert armazem.buscar(chaves[2]) is not None
+
+
+@pytest.mark.parametrize("chave", ["", "../x", "A" * 64, CHAVE[:-1]])
+def test_chave_invalida(armazem, chave):
+    assert armazem.buscar(chave) is None
@@ -0,0 +1,148 @@
+"""Falhas isoladas por página e limites de tempo no lote (app.services.batch_engine)."""
+
+import time
+
+import pytest
+
+from app.config import Config
+from app.services import batch_engine
+from app.services.batch_engine import encerrar_executores, processar_lote
+
+CAMPOS = ["valor_total_documento"]
+
+
+@pytest.fixture
+def executor_sincrono(monkeypatch):
+    """Tarefas do lote na thread do teste (workers = 0)."""
+    monkeypatch.setattr(Config, "LOTE_WORKERS_NATIVOS", 0)
+    monkeypatch.setattr(Config, "LOTE_WORKERS_OCR", 0)
+    encerrar_executores()
+    yield
+    encerrar_executores()
+
+
+@pytest.fixture
+def executor_processos():
+    """Executores novos, com workers de verdade (os limites de tempo encerram processos)."""
+    encerrar_executores()
+    yield
+    encerrar_executores()
+
+
+def _nativas_travando_na_pagina_2(pdf_path, classificacao, campos):
+    """Extração nativa que trava na página 2 de um bloco (roda no worker; por isso fica no módulo)."""
+    paginas = [info["pagina"] for info in classificacao]
+
+    def registros():
+        for info, registro in zip(classificacao, batch_engine.iterar_paginas_pdf(pdf_path, campos, classificacao)):
+            if info["pagina"] == 2 and len(paginas) > 1:
+                time.sleep(60)
+            yield registro
+
+    return batch_engine._consumir_bloco(paginas, registros())
+
+
+class _Extracao:
+    def __init__(self):
+        self.blocos = []
+        self.sempre = False
+
+
+@pytest.fixture
+def extracao_nativa(monkeypatch):
+    """
+    Troca a extração nativa por uma que falha na página 2 quando ela vem num
+    bloco (sozinha também, com `sempre = True`). `blocos` guarda as páginas
+    de cada bloco enviado.
+    """
+    extracao = _Extracao()
+    iterar = batch_engine.iterar_paginas_pdf
+
+    def iterar_falhando(pdf_path, campos, classificacao):
+        paginas = [info["pagina"] for info in classificacao]
+        for info, registro in zip(classificacao, iterar(pdf_path, campos, classificacao)):
+            if info["pagina"] == 2 and (len(paginas) > 1 or extracao.sempre):
+                raise ValueError("camada de texto corrompida")
+            yield registro
+
+    def processar(pdf_path, classificacao, campos):
+        paginas = [info["pagina"] for info in classificacao]
+        extracao.blocos.append(paginas)
+        return batch_engine._consumir_bloco(paginas, iterar_falhando(pdf_path, campos, classificacao))
+
+    monkeypatch.setattr(batch_engine, "_processar_paginas_nativas", processar)
+    return extracao
+
+
+def _valores(registros):
+    return [r["valor_total_documento"] for r in registros]
+
+
+def test_pagina_do_bloco_e_tentada_de_novo_sozinha(gerar_pdf, executor_sincrono, extracao_nativa):
+    pdf, esperados = gerar_pdf(paginas=3)
+    finalizados = []
+
+    registros = processar_lote(
+        [pdf], CAMPOS, ao_finalizar_arquivo=lambda pdf_path, regs, erro: finalizados.append(erro),
+    )
+
+    # A página 1 não é extraída de novo; a 2 é repetida sozinha e a 3 volta para a fila
+    assert sorted(extracao_nativa.blocos) == [[1, 2, 3], [2], [3]]
+    assert _valores(registros) == [d["valor_total_documento"] for d in esperados]
+    assert all(r["valor_total_documento_erro"] is None for r in registros)
+    assert finalizados == [None]
+
+
+def test_pagina_que_falha_de_novo_vira_erro(gerar_pdf, executor_sincrono, extracao_nativa, monkeypatch):
+    monkeypatch.setattr(Config, "LOTE_REPETIR_PAGINA_COM_ERRO", False)
+    extracao_nativa.sempre = True
+    pdf, esperados = gerar_pdf(paginas=3)
+    finalizados = []
+
+    registros = processar_lote(
+        [pdf], CAMPOS, ao_finalizar_arquivo=lambda pdf_path, regs, erro: finalizados.append(erro),
+    )
+
+    assert [r["arquivo"] for r in registros] == [f"darf.pdf - Página {p}" for p in (1, 2, 3)]
+    assert registros[0]["valor_total_documento"] == esperados[0]["valor_total_documento"]
+    assert registros[2]["valor_total_documento"] == esperados[2]["valor_total_documento"]
+    assert "camada de texto corrompida" in registros[1]["valor_total_documento_erro"]
+    # O arquivo com página de erro é sinalizado (resultado não reaproveitável)
+    assert finalizados == ["Erro em 1 página(s): [2]"]
+
+
+def test_pagina_que_passa_do_tempo_vira_erro(gerar_pdf, executor_processos, monkeypatch):
+    monkeypatch.setattr(Config, "LOTE_TEMPO_MAXIMO_PAGINA_S", 2)
+    monkeypatch.setattr(batch_engine, "_processar_paginas_nativas", _nativas_travando_na_pagina_2)
+    pdf, esperados = gerar_pdf(paginas=3)
+    finalizados = []
+
+    inicio = time.monotonic()
+    registros = processar_lote(
+        [pdf], CAMPOS, ao_finalizar_arquivo=lambda pdf_path, regs, erro: finalizados.append(erro),
+    )
+
+    assert time.monotonic() - inicio < 30
+    # Só a página travada vira erro; a 1 (perdida com o processo) e a 3 voltam para a fila
+    assert registros[0]["valor_total_documento"] == esperados[0]["valor_total_documento"]
+    assert registros[1]["valor_total_documento_erro"] == "Tempo limite excedido (2 s)"
+    assert registros[2]["valor_total_documento"] == esperados[2]["valor_total_documento"]
+    assert finalizados == ["Erro em 1 página(s): [2]"]
+    assert not batch_engine._inicios_tarefas
+
+
+def test_prazo_do_lote_encerra_tarefas_pendentes(gerar_pdf, executor_processos, monkeypatch):
+    monkeypatch.setattr(batch_engine, "_processar_paginas_nativas", _nativas_travando_na_pagina_2)
+    pdf, _ = gerar_pdf(paginas=3)
+    finalizados = []
+
+    inicio = time.monotonic()
+    registros = processar_lote(
+        [pdf], CAMPOS, tempo_maximo_s=8,
+        ao_finalizar_arquivo=lambda pdf_path, regs, erro: finalizados.append(erro),
+    )
+
+    assert time.monotonic() - inicio < 30
+    assert [r["valor_total_documento_erro"] for r in registros] == ["Prazo do lote esgotado (8 s)"] * 3
+    assert finalizados == ["Erro em 3 página(s): [1, 2, 3]"]
+    assert not batch_engine._inicios_tarefas
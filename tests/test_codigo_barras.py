@@ -0,0 +1,121 @@
+"""Linha digitável: DVs, data juliana e conferência com o texto (app.services.pdf_parser)."""
+
+import random
+from datetime import datetime
+
+import pytest
+
+from app.services import pdf_parser
+from app.services.pdf_parser import (
+    _decodificar_data_juliana,
+    _dv_modulo10,
+    _dv_modulo11,
+    conferir_codigo_barras,
+    decodificar_codigo_barras_darf,
+    extrair_campos_texto,
+    linha_digitavel_para_codigo_barras,
+)
+from benchmarks.gerador import gerar_dados_darf, linhas_darf
+
+# Linha digitável de um DARF com identificador de valor 8 (módulo 11)
+LINHA = "85870004976 5 56110385515 0 32918251411 8 71958380000 4"
+CODIGO_BARRAS = "85870004976" "56110385515" "32918251411" "71958380000"
+
+
+def test_dv_modulo10_exemplo_febraban():
+    # Pesos 2,1 da direita para a esquerda, somando os dígitos dos produtos: 37 → DV 3
+    assert _dv_modulo10("01230067896") == "3"
+
+
+@pytest.mark.parametrize("digitos, dv", [
+    ("01230067896", "0"),  # soma 176, resto 0
+    ("0000000001", "9"),   # soma 2, resto 2 → 11 - 2
+    ("0000000005", "1"),   # soma 10, resto 10 → 11 - 10
+    ("0000000000", "0"),
+])
+def test_dv_modulo11(digitos, dv):
+    assert _dv_modulo11(digitos) == dv
+
+
+def test_linha_digitavel_valida():
+    assert linha_digitavel_para_codigo_barras(LINHA) == CODIGO_BARRAS
+    assert linha_digitavel_para_codigo_barras(LINHA.replace(" ", "")) == CODIGO_BARRAS
+
+
+def test_linha_digitavel_com_dv_de_bloco_errado():
+    digitos = LINHA.replace(" ", "")
+    # Um dígito trocado no segundo bloco
+    alterada = digitos[:14] + str((int(digitos[14]) + 1) % 10) + digitos[15:]
+    assert linha_digitavel_para_codigo_barras(alterada) is None
+
+
+def test_linha_digitavel_com_dv_geral_errado():
+    # DVs dos blocos recalculados, mas o DV geral (posição 4) não confere
+    codigo = CODIGO_BARRAS[:3] + str((int(CODIGO_BARRAS[3]) + 1) % 10) + CODIGO_BARRAS[4:]
+    blocos = [codigo[i:i + 11] for i in range(0, 44, 11)]
+    linha = "".join(bloco + _dv_modulo11(bloco) for bloco in blocos)
+    assert linha_digitavel_para_codigo_barras(linha) is None
+
+
+@pytest.mark.parametrize("linha", ["", "1234", "9" * 48, "84" + "0" * 46])
+def test_linha_digitavel_invalida(linha):
+    assert linha_digitavel_para_codigo_barras(linha) is None
+
+
+def test_valor_do_codigo_de_barras():
+    assert decodificar_codigo_barras_darf(LINHA)["valor_total_documento"] == "497.656,11"
+
+
+@pytest.mark.parametrize("addd, referencia, esperado", [
+    ("5032", datetime(2025, 1, 20), "01/02/2025"),
+    ("4366", datetime(2024, 6, 1), "31/12/2024"),  # ano bissexto
+    ("9360", datetime(2030, 1, 2), "26/12/2029"),  # ano mais próximo da referência
+    ("5366", datetime(2025, 6, 1), None),          # dia 366 em ano comum
+    ("5000", datetime(2025, 6, 1), None),
+    ("0200", datetime(2025, 1, 1), None),          # mais de um ano da referência
+    ("50x2", datetime(2025, 1, 1), None),
+])
+def test_data_juliana(addd, referencia, esperado):
+    assert _decodificar_data_juliana(addd, referencia) == esperado
+
+
+def test_conferir_codigo_barras():
+    assert conferir_codigo_barras(None, "não encontrado", "1,00") == ("1,00", None)
+    assert conferir_codigo_barras("1,00", None, "1,00") == ("1,00", None)
+    assert conferir_codigo_barras("1,00", None, None) == ("1,00", None)
+    valor, erro = conferir_codigo_barras("2,00", None, "1,00")
+    assert valor == "2,00" and "Divergente do código de barras (1,00)" in erro
+
+
+def _texto_darf(semente: int = 3):
+    dados = gerar_dados_darf(random.Random(semente))
+    return dados, "\n".join(linhas_darf(dados))
+
+
+def test_valor_divergente_mantem_o_texto():
+    dados, texto = _texto_darf()
+    valor = dados["valor_total_documento"]
+    alterado = valor[:-1] + str((int(valor[-1]) + 1) % 10)
+    # Só o valor da página muda (a linha digitável continua com o original)
+    texto = texto.replace(valor, alterado)
+    registro = extrair_campos_texto("x.pdf - Página 1", texto, ["linha_digitavel", "valor_total_documento"])
+    assert registro["valor_total_documento"] == alterado
+    assert "Divergente do código de barras" in registro["valor_total_documento_erro"]
+
+
+def test_valor_ausente_no_texto_vem_do_codigo_de_barras():
+    dados, texto = _texto_darf()
+    texto = texto.replace(dados["valor_total_documento"], "")
+    registro = extrair_campos_texto("x.pdf - Página 1", texto, ["valor_total_documento"])
+    assert registro["valor_total_documento"] == dados["valor_total_documento"]
+    assert registro["valor_total_documento_erro"] is None
+
+
+def test_campo_livre_so_com_configuracao(monkeypatch):
+    dados, texto = _texto_darf()
+    texto = texto.replace(dados["numero_documento"], "")
+    campos = ["numero_documento"]
+    monkeypatch.setattr(pdf_parser, "CODIGO_BARRAS_CAMPO_LIVRE", False)
+    assert extrair_campos_texto("x.pdf - Página 1", texto, campos)["numero_documento"] is None
+    monkeypatch.setattr(pdf_parser, "CODIGO_BARRAS_CAMPO_LIVRE", True)
+    assert extrair_campos_texto("x.pdf - Página 1", texto, campos)["numero_documento"] == dados["numero_documento"]
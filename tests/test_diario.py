@@ -0,0 +1,109 @@
+"""Diário do lote: retomada após a queda do processo (app.services.diario)."""
+
+import pytest
+
+from app.config import Config
+from app.services import batch_engine
+from app.services.batch_engine import encerrar_executores, processar_lote
+from app.services.diario import DiarioLote
+from app.services.pdf_parser import classificar_paginas_pdf, criar_registro
+
+CAMPOS = ["valor_total_documento"]
+
+
+@pytest.fixture
+def executor_sincrono(monkeypatch):
+    """Tarefas do lote na thread do teste (workers = 0)."""
+    monkeypatch.setattr(Config, "LOTE_WORKERS_NATIVOS", 0)
+    monkeypatch.setattr(Config, "LOTE_WORKERS_OCR", 0)
+    encerrar_executores()
+    yield
+    encerrar_executores()
+
+
+def _gravar_diario(caminho, pdf, classificacao, paginas):
+    diario = DiarioLote(caminho, CAMPOS)
+    diario.abrir()
+    diario.registrar_classificacao(pdf, classificacao)
+    registros = [criar_registro(f"{pdf.name} - Página {p}", CAMPOS) for p in paginas]
+    diario.registrar_paginas(pdf, paginas, registros)
+    diario.fechar()
+
+
+def test_retoma_com_ultima_linha_cortada(tmp_path, gerar_pdf):
+    pdf, _ = gerar_pdf(paginas=3)
+    classificacao = classificar_paginas_pdf(pdf)
+    caminho = tmp_path / "lote.diario.jsonl"
+    _gravar_diario(caminho, pdf, classificacao, [1, 2])
+    # Queda no meio da gravação da página 2
+    conteudo = caminho.read_bytes()
+    caminho.write_bytes(conteudo[:-15])
+
+    diario = DiarioLote(caminho, CAMPOS)
+    assert diario.abrir() == 1
+    retomado_classificacao, registros = diario.retomar(pdf)
+    assert retomado_classificacao == classificacao
+    assert list(registros) == [1]
+
+    # A próxima linha começa depois da cortada, e o diário continua legível
+    diario.registrar_paginas(pdf, [2], [criar_registro(f"{pdf.name} - Página 2", CAMPOS)])
+    diario.fechar()
+    diario = DiarioLote(caminho, CAMPOS)
+    assert diario.abrir() == 2
+    diario.fechar()
+
+
+def test_diario_de_outros_campos_e_descartado(tmp_path, gerar_pdf):
+    pdf, _ = gerar_pdf(paginas=2)
+    caminho = tmp_path / "lote.diario.jsonl"
+    _gravar_diario(caminho, pdf, classificar_paginas_pdf(pdf), [1])
+
+    diario = DiarioLote(caminho, ["codigo"])
+    assert diario.abrir() == 0
+    assert diario.retomar(pdf) is None
+    diario.fechar()
+
+
+def test_pdf_alterado_nao_e_retomado(tmp_path, gerar_pdf):
+    pdf, _ = gerar_pdf(paginas=2)
+    caminho = tmp_path / "lote.diario.jsonl"
+    _gravar_diario(caminho, pdf, classificar_paginas_pdf(pdf), [1])
+    pdf.write_bytes(pdf.read_bytes() + b"\n")
+
+    diario = DiarioLote(caminho, CAMPOS)
+    diario.abrir()
+    assert diario.retomar(pdf) is None
+    diario.fechar()
+
+
+def test_lote_nao_reprocessa_paginas_do_diario(tmp_path, gerar_pdf, executor_sincrono, monkeypatch):
+    pdf, esperados = gerar_pdf(paginas=3)
+    caminho = tmp_path / "lote.diario.jsonl"
+    diario = DiarioLote(caminho, CAMPOS)
+    diario.abrir()
+    try:
+        registros = processar_lote([pdf], CAMPOS, diario=diario)
+    finally:
+        diario.fechar()
+    # Queda depois da página 3 começar a ser gravada
+    linhas = caminho.read_bytes().splitlines(keepends=True)
+    caminho.write_bytes(b"".join(linhas[:-1]) + linhas[-1][:10])
+
+    processadas = []
+    iterar = batch_engine.iterar_paginas_pdf
+
+    def iterar_registrando(pdf_path, campos, classificacao):
+        processadas.extend(info["pagina"] for info in classificacao)
+        return iterar(pdf_path, campos, classificacao)
+
+    monkeypatch.setattr(batch_engine, "iterar_paginas_pdf", iterar_registrando)
+    diario = DiarioLote(caminho, CAMPOS)
+    diario.abrir()
+    try:
+        retomados = processar_lote([pdf], CAMPOS, diario=diario)
+    finally:
+        diario.fechar()
+
+    assert processadas == [3]
+    assert [dict(r) for r in retomados] == [dict(r) for r in registros]
+    assert [r["valor_total_documento"] for r in retomados] == [d["valor_total_documento"] for d in esperados]
@@ -0,0 +1,84 @@
+"""Upload em partes: montagem e progresso após uma queda (app.services.envio_partes)."""
+
+import io
+import os
+
+import pytest
+
+from app.services import envio_partes
+from app.services.envio_partes import PROCESSANDO, ErroEnvio, SessaoEnvio, _gravar_json
+
+DADOS = os.urandom(10_000)
+PARTE = 3_000
+
+
+class Queda(Exception):
+    """Processo interrompido no meio da montagem."""
+
+
+def _sessao(offsets=range(0, len(DADOS), PARTE), tamanho_parte=PARTE):
+    sessao = SessaoEnvio.criar([{"nome": "lote.pdf", "tamanho": len(DADOS)}])
+    for offset in offsets:
+        parte = DADOS[offset:offset + tamanho_parte]
+        sessao.receber_parte(0, offset, io.BytesIO(parte), len(parte))
+    return sessao
+
+
+def _partes(sessao):
+    return sorted((sessao.pasta / "arquivo-0").glob("*.parte"), key=lambda p: int(p.stem))
+
+
+def test_montagem_interrompida_mantem_as_partes(monkeypatch):
+    sessao = _sessao()
+    copiar = envio_partes.shutil.copyfileobj
+    copias = []
+
+    def copiar_e_cair(entrada, saida, tamanho):
+        copias.append(entrada)
+        if len(copias) == 3:
+            raise Queda()
+        copiar(entrada, saida, tamanho)
+
+    monkeypatch.setattr(envio_partes.shutil, "copyfileobj", copiar_e_cair)
+    with pytest.raises(Queda):
+        sessao._montar(0)
+    monkeypatch.setattr(envio_partes.shutil, "copyfileobj", copiar)
+
+    pasta = sessao.pasta / "arquivo-0"
+    assert len(_partes(sessao)) == 4
+    assert not (pasta / "lote.pdf").exists()
+    assert not list(pasta.glob("*.montando"))
+    assert sessao.progresso_arquivo(0)["recebido"] == len(DADOS)
+
+    # A nova finalização monta de novo a partir de todas as partes
+    montado = sessao._montar(0)
+    assert montado.read_bytes() == DADOS
+    assert _partes(sessao) == []
+    assert sessao.progresso_arquivo(0)["faixas"] == [[0, len(DADOS)]]
+    assert sessao._montar(0) == montado
+
+
+def test_partes_sobrepostas():
+    sessao = _sessao(offsets=[0, 2_000, 5_000, 7_000], tamanho_parte=PARTE + 1)
+    assert sessao.progresso_arquivo(0)["faixas"] == [[0, len(DADOS)]]
+    assert sessao._montar(0).read_bytes() == DADOS
+
+
+def test_progresso_vem_do_disco_e_nao_do_estado():
+    # Sessão marcada em processamento por um processo que morreu, com uma parte faltando
+    sessao = _sessao(offsets=[0, 6_000, 9_000])
+    _gravar_json(sessao.pasta / "estado.json", {"status": PROCESSANDO, "pid": 0})
+    progresso = sessao.progresso_arquivo(0)
+    assert progresso["faixas"] == [[0, 3_000], [6_000, len(DADOS)]]
+    with pytest.raises(ErroEnvio, match="incompleto"):
+        sessao.finalizar()
+
+
+def test_montagem_com_lacuna_falha_sem_arquivo_montado():
+    sessao = _sessao(offsets=[0, 6_000, 9_000])
+    with pytest.raises(ErroEnvio, match="incompleto"):
+        sessao._montar(0)
+    pasta = sessao.pasta / "arquivo-0"
+    assert not (pasta / "lote.pdf").exists()
+    assert not list(pasta.glob("*.montando"))
+    assert len(_partes(sessao)) == 3